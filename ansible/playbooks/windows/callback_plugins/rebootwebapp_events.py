@@ -0,0 +1,88 @@
+# Callback de salida para RebootWebApp
+# Emite un evento JSON por línea a medida que avanza la ejecución, para que la
+# aplicación muestre el resultado de cada servicio apenas termina.
+#
+# Eventos:
+#   {"event": "task_start", "task": ...}
+#   {"event": "host_start", "host": ..., "task": ...}
+#   {"event": "item", "host": ..., "task": ..., "item": ..., "status": "ok|failed|skipped", "result": {...}}
+#   {"event": "host_result", "host": ..., "task": ..., "status": "ok|failed|unreachable|skipped", "result": {...}}
+#   {"event": "stats", "stats": {host: {"ok": n, "failures": n, "unreachable": n, ...}}}
+
+from __future__ import annotations
+
+DOCUMENTATION = '''
+    name: rebootwebapp_events
+    type: stdout
+    short_description: Eventos JSON por línea para RebootWebApp
+    description:
+        - Emite un objeto JSON por línea por cada inicio de tarea, inicio de
+          tarea en cada host, ítem de loop, resultado por host y las
+          estadísticas finales.
+'''
+
+import json
+
+from ansible.plugins.callback import CallbackBase
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'stdout'
+    CALLBACK_NAME = 'rebootwebapp_events'
+
+    def _emit(self, event, **fields):
+        fields['event'] = event
+        self._display.display(json.dumps(fields, default=str))
+
+    @staticmethod
+    def _clean(result):
+        data = dict(result._result)
+        data.pop('invocation', None)
+        if 'results' in data:
+            data['results'] = [
+                {k: v for k, v in item.items() if k != 'invocation'} if isinstance(item, dict) else item
+                for item in data['results']
+            ]
+        return data
+
+    def _host_result(self, result, status):
+        self._emit('host_result', host=result._host.get_name(), task=result._task.get_name(),
+                   status=status, result=self._clean(result))
+
+    def _item(self, result, status):
+        self._emit('item', host=result._host.get_name(), task=result._task.get_name(),
+                   item=result._result.get('item'), status=status, result=self._clean(result))
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._emit('task_start', task=task.get_name())
+
+    def v2_runner_on_start(self, host, task):
+        # Cuando un fork toma el host: las duraciones por host se miden desde
+        # acá y no incluyen la espera por un fork libre
+        self._emit('host_start', host=host.get_name(), task=task.get_name())
+
+    def v2_runner_item_on_ok(self, result):
+        self._item(result, 'ok')
+
+    def v2_runner_item_on_failed(self, result):
+        self._item(result, 'failed')
+
+    def v2_runner_item_on_skipped(self, result):
+        self._item(result, 'skipped')
+
+    def v2_runner_on_ok(self, result):
+        self._host_result(result, 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._host_result(result, 'failed')
+
+    def v2_runner_on_unreachable(self, result):
+        self._host_result(result, 'unreachable')
+
+    def v2_runner_on_skipped(self, result):
+        self._host_result(result, 'skipped')
+
+    def v2_playbook_on_stats(self, stats):
+        self._emit('stats', stats={host: stats.summarize(host) for host in sorted(stats.processed)})
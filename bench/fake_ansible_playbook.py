@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# bench/fake_ansible_playbook.py
+# Reemplazo de ansible-playbook para el benchmark de RebootWebApp
+#
+# Acepta los mismos argumentos que usa la aplicación (playbook, -i, -e, -f) y
+# emite los eventos del callback rebootwebapp_events sin conectarse a ningún
+# servidor. Cada host se "procesa" en un pool de tamaño -f, con la latencia y
+# las tasas de fallo definidas por variables de entorno:
+#
+#   BENCH_LATENCY           segundos por host (estado) o por servicio (reinicio)
+#   BENCH_JITTER            variación relativa de la latencia (0.25 = ±25%)
+#   BENCH_FAIL_RATE         proporción de servicios que no reinician (quedan detenidos)
+#   BENCH_UNREACHABLE_RATE  proporción de hosts inalcanzables
+#   BENCH_TIMEOUT_RATE      proporción de hosts que no responden (cuelgan)
+#   BENCH_HANG_SECONDS      duración de un host colgado
+#   BENCH_HANG_HOSTS        hosts (separados por coma) que siempre cuelgan
+#   BENCH_FAIL_HOSTS        hosts cuyos servicios nunca reinician
+#   BENCH_SEED              semilla; el mismo host tiene siempre el mismo destino
+#   BENCH_RUNS_LOG          archivo donde se registra inicio/fin de cada ejecución
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+STATUS_TASK_NAME = "Obtener estado de servicios"
+RESTART_TASK_NAME = "Reiniciar servicios solicitados"
+DEFAULT_FORKS = 5
+
+LATENCY = float(os.environ.get('BENCH_LATENCY', '0.2'))
+JITTER = float(os.environ.get('BENCH_JITTER', '0.25'))
+FAIL_RATE = float(os.environ.get('BENCH_FAIL_RATE', '0'))
+UNREACHABLE_RATE = float(os.environ.get('BENCH_UNREACHABLE_RATE', '0'))
+TIMEOUT_RATE = float(os.environ.get('BENCH_TIMEOUT_RATE', '0'))
+HANG_SECONDS = float(os.environ.get('BENCH_HANG_SECONDS', '3600'))
+SEED = os.environ.get('BENCH_SEED', '1')
+RUNS_LOG = os.environ.get('BENCH_RUNS_LOG')
+HANG_HOSTS = {h for h in os.environ.get('BENCH_HANG_HOSTS', '').split(',') if h}
+FAIL_HOSTS = {h for h in os.environ.get('BENCH_FAIL_HOSTS', '').split(',') if h}
+
+output_lock = threading.Lock()
+
+
+def emit(event, **fields):
+    fields['event'] = event
+    line = json.dumps(fields)
+    with output_lock:
+        sys.stdout.write(line + '\n')
+        sys.stdout.flush()
+
+
+def log_run(**fields):
+    if not RUNS_LOG:
+        return
+    fields['pid'] = os.getpid()
+    with open(RUNS_LOG, 'a') as f:
+        f.write(json.dumps(fields) + '\n')
+
+
+def parse_args(argv):
+    playbook = None
+    extra_vars = {}
+    forks = DEFAULT_FORKS
+    args = iter(argv)
+    for arg in args:
+        if arg == '-e':
+            extra_vars.update(json.loads(next(args)))
+        elif arg == '-f':
+            forks = int(next(args))
+        elif arg == '-i':
+            next(args)
+        elif playbook is None:
+            playbook = arg
+    return playbook, extra_vars, forks
+
+
+def host_fate(playbook, hostname):
+    # Destino fijo por host (el mismo en estado y reinicio) para que las
+    # corridas sean comparables; la latencia varía por playbook
+    roll = random.Random(f"{SEED}:{hostname}").random()
+    rng = random.Random(f"{SEED}:{os.path.basename(playbook)}:{hostname}")
+    if hostname in HANG_HOSTS or roll < TIMEOUT_RATE:
+        fate = 'timeout'
+    elif roll < TIMEOUT_RATE + UNREACHABLE_RATE:
+        fate = 'unreachable'
+    else:
+        fate = 'ok'
+    return fate, rng
+
+
+def service_fails(hostname, service):
+    if hostname in FAIL_HOSTS:
+        return True
+    return random.Random(f"{SEED}:{hostname}:{service}").random() < FAIL_RATE
+
+
+def latency(rng):
+    return max(0.0, LATENCY * (1 + rng.uniform(-JITTER, JITTER)))
+
+
+def check_host(playbook, hostname, services):
+    fate, rng = host_fate(playbook, hostname)
+    emit('host_start', host=hostname, task=STATUS_TASK_NAME)
+    if fate == 'timeout':
+        time.sleep(HANG_SECONDS)
+    time.sleep(latency(rng))
+    if fate == 'unreachable':
+        emit('host_result', host=hostname, task=STATUS_TASK_NAME, status='unreachable',
+             result={'unreachable': True, 'msg': 'simulado'})
+        return fate
+    results = []
+    for svc in services:
+        state = 'stopped' if service_fails(hostname, svc) else 'running'
+        item = {'item': svc, 'exists': True, 'services': [{'name': svc, 'state': state}]}
+        emit('item', host=hostname, task=STATUS_TASK_NAME, item=svc, status='ok', result=item)
+        results.append(item)
+    emit('host_result', host=hostname, task=STATUS_TASK_NAME, status='ok', result={'results': results})
+    return fate
+
+
+def restart_host(playbook, hostname, services):
+    fate, rng = host_fate(playbook, hostname)
+    emit('host_start', host=hostname, task=RESTART_TASK_NAME)
+    if fate == 'timeout':
+        time.sleep(HANG_SECONDS)
+    if fate == 'unreachable':
+        time.sleep(latency(rng))
+        emit('host_result', host=hostname, task=RESTART_TASK_NAME, status='unreachable',
+             result={'unreachable': True, 'msg': 'simulado'})
+        return fate
+    results = []
+    for svc in services:
+        time.sleep(latency(rng))
+        failed = service_fails(hostname, svc)
+        if failed:
+            fate = 'failed'
+        item = {'item': svc, 'changed': not failed, 'failed': failed}
+        emit('item', host=hostname, task=RESTART_TASK_NAME, item=svc,
+             status='failed' if failed else 'ok', result=item)
+        results.append(item)
+    emit('host_result', host=hostname, task=RESTART_TASK_NAME,
+         status='failed' if fate == 'failed' else 'ok', result={'results': results})
+    return fate
+
+
+def main():
+    playbook, extra_vars, forks = parse_args(sys.argv[1:])
+    hostnames = [h for h in str(extra_vars.get('target_host', '')).split(',') if h]
+    services_map = extra_vars.get('services_map') or {}
+    log_run(start=time.time(), playbook=os.path.basename(playbook), hosts=len(hostnames))
+
+    if 'check' in os.path.basename(playbook):
+        task, run_host = STATUS_TASK_NAME, check_host
+    else:
+        task, run_host = RESTART_TASK_NAME, restart_host
+    emit('task_start', task=task)
+
+    with ThreadPoolExecutor(max_workers=max(1, forks)) as executor:
+        fates = list(executor.map(
+            lambda h: run_host(playbook, h, services_map.get(h, extra_vars.get('services', []))),
+            hostnames
+        ))
+
+    emit('stats', stats={
+        h: {'ok': int(f == 'ok'), 'failures': int(f == 'failed'), 'unreachable': int(f == 'unreachable')}
+        for h, f in zip(hostnames, fates)
+    })
+    log_run(end=time.time())
+    if 'unreachable' in fates:
+        return 4
+    if 'failed' in fates:
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
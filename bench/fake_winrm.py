@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# bench/fake_winrm.py
+# Endpoint WS-Man falso para probar el backend de estado WinRM de RebootWebApp
+#
+# Responde lo justo para pywinrm (Create, Command, Receive, Signal, Delete) y
+# contesta el Get-Service que arma app.py con estados fijos por servicio, sin
+# ejecutar nada. Autenticación basic sobre HTTP; con --usuario/--password se
+# rechaza (401) cualquier otra credencial.
+#
+#   python bench/fake_winrm.py --port 15985 --estado Svc1=Stopped --estado Svc2=StartPending
+#
+# Los servicios no indicados responden Running; los indicados como Missing no
+# existen (Get-Service no los devuelve). Config de la aplicación:
+#   estado_backend: winrm
+#   winrm: {endpoint: "http://127.0.0.1:15985/wsman", transport: basic, validar_certificado: false}
+
+import argparse
+import base64
+import re
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ACTION_PREFIX = "http://schemas.microsoft.com/wbem/wsman/1/windows/shell/"
+COMMAND_DONE = "http://schemas.microsoft.com/wbem/wsman/1/windows/shell/CommandState/Done"
+ENVELOPE = (
+    '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope" '
+    'xmlns:a="http://schemas.xmlsoap.org/ws/2004/08/addressing" '
+    'xmlns:w="http://schemas.dmtf.org/wbem/wsman/1/wsman.xsd" '
+    'xmlns:rsp="http://schemas.microsoft.com/wbem/wsman/1/windows/shell">'
+    '<s:Header><a:RelatesTo>{relates_to}</a:RelatesTo></s:Header><s:Body>{body}</s:Body></s:Envelope>'
+)
+
+
+def find_text(root, suffix):
+    for node in root.iter():
+        if node.tag.endswith(suffix):
+            return node.text
+    return None
+
+
+def requested_services(script):
+    # Get-Service -Name 'A','B' | ... (el script de build_get_service_script)
+    match = re.search(r"Get-Service -Name (.+?) \|", script)
+    if not match:
+        return []
+    return [name.replace("''", "'") for name in re.findall(r"'((?:[^']|'')*)'", match.group(1))]
+
+
+class FakeWinRM:
+
+    def __init__(self, states=None, username=None, password=None):
+        self.states = states or {}
+        self.credentials = (username, password) if username else None
+        self._lock = threading.Lock()
+        self._outputs = {}
+        self.requests = []
+
+    def run_script(self, script):
+        lines = []
+        for name in requested_services(script):
+            state = self.states.get(name, 'Running')
+            if state != 'Missing':
+                lines.append(f"{name}|{state}")
+        return '\r\n'.join(lines) + '\r\n'
+
+    def handle(self, payload):
+        root = ET.fromstring(payload)
+        action = find_text(root, 'Action') or ''
+        message_id = find_text(root, 'MessageID')
+        operation = action.rsplit('/', 1)[-1]
+        with self._lock:
+            self.requests.append(operation)
+        if operation == 'Create':
+            body = (
+                '<x:ResourceCreated xmlns:x="http://schemas.xmlsoap.org/ws/2004/09/transfer">'
+                '<a:ReferenceParameters><w:SelectorSet>'
+                f'<w:Selector Name="ShellId">{uuid.uuid4()}</w:Selector>'
+                '</w:SelectorSet></a:ReferenceParameters></x:ResourceCreated>'
+            )
+        elif operation == 'Command':
+            # pywinrm manda los argumentos en un solo elemento, separados por espacios
+            arguments = ' '.join(node.text or '' for node in root.iter() if node.tag.endswith('Arguments')).split()
+            script = ''
+            if '-EncodedCommand' in arguments:
+                encoded = arguments[arguments.index('-EncodedCommand') + 1]
+                script = base64.b64decode(encoded).decode('utf_16_le')
+            command_id = str(uuid.uuid4()).upper()
+            with self._lock:
+                self._outputs[command_id] = self.run_script(script)
+            body = f'<rsp:CommandResponse><rsp:CommandId>{command_id}</rsp:CommandId></rsp:CommandResponse>'
+        elif operation == 'Receive':
+            command_id = next(node.get('CommandId') for node in root.iter() if node.tag.endswith('DesiredStream'))
+            with self._lock:
+                output = self._outputs.pop(command_id, '')
+            encoded = base64.b64encode(output.encode('utf-8')).decode('ascii')
+            body = (
+                '<rsp:ReceiveResponse>'
+                f'<rsp:Stream Name="stdout" CommandId="{command_id}">{encoded}</rsp:Stream>'
+                f'<rsp:Stream Name="stdout" CommandId="{command_id}" End="true"></rsp:Stream>'
+                f'<rsp:Stream Name="stderr" CommandId="{command_id}" End="true"></rsp:Stream>'
+                f'<rsp:CommandState CommandId="{command_id}" State="{COMMAND_DONE}">'
+                '<rsp:ExitCode>0</rsp:ExitCode></rsp:CommandState>'
+                '</rsp:ReceiveResponse>'
+            )
+        elif operation in ('Signal', 'Delete'):
+            body = '<rsp:SignalResponse/>' if operation == 'Signal' else ''
+        else:
+            raise ValueError(f"acción no soportada: {action}")
+        return ENVELOPE.format(relates_to=message_id, body=body)
+
+
+class FakeWinRMHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        fake = self.server.fake
+        if fake.credentials:
+            expected = base64.b64encode(':'.join(fake.credentials).encode('utf-8')).decode('ascii')
+            if self.headers.get('Authorization') != f"Basic {expected}":
+                self.send_response(401)
+                self.send_header('WWW-Authenticate', 'Basic realm="WSMAN"')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        payload = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        try:
+            body = fake.handle(payload).encode('utf-8')
+            status = 200
+        except Exception as e:
+            body = str(e).encode('utf-8')
+            status = 500
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/soap+xml;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(fake, host='127.0.0.1', port=0):
+    # Devuelve el servidor ya escuchando (en un hilo); port=0 elige uno libre
+    server = ThreadingHTTPServer((host, port), FakeWinRMHandler)
+    server.daemon_threads = True
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Endpoint WS-Man falso para el backend WinRM")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=15985)
+    parser.add_argument("--estado", action="append", default=[], help="SERVICIO=Estado (Running, Stopped, Missing...)")
+    parser.add_argument("--usuario")
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    states = dict(pair.split('=', 1) for pair in args.estado)
+    server = start_server(FakeWinRM(states, args.usuario, args.password), args.host, args.port)
+    print(f"WinRM falso escuchando en http://{args.host}:{server.server_port}/wsman")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
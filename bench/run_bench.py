@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+# bench/run_bench.py
+# Benchmark de la capa de orquestación de RebootWebApp
+#
+# Genera un services_windows.yml sintético (10 a 1000+ servidores), reemplaza
+# ansible-playbook por fake_ansible_playbook.py y mide la consulta de estado y
+# los reinicios (paralelo, por olas, secuencial) usando el código real de
+# webapp/app.py. Cada medición corre en un proceso aparte, con su propio
+# directorio temporal, para que memoria, caches y logs no se mezclen.
+#
+# Uso:
+#   python bench/run_bench.py --hosts 10,100,1000 --output resultados.json
+#   python bench/run_bench.py --hosts 100 --compare base.json --tolerance 0.2
+#
+# Requiere las dependencias de la aplicación (requirements.txt).
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import yaml
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+APP_PATH = REPO_DIR / "webapp" / "app.py"
+APP_MODULES = (
+    "shared_state.py", "audit_log.py", "telemetry.py", "inventory.py", "status_history.py",
+    "winrm_status.py", "host_health.py", "status_cache.py", "jobs.py",
+)
+FAKE_PLAYBOOK = BENCH_DIR / "fake_ansible_playbook.py"
+SCENARIOS = ('status', 'paralelo', 'olas', 'secuencial')
+SAMPLE_SECONDS = 0.05
+JOB_POLL_SECONDS = 0.05
+BENCH_USER = "benchmark@local"
+# Diferencias absolutas por debajo de estas se consideran ruido al comparar
+COMPARE_NOISE = {'wall_seconds_median': 0.05, 'cpu_app_seconds_median': 0.05, 'peak_rss_app_mb_max': 2.0}
+
+
+# ============================================================================
+# FLOTA SINTÉTICA
+# ============================================================================
+
+def generate_fleet(hosts, services_per_host, group_size):
+    grupos = []
+    for start in range(0, hosts, group_size):
+        idx = len(grupos) + 1
+        grupos.append({
+            'id': f"bench{idx:03d}",
+            'nombre': f"Bench {idx:03d}",
+            'icono': "🧪",
+            'nombre_operacion': f"Reiniciar Bench {idx:03d}",
+            'servers': [
+                {
+                    'hostname': f"BENCH{n:04d}.bench.local",
+                    'display_name': f"BENCH{n:04d}",
+                    'services': [
+                        {'name': f"BenchSvc{s:02d}", 'display_name': f"Servicio {s:02d}"}
+                        for s in range(1, services_per_host + 1)
+                    ]
+                }
+                for n in range(start + 1, min(start + group_size, hosts) + 1)
+            ]
+        })
+    return {'auto_refresh_segundos': 0, 'grupos': grupos}
+
+
+def restart_hosts(spec):
+    if spec['scenario'] == 'secuencial':
+        return min(spec['hosts'], spec['sequential_hosts'])
+    return spec['hosts']
+
+
+def restart_group(config, hosts, spec):
+    # Un solo grupo con los primeros `hosts` servidores de la flota; se
+    # escribe en la configuración generada como cualquier otro grupo
+    servers = [server for grupo in config['grupos'] for server in grupo['servers']][:hosts]
+    return {
+        'id': 'bench-restart',
+        'nombre': "Bench reinicio",
+        'icono': "🧪",
+        'nombre_operacion': "Reiniciar Bench",
+        'espera_max_segundos': spec['max_wait'],
+        'concurrencia_max': spec['concurrency'],
+        'ola': spec['wave'],
+        'umbral_fallos': spec['failure_threshold'],
+        'servers': servers
+    }
+
+
+# ============================================================================
+# MEDICIÓN (proceso hijo)
+# ============================================================================
+
+def prepare_workdir(spec):
+    # Copia de app.py (y los módulos que importa) en un directorio propio:
+    # config, logs y jobs quedan ahí
+    workdir = Path(tempfile.mkdtemp(prefix="rebootwebapp-bench-"))
+    shutil.copy(APP_PATH, workdir / "app.py")
+    for module in APP_MODULES:
+        shutil.copy(APP_PATH.parent / module, workdir / module)
+    (workdir / "config").mkdir()
+    config = generate_fleet(spec['hosts'], spec['services'], spec['group_size'])
+    if spec['scenario'] != 'status':
+        config['grupos'].append(restart_group(config, restart_hosts(spec), spec))
+    with open(workdir / "config" / "services_windows.yml", 'w') as f:
+        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+
+    bin_dir = workdir / "bin"
+    bin_dir.mkdir()
+    wrapper = bin_dir / "ansible-playbook"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_PLAYBOOK}" "$@"\n')
+    wrapper.chmod(0o755)
+
+    os.environ['PATH'] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+    os.environ.update({
+        'BENCH_LATENCY': str(spec['latency']),
+        'BENCH_JITTER': str(spec['jitter']),
+        'BENCH_FAIL_RATE': str(spec['fail_rate']),
+        'BENCH_UNREACHABLE_RATE': str(spec['unreachable_rate']),
+        'BENCH_TIMEOUT_RATE': str(spec['timeout_rate']),
+        'BENCH_SEED': str(spec['seed']),
+        'BENCH_RUNS_LOG': str(workdir / "runs.jsonl")
+    })
+    return workdir
+
+
+def load_app(workdir, spec):
+    sys.path.insert(0, str(workdir))
+    module_spec = importlib.util.spec_from_file_location("rebootwebapp_bench_app", workdir / "app.py")
+    app = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(app)
+    # Siempre por subproceso: el runner precargado no se puede simular
+    app.ANSIBLE_RUNNER_SOCKET = str(workdir / "sin-runner.sock")
+    app.STATUS_TIMEOUT = spec['timeout']
+    app.ANSIBLE_TIMEOUT = spec['timeout']
+    app.HEALTH_POLL_SECONDS = spec['health_poll']
+    return app
+
+
+def playbook_stats(runs_log, scenario_end):
+    # Ejecuciones de ansible-playbook y máximo simultáneo; las que se mataron
+    # por timeout no registran fin y cuentan hasta el final de la medición
+    runs = {}
+    if runs_log.exists():
+        for line in runs_log.read_text().splitlines():
+            record = json.loads(line)
+            run = runs.setdefault(record['pid'], {})
+            run.update(record)
+    edges = []
+    for run in runs.values():
+        if 'start' in run:
+            edges.append((run['start'], 1))
+            edges.append((run.get('end', scenario_end), -1))
+    peak = current = 0
+    for _, delta in sorted(edges):
+        current += delta
+        peak = max(peak, current)
+    return len(runs), peak
+
+
+def maxrss_mb(who):
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux informa KB, macOS bytes
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_status(app, config, spec, marks):
+    servers = [server for grupo in config['grupos'] for server in grupo['servers']]
+    host_services = app.get_host_services(servers)
+    status_fetch = app.get_status_fetcher(config)
+
+    def fetch(to_fetch, on_host=None):
+        def tracked(hostname, status):
+            marks.setdefault('first_result', time.monotonic())
+            if on_host:
+                on_host(hostname, status)
+        return status_fetch(to_fetch, on_host=tracked)
+
+    status = app.StatusCache().get_many(host_services, 0, force=True, fetch=fetch)
+    outcome = {}
+    for hostname, services in host_services.items():
+        for svc in services:
+            state = status.get(hostname, {}).get(svc, 'missing').lower()
+            outcome[state] = outcome.get(state, 0) + 1
+    return outcome
+
+
+def run_restart(app, config, spec, workdir, marks):
+    hosts = restart_hosts(spec)
+    grupo = next(grupo for grupo in config['grupos'] if grupo['id'] == 'bench-restart')
+    manager = app.JobManager(app.StatusCache(app.MemoryState(workdir / "jobs")), app.plan_restart_job,
+                             app.execute_restart_job, app.get_status_fetcher(config))
+    job_id = manager.submit(grupo, BENCH_USER, spec['scenario'])
+    while True:
+        job = manager.get(job_id)
+        results = [item['result'] for item in job['items']]
+        if 'first_result' not in marks and any(r not in ('pending', 'running') for r in results):
+            marks['first_result'] = time.monotonic()
+        if job['status'] == 'finished':
+            break
+        time.sleep(JOB_POLL_SECONDS)
+    outcome = {}
+    for result in results:
+        outcome[result] = outcome.get(result, 0) + 1
+    marks['restart_hosts'] = hosts
+    return outcome
+
+
+def measure(spec):
+    workdir = prepare_workdir(spec)
+    try:
+        app = load_app(workdir, spec)
+        config_start = time.monotonic()
+        config = app.ConfigStore().load(app.CONFIG_PATH, app.validate_config)
+        config_seconds = time.monotonic() - config_start
+
+        # Muestreo de hilos vivos durante la medición
+        peak_threads = [threading.active_count()]
+        stop = threading.Event()
+        def sample():
+            while not stop.wait(SAMPLE_SECONDS):
+                peak_threads[0] = max(peak_threads[0], threading.active_count())
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+
+        marks = {}
+        cpu_self = cpu_seconds(resource.RUSAGE_SELF)
+        cpu_children = cpu_seconds(resource.RUSAGE_CHILDREN)
+        start = time.monotonic()
+        start_wall = time.time()
+        if spec['scenario'] == 'status':
+            outcome = run_status(app, config, spec, marks)
+        else:
+            outcome = run_restart(app, config, spec, workdir, marks)
+        wall = time.monotonic() - start
+        end_wall = time.time()
+        cpu_self = cpu_seconds(resource.RUSAGE_SELF) - cpu_self
+        cpu_children = cpu_seconds(resource.RUSAGE_CHILDREN) - cpu_children
+        stop.set()
+        sampler.join()
+
+        runs, peak_runs = playbook_stats(workdir / "runs.jsonl", end_wall)
+        return {
+            'scenario': spec['scenario'],
+            'hosts': marks.get('restart_hosts', spec['hosts']),
+            'fleet_hosts': spec['hosts'],
+            'services_per_host': spec['services'],
+            'repeat': spec['repeat'],
+            'wall_seconds': round(wall, 3),
+            'first_result_seconds': round(marks['first_result'] - start, 3) if 'first_result' in marks else None,
+            'config_load_seconds': round(config_seconds, 4),
+            'cpu_seconds': {'app': round(cpu_self, 3), 'playbooks': round(cpu_children, 3)},
+            'playbook_runs': runs,
+            'peak_concurrent_playbooks': peak_runs,
+            'peak_threads': peak_threads[0],
+            'peak_rss_mb': {'app': maxrss_mb(resource.RUSAGE_SELF), 'playbooks': maxrss_mb(resource.RUSAGE_CHILDREN)},
+            'outcome': outcome,
+            'started': datetime.fromtimestamp(start_wall).isoformat(timespec='seconds')
+        }
+    finally:
+        if not spec['keep']:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def worker_main():
+    spec = json.loads(sys.stdin.read())
+    result = measure(spec)
+    # La app escribe advertencias de Streamlit en stderr; el resultado va solo
+    # por stdout, en la última línea
+    sys.stdout.write(json.dumps(result) + '\n')
+    sys.stdout.flush()
+    # Sin esperar a los pools de la app (hilos no daemon ya ociosos)
+    os._exit(0)
+
+
+# ============================================================================
+# ORQUESTACIÓN Y COMPARACIÓN
+# ============================================================================
+
+def run_isolated(spec, timeout):
+    proc = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), '--worker'],
+        input=json.dumps(spec), capture_output=True, text=True, timeout=timeout
+    )
+    if proc.returncode != 0 or not proc.stdout.strip():
+        raise RuntimeError(f"medición {spec['scenario']}/{spec['hosts']} falló (rc {proc.returncode}):\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def summarize(results):
+    groups = {}
+    for result in results:
+        groups.setdefault((result['scenario'], result['fleet_hosts']), []).append(result)
+    summary = []
+    for (scenario, fleet_hosts), runs in groups.items():
+        summary.append({
+            'scenario': scenario,
+            'fleet_hosts': fleet_hosts,
+            'hosts': runs[0]['hosts'],
+            'runs': len(runs),
+            'wall_seconds_median': round(statistics.median(r['wall_seconds'] for r in runs), 3),
+            'wall_seconds_max': max(r['wall_seconds'] for r in runs),
+            'cpu_app_seconds_median': round(statistics.median(r['cpu_seconds']['app'] for r in runs), 3),
+            'peak_rss_app_mb_max': max(r['peak_rss_mb']['app'] for r in runs),
+            'playbook_runs_median': statistics.median(r['playbook_runs'] for r in runs)
+        })
+    return summary
+
+
+def compare(report, baseline_path, tolerance):
+    with open(baseline_path, 'r') as f:
+        baseline_report = json.load(f)
+    baseline = {(s['scenario'], s['fleet_hosts']): s for s in baseline_report['summary']}
+    regressions = []
+    print(f"\nComparación contra {baseline_path} (tolerancia {tolerance:.0%}):", file=sys.stderr)
+    if baseline_report['meta']['settings'] != report['meta']['settings']:
+        print("  ⚠️ La corrida base usó otros parámetros; la comparación no es directa", file=sys.stderr)
+    summary = report['summary']
+    for current in summary:
+        base = baseline.get((current['scenario'], current['fleet_hosts']))
+        if base is None:
+            continue
+        for metric, noise in COMPARE_NOISE.items():
+            before, after = base[metric], current[metric]
+            change = (after - before) / before if before else 0.0
+            flag = ""
+            if change > tolerance and after - before > noise:
+                flag = "  ⚠️ REGRESIÓN"
+                regressions.append((current['scenario'], current['fleet_hosts'], metric, before, after))
+            print(f"  {current['scenario']:<10} {current['fleet_hosts']:>5} hosts  {metric:<24} "
+                  f"{before:>9} → {after:<9} ({change:+.0%}){flag}", file=sys.stderr)
+    return regressions
+
+
+def print_summary(summary):
+    print(f"\n{'escenario':<10} {'flota':>6} {'hosts':>6} {'wall (med)':>11} {'cpu app':>8} "
+          f"{'rss MB':>7} {'playbooks':>9}", file=sys.stderr)
+    for s in summary:
+        print(f"{s['scenario']:<10} {s['fleet_hosts']:>6} {s['hosts']:>6} {s['wall_seconds_median']:>10}s "
+              f"{s['cpu_app_seconds_median']:>7}s {s['peak_rss_app_mb_max']:>7} {s['playbook_runs_median']:>9}",
+              file=sys.stderr)
+
+
+def parse_list(value, cast=str):
+    return [cast(v.strip()) for v in value.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de orquestación de RebootWebApp con Ansible simulado")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--hosts", default="10,100,1000", help="Tamaños de flota separados por coma")
+    parser.add_argument("--services", type=int, default=2, help="Servicios por servidor")
+    parser.add_argument("--group-size", type=int, default=50, help="Servidores por grupo en la config generada")
+    parser.add_argument("--scenarios", default="status,paralelo,secuencial", help=f"Escenarios: {', '.join(SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="Segundos por host/servicio simulados")
+    parser.add_argument("--jitter", type=float, default=0.25)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--unreachable-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=int, default=30, help="Timeout de Ansible en la app (segundos)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrencia_max del grupo de reinicio")
+    parser.add_argument("--wave", default="25%", help="Tamaño de ola (escenario olas)")
+    parser.add_argument("--failure-threshold", default="10%", help="umbral_fallos (escenario olas)")
+    parser.add_argument("--sequential-hosts", type=int, default=10,
+                        help="Servidores del escenario secuencial (crece linealmente)")
+    parser.add_argument("--max-wait", type=int, default=10, help="espera_max_segundos (verificación de Running)")
+    parser.add_argument("--health-poll", type=float, default=0.5, help="Intervalo inicial de verificación de Running")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto stdout)")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento relativo tolerado")
+    parser.add_argument("--keep", action="store_true", help="No borrar los directorios temporales")
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main()
+        return 0
+
+    scenarios = parse_list(args.scenarios)
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"escenario desconocido: {scenario}")
+
+    settings = {
+        'services': args.services,
+        'group_size': args.group_size,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'fail_rate': args.fail_rate,
+        'unreachable_rate': args.unreachable_rate,
+        'timeout_rate': args.timeout_rate,
+        'timeout': args.timeout,
+        'seed': args.seed,
+        'concurrency': args.concurrency,
+        'wave': args.wave,
+        'failure_threshold': args.failure_threshold,
+        'sequential_hosts': args.sequential_hosts,
+        'max_wait': args.max_wait,
+        'health_poll': args.health_poll,
+        'keep': args.keep
+    }
+    results = []
+    for hosts in parse_list(args.hosts, int):
+        for scenario in scenarios:
+            for repeat in range(1, args.repeat + 1):
+                spec = dict(settings, hosts=hosts, scenario=scenario, repeat=repeat)
+                print(f"→ {scenario} / {hosts} hosts / corrida {repeat}", file=sys.stderr)
+                results.append(run_isolated(spec, timeout=args.timeout * 4 + hosts * args.services * 10))
+
+    commit = subprocess.run(['git', '-C', str(REPO_DIR), 'rev-parse', '--short', 'HEAD'],
+                            capture_output=True, text=True).stdout.strip() or None
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'settings': {k: v for k, v in settings.items() if k != 'keep'}
+        },
+        'summary': summarize(results),
+        'results': results
+    }
+
+    print_summary(report['summary'])
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        regressions = compare(report, args.compare, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} métricas empeoraron más de {args.tolerance:.0%}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+# tests/conftest.py
+# Fixtures comunes: importa webapp/app.py y reemplaza ansible-playbook por
+# bench/fake_ansible_playbook.py, sin runner precargado ni historial en disco.
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+FAKE_PLAYBOOK = REPO_DIR / "bench" / "fake_ansible_playbook.py"
+sys.path.insert(0, str(REPO_DIR / "webapp"))
+sys.path.insert(0, str(REPO_DIR / "bench"))
+
+
+@pytest.fixture(scope='session')
+def app():
+    import app as module
+    return module
+
+
+@pytest.fixture
+def fake_ansible(app, tmp_path, monkeypatch):
+    # Devuelve una función para fijar hosts colgados o con servicios que no
+    # reinician; la latencia es mínima y sin variación
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    wrapper = bin_dir / "ansible-playbook"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_PLAYBOOK}" "$@"\n')
+    wrapper.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv('BENCH_LATENCY', '0.01')
+    monkeypatch.setenv('BENCH_JITTER', '0')
+    monkeypatch.setenv('BENCH_HANG_SECONDS', '60')
+    monkeypatch.setattr(app, 'ANSIBLE_RUNNER_SOCKET', str(tmp_path / "sin-runner.sock"))
+    advisor = app.TimeoutAdvisor(app.timeout_limits)
+    monkeypatch.setattr(app, 'get_timeout_advisor', lambda: advisor)
+
+    def configure(hang=(), fail=()):
+        monkeypatch.setenv('BENCH_HANG_HOSTS', ','.join(hang))
+        monkeypatch.setenv('BENCH_FAIL_HOSTS', ','.join(fail))
+    configure()
+    return configure
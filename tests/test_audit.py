@@ -0,0 +1,60 @@
+# Auditoría con varias réplicas escribiendo en la misma ruta configurada
+
+import json
+import sqlite3
+import subprocess
+import sys
+
+import audit_log
+from conftest import REPO_DIR
+
+WRITER = """
+import logging, sys
+from datetime import datetime
+sys.path.insert(0, {webapp!r})
+import audit_log
+replica, count = sys.argv[1], int(sys.argv[2])
+logger = logging.getLogger('prueba.audit')
+logger.propagate = False
+logger.setLevel(logging.INFO)
+for handler in audit_log.build_audit_handlers({log_path!r}, {db_path!r}, replica, max_bytes=2000, backup_count=100):
+    logger.addHandler(handler)
+for n in range(count):
+    record = {{'ts': datetime.now().isoformat(timespec='seconds'), 'event': 'EXITO',
+              'op_id': f"{{replica}}-{{n}}", 'host': 'SRV01', 'service': 'Svc1'}}
+    logger.info('EXITO', extra={{'audit': record}})
+"""
+
+
+def test_two_replicas_do_not_lose_audit_records(tmp_path):
+    log_path = tmp_path / "auditoria.jsonl"
+    db_path = tmp_path / "auditoria.db"
+    script = WRITER.format(webapp=str(REPO_DIR / "webapp"), log_path=str(log_path), db_path=str(db_path))
+    count = 300
+    writers = [
+        subprocess.Popen([sys.executable, '-c', script, replica, str(count)], cwd=tmp_path)
+        for replica in ('host-8501', 'host-8502')
+    ]
+    assert [writer.wait(60) for writer in writers] == [0, 0]
+
+    # Cada réplica rotó su propio archivo varias veces sin pisar las del otro
+    files = sorted(path.name for path in tmp_path.glob('auditoria*.jsonl*'))
+    assert 'auditoria-host-8501.jsonl.1' in files and 'auditoria-host-8502.jsonl.1' in files
+    written = [json.loads(line)['op_id'] for path in tmp_path.glob('auditoria*.jsonl*')
+               for line in path.read_text(encoding='utf-8').splitlines()]
+    expected = {f"{replica}-{n}" for replica in ('host-8501', 'host-8502') for n in range(count)}
+    assert len(written) == len(expected) and set(written) == expected
+
+    with sqlite3.connect(db_path) as conn:
+        indexed = {row[0] for row in conn.execute("SELECT op_id FROM audit")}
+    assert indexed == expected
+
+
+def test_index_is_trimmed_to_the_oldest_record_of_any_replica(tmp_path):
+    log_path = tmp_path / "auditoria.jsonl"
+    (tmp_path / "auditoria-a.jsonl.2").write_text('{"ts": "2026-01-05T00:00:00"}\n')
+    (tmp_path / "auditoria-b.jsonl").write_text('{"ts": "2026-01-03T00:00:00"}\n')
+    (tmp_path / "auditoria-b.jsonl.1").write_text('{"ts": "2026-01-04T00:00:00"}\n')
+    assert audit_log.audit_oldest_ts(log_path) == "2026-01-03T00:00:00"
+    assert audit_log.audit_log_path(log_path, 'a') == tmp_path / "auditoria-a.jsonl"
+    assert audit_log.audit_log_path(log_path) == log_path
@@ -0,0 +1,51 @@
+# Validación de services_windows.yml: un error se rechaza al cargar y queda
+# la última versión válida, en lugar de fallar a mitad de un reinicio
+
+import pytest
+import yaml
+
+
+def config_with(**service):
+    return {'grupos': [{
+        'id': 'g1', 'nombre': 'G1', 'icono': '🧪', 'nombre_operacion': 'Reiniciar G1',
+        'servers': [
+            {'hostname': 'SRV01', 'display_name': 'SRV01',
+             'services': [{'name': 'Db', 'display_name': 'Base'}]},
+            {'hostname': 'SRV02', 'display_name': 'SRV02',
+             'services': [{'name': 'Web', 'display_name': 'Web', **service}]}
+        ]
+    }]}
+
+
+@pytest.mark.parametrize('service', [
+    {'depende_de': ['Db']},
+    {'depende_de': ['SRV01/Db']},
+    {'espera_adicional_segundos': 0},
+    {'espera_adicional_segundos': 2.5},
+])
+def test_valid_dependencies_and_settle_time(app, service):
+    app.validate_config(config_with(**service))
+
+
+@pytest.mark.parametrize('service, error', [
+    ({'depende_de': ['Cache']}, "no están en el grupo: Cache"),
+    ({'depende_de': ['SRV02/Db']}, "no están en el grupo: SRV02/Db"),
+    ({'depende_de': 'Db'}, "depende_de debe ser una lista"),
+    ({'espera_adicional_segundos': -1}, "espera_adicional_segundos"),
+    ({'espera_adicional_segundos': '10'}, "espera_adicional_segundos"),
+])
+def test_invalid_dependencies_and_settle_time(app, service, error):
+    with pytest.raises(ValueError, match=error):
+        app.validate_config(config_with(**service))
+
+
+def test_invalid_reload_keeps_the_last_valid_config(app, tmp_path):
+    path = tmp_path / "services_windows.yml"
+    path.write_text(yaml.safe_dump(config_with(depende_de=['Db'])))
+    store = app.ConfigStore()
+    assert store.load(path, app.validate_config)['grupos'][0]['id'] == 'g1'
+
+    path.write_text(yaml.safe_dump(config_with(depende_de=['Cache'])))
+    config = store.load(path, app.validate_config)
+    assert config['grupos'][0]['servers'][1]['services'][0]['depende_de'] == ['Db']
+    assert "Cache" in store.last_error(path)
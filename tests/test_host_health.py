@@ -0,0 +1,37 @@
+# Circuit breaker por host: un host colgado no arrastra al resto del lote
+
+import host_health
+
+
+def test_hung_host_does_not_trip_breaker_for_healthy_hosts(app, fake_ansible, monkeypatch):
+    fake_ansible(hang=['HUNG01'])
+    monkeypatch.setattr(app, 'STATUS_TIMEOUT', 2)
+    health = app.HostHealth()
+    fetch = health.guard(app.get_services_status_batch, 5985)
+    healthy = [f"OK{n:02d}" for n in range(5)]
+    host_services = {hostname: ['Svc1', 'Svc2'] for hostname in healthy + ['HUNG01']}
+
+    for _ in range(host_health.BREAKER_THRESHOLD):
+        status = fetch(host_services)
+
+    assert status['HUNG01'] == {'Svc1': 'timeout', 'Svc2': 'timeout'}
+    for hostname in healthy:
+        assert status[hostname] == {'Svc1': 'running', 'Svc2': 'running'}
+        assert health.state(hostname) == 'closed'
+    assert health.state('HUNG01') == 'open'
+
+    # Con el circuito abierto el host colgado se informa sin consultarlo
+    monkeypatch.setenv('PATH', '/nonexistent')
+    assert fetch({'HUNG01': ['Svc1']}) == {'HUNG01': {'Svc1': 'unreachable'}}
+
+
+def test_batch_timeout_keeps_results_already_reported(app, fake_ansible, monkeypatch):
+    fake_ansible(hang=['HUNG01'])
+    monkeypatch.setattr(app, 'STATUS_TIMEOUT', 2)
+    reported = {}
+    status = app.get_services_status_batch(
+        {'OK01': ['Svc1'], 'HUNG01': ['Svc1']},
+        on_host=lambda hostname, host_status: reported.update({hostname: host_status})
+    )
+    assert reported == {'OK01': {'Svc1': 'running'}}
+    assert status == {'OK01': {'Svc1': 'running'}, 'HUNG01': {'Svc1': 'timeout'}}
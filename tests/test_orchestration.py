@@ -0,0 +1,314 @@
+# Orquestación: single-flight del cache de estado, leases del estado
+# compartido y corte de un reinicio por olas al llegar al umbral de fallos
+
+import os
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import shared_state
+import status_cache
+
+
+def test_concurrent_sessions_share_a_single_fetch(app):
+    cache = app.StatusCache(shared_state.MemoryState())
+    calls = []
+    release = threading.Event()
+
+    def fetch(host_services, on_host=None):
+        calls.append(dict(host_services))
+        release.wait(5)
+        return {hostname: {svc: 'running' for svc in services} for hostname, services in host_services.items()}
+
+    results = []
+    sessions = [
+        threading.Thread(target=lambda: results.append(cache.get_many({'SRV01': ['Svc1']}, 30, fetch=fetch)))
+        for _ in range(8)
+    ]
+    for session in sessions:
+        session.start()
+    time.sleep(0.2)
+    release.set()
+    for session in sessions:
+        session.join(5)
+
+    assert calls == [{'SRV01': ['Svc1']}]
+    assert results == [{'SRV01': {'Svc1': 'running'}}] * 8
+    # Dentro del TTL se responde del cache
+    assert cache.get_many({'SRV01': ['Svc1']}, 30, fetch=fetch) == {'SRV01': {'Svc1': 'running'}}
+    assert len(calls) == 1
+
+
+def test_forced_load_is_chained_after_a_load_in_flight(app):
+    cache = app.StatusCache(shared_state.MemoryState())
+    cache.get_many({'SRV01': ['Svc1']}, 30, fetch=lambda host_services, on_host=None: {'SRV01': {'Svc1': 'running'}})
+    calls = []
+    release = threading.Event()
+
+    def fetch(host_services, on_host=None):
+        calls.append(dict(host_services))
+        release.wait(5)
+        return {'SRV01': {'Svc1': 'stopped' if len(calls) == 1 else 'running'}}
+
+    loader = app.StatusLoader(cache)
+    servers = [{'hostname': 'SRV01', 'services': [{'name': 'Svc1'}]}]
+    first = loader.submit('g1', servers, 0, fetch=fetch)
+    time.sleep(0.1)
+    # El refresco forzado no se pierde ni se sirve el cache viejo mientras tanto
+    assert loader.submit('g1', servers, 30, force=True, fetch=fetch) is first
+    assert loader.submit('g1', servers, 30, force=True, fetch=fetch) is first
+    assert cache.peek({'SRV01': ['Svc1']})[0] == {}
+    release.set()
+    first.result(5)
+    deadline = time.time() + 5
+    while loader.is_loading('g1') and time.time() < deadline:
+        time.sleep(0.05)
+
+    assert len(calls) == 2
+    assert cache.peek({'SRV01': ['Svc1']})[0] == {'SRV01': {'Svc1': 'running'}}
+
+
+def memory_store(tmp_path):
+    return shared_state.MemoryState(tmp_path / "jobs")
+
+
+def sqlite_store(tmp_path):
+    return shared_state.SQLiteState(tmp_path / "estado.db")
+
+
+def redis_store(tmp_path):
+    pytest.importorskip('redis')
+    url = os.environ.get('REBOOTWEBAPP_TEST_REDIS')
+    if not url:
+        pytest.skip("REBOOTWEBAPP_TEST_REDIS no definido")
+    store = shared_state.RedisState(url)
+    store.PREFIX = f"rebootwebapp-test:{os.getpid()}:"
+    return store
+
+
+@pytest.fixture(params=[memory_store, sqlite_store, redis_store], ids=['memoria', 'sqlite', 'redis'])
+def store(request, tmp_path):
+    return request.param(tmp_path)
+
+
+def test_lease_conflict_and_expiry(store):
+    assert store.acquire_lease('grupo:g1', 'job-a', 0.5)
+    assert not store.acquire_lease('grupo:g1', 'job-b', 0.5)
+    # El dueño lo renueva; otro no puede liberarlo
+    assert store.acquire_lease('grupo:g1', 'job-a', 0.5)
+    store.release_lease('grupo:g1', 'job-b')
+    assert store.lease_owner('grupo:g1') == 'job-a'
+
+    time.sleep(0.7)
+    assert store.lease_owner('grupo:g1') is None
+    assert store.acquire_lease('grupo:g1', 'job-b', 0.5)
+    assert store.lease_owner('grupo:g1') == 'job-b'
+    store.release_lease('grupo:g1', 'job-b')
+    assert store.lease_owner('grupo:g1') is None
+
+
+def make_job(job_id, status, finished_ago=None):
+    finished = None
+    if finished_ago is not None:
+        finished = datetime.fromtimestamp(time.time() - finished_ago).isoformat(timespec='seconds')
+    return {'id': job_id, 'grupo_id': 'g1', 'status': status, 'finished': finished}
+
+
+def test_finished_jobs_expire_after_retention(store, tmp_path):
+    store.job_retention = 3600
+    store.save_job(make_job('viejo', 'finished', finished_ago=7200))
+    store.save_job(make_job('reciente', 'interrupted', finished_ago=60))
+    store.save_job(make_job('activo', 'running'))
+    store.prune_jobs()
+
+    if isinstance(store, shared_state.RedisState):
+        # En Redis el trabajo terminado vence solo
+        assert 0 < store._redis.ttl(f"{store.PREFIX}job:viejo") <= 3600
+        assert store._redis.ttl(f"{store.PREFIX}job:activo") == -1
+        return
+    assert store.load_job('viejo') is None
+    assert store.load_job('reciente')['status'] == 'interrupted'
+    assert [job['id'] for job in store.list_active_jobs()] == ['activo']
+    if isinstance(store, shared_state.MemoryState):
+        assert sorted(path.name for path in (tmp_path / "jobs").glob('*.json')) == ['activo.json', 'reciente.json']
+
+
+@pytest.fixture
+def make_grupo(app, monkeypatch):
+    # Los trabajos toman sus servicios del inventario: cada grupo creado se
+    # agrega al inventario de la prueba
+    grupos = {}
+    monkeypatch.setattr(app, 'get_inventory', lambda: app.InventoryIndex({'grupos': list(grupos.values())}))
+
+    def make(grupo_id, hostnames, **params):
+        grupos[grupo_id] = {
+            'id': grupo_id,
+            'nombre': grupo_id,
+            'servers': [
+                {'hostname': hostname, 'display_name': hostname,
+                 'services': [{'name': 'Svc1', 'display_name': 'Servicio 1'}]}
+                for hostname in hostnames
+            ],
+            **params
+        }
+        return grupos[grupo_id]
+    return make
+
+
+def wait_finished(manager, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job['status'] == 'finished':
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"el trabajo {job_id} no terminó en {timeout}s")
+
+
+@pytest.fixture
+def manager(app, fake_ansible, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, 'audit', lambda event, **fields: None)
+    return app.JobManager(app.StatusCache(shared_state.MemoryState(tmp_path / "jobs")), app.plan_restart_job,
+                          app.execute_restart_job, app.get_services_status_batch)
+
+
+def test_overlapping_restart_is_rejected(app, fake_ansible, manager, make_grupo):
+    fake_ansible(hang=['SRV02'])
+    job_id = manager.submit(make_grupo('g1', ['SRV01', 'SRV02']), 'ops@example.com', 'paralelo')
+
+    with pytest.raises(shared_state.RestartConflict, match="este grupo"):
+        manager.submit(make_grupo('g1', ['SRV03']), 'ops@example.com', 'paralelo')
+    with pytest.raises(app.RestartConflict, match="srv02 ya se está reiniciando"):
+        manager.submit(make_grupo('g2', ['SRV02']), 'ops@example.com', 'paralelo')
+    # Un rechazo no deja leases tomados
+    assert manager.store.lease_owner('grupo:g2') is None
+
+    manager.cancel(job_id)
+    assert wait_finished(manager, job_id)['cancelled']
+    assert manager.store.lease_owner('host:srv02') is None
+    job_id = manager.submit(make_grupo('g2', ['SRV02']), 'ops@example.com', 'paralelo')
+    manager.cancel(job_id)
+    wait_finished(manager, job_id)
+
+
+def test_waves_stop_at_failure_threshold(fake_ansible, manager, make_grupo):
+    fake_ansible(fail=['SRV01'])
+    grupo = make_grupo('g1', ['SRV01', 'SRV02', 'SRV03', 'SRV04'], ola=1, umbral_fallos=1, espera_max_segundos=1)
+    job = wait_finished(manager, manager.submit(grupo, 'ops@example.com', 'olas'))
+
+    results = {item['hostname']: item['result'] for item in job['items']}
+    assert results == {'SRV01': 'error', 'SRV02': 'aborted', 'SRV03': 'aborted', 'SRV04': 'aborted'}
+    assert any('Umbral de fallos alcanzado' in message for message in job['messages'])
+
+
+def test_bulk_plan_is_built_from_inventory_entries(app, make_grupo):
+    g1 = make_grupo('g1', ['SRV01', 'SRV02'])
+    g2 = make_grupo('g2', ['SRV02', 'SRV03'])
+    plan = app.build_bulk_grupo([g1, g2])
+
+    assert plan['duplicates'] == 1
+    assert [entry['hostname'] for entry in plan['entries']] == ['SRV01', 'SRV02', 'SRV03']
+    assert [server['hostname'] for server in plan['servers']] == ['SRV01', 'SRV02', 'SRV03']
+    assert app.get_services_summary(plan) == [f"• {h} → Servicio 1" for h in ('SRV01', 'SRV02', 'SRV03')]
+
+
+def test_bulk_plan_uses_the_most_conservative_waves(app, make_grupo):
+    hostnames = [f"SRV{n:02d}" for n in range(8)]
+    cautious = make_grupo('g1', hostnames[:4], ola=3, umbral_fallos='50%')
+    aggressive = make_grupo('g2', hostnames[4:], ola='50%', umbral_fallos=1)
+    plan = app.build_bulk_grupo([aggressive, cautious])
+
+    assert plan['ola'] == 3
+    assert plan['umbral_fallos'] == 1
+
+
+def test_group_missing_from_config_is_rejected(app, manager, make_grupo):
+    g1 = make_grupo('g1', ['SRV01'])
+    stale = {**g1, 'id': 'quitado', 'nombre': 'quitado'}
+    with pytest.raises(app.RestartConflict, match="quitado no está en la configuración"):
+        manager.submit(stale, 'ops@example.com', 'paralelo')
+    plan = app.build_bulk_grupo([g1])
+    plan['grupos'].append('quitado')
+    with pytest.raises(app.RestartConflict, match="quitado"):
+        manager.submit(plan, 'ops@example.com', 'paralelo')
+    assert manager.store.lease_owner('host:srv01') is None
+
+
+def test_poller_fetches_all_hosts_in_one_batch_per_tick(app, monkeypatch):
+    monkeypatch.setattr(status_cache, 'POLLER_JITTER', 0)
+    calls = []
+
+    def fetch(host_services, on_host=None):
+        calls.append(sorted(host_services))
+        return {hostname: {svc: 'running' for svc in services} for hostname, services in host_services.items()}
+
+    poller = app.StatusPoller(app.StatusCache(shared_state.MemoryState()))
+    host_services = {f"SRV{n:02d}": ['Svc1'] for n in range(6)}
+    poller.configure(host_services, 0.3, fetch)
+    time.sleep(1)
+    poller.configure(host_services, 0, fetch)
+
+    assert 2 <= len(calls) <= 5
+    assert all(call == sorted(host_services) for call in calls)
+
+
+class SlowSetEvent(threading.Event):
+    # Agranda la ventana entre leer el evento de cancelación y aplicarla
+    def set(self):
+        time.sleep(0.3)
+        super().set()
+
+
+def test_cancel_while_the_job_is_finishing(fake_ansible, manager, make_grupo, monkeypatch):
+    fake_ansible()
+    errors = []
+    release_leases = manager._release_leases
+
+    def cancel_then_release(job):
+        def cancel():
+            try:
+                manager.cancel(job['id'])
+            except Exception as e:
+                errors.append(e)
+        canceller = threading.Thread(target=cancel)
+        canceller.start()
+        time.sleep(0.1)
+        release_leases(job)
+        finishing.append(canceller)
+
+    finishing = []
+    monkeypatch.setattr(manager, '_release_leases', cancel_then_release)
+    job_id = manager.submit(make_grupo('g1', ['SRV01']), 'ops@example.com', 'paralelo')
+    with manager._lock:
+        manager._cancel_events[job_id] = SlowSetEvent()
+    wait_finished(manager, job_id)
+    deadline = time.time() + 5
+    while not finishing and time.time() < deadline:
+        time.sleep(0.05)
+    finishing[0].join(5)
+
+    assert errors == []
+    job = manager.get(job_id)
+    assert not job['cancelled']
+    assert [item['result'] for item in job['items']] == ['ok']
+
+
+def test_host_counts_once_toward_the_failure_threshold(app, manager, make_grupo, monkeypatch):
+    # SRV01: falla el playbook y además el servicio que sí reinició no vuelve
+    # a Running; sigue siendo un solo servidor con fallos
+    def restart_host(manager, job_id, hostname, services, user_email, grupo_nombre):
+        manager.set_item_result(job_id, hostname, services, 'ok')
+        return hostname != 'SRV01', None
+
+    def verify_running(manager, job_id, targets, max_wait, cancel):
+        return {hostname: services for hostname, services in targets.items() if hostname == 'SRV01' and services}
+
+    monkeypatch.setattr(app, 'restart_host', restart_host)
+    monkeypatch.setattr(app, 'verify_running', verify_running)
+    grupo = make_grupo('g1', ['SRV01', 'SRV02', 'SRV03'], ola=1, umbral_fallos=2)
+    job = wait_finished(manager, manager.submit(grupo, 'ops@example.com', 'olas'))
+
+    assert [item['result'] for item in job['items']] == ['ok', 'ok', 'ok']
+    assert not any('Umbral de fallos alcanzado' in message for message in job['messages'])
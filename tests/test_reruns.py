@@ -0,0 +1,35 @@
+# Streamlit vuelve a ejecutar app.py en cada rerun: las clases del motor
+# viven en módulos importables y se definen una sola vez por proceso
+
+import importlib.util
+import logging
+
+import jobs
+import shared_state
+import status_cache
+from conftest import REPO_DIR
+
+
+def run_script(name):
+    module_spec = importlib.util.spec_from_file_location(name, REPO_DIR / "webapp" / "app.py")
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    return module
+
+
+def test_engine_classes_survive_a_rerun(app):
+    audit_handlers = list(logging.getLogger('rebootwebapp.audit').handlers)
+    first, second = run_script("rerun_1"), run_script("rerun_2")
+    for name in ('JobManager', 'StatusCache', 'StatusLoader', 'StatusPoller', 'InventoryIndex',
+                 'HostHealth', 'StatusHistory', 'TimeoutAdvisor', 'WinRMStatusPool', 'PlaybookCancelled'):
+        assert getattr(first, name) is getattr(second, name) is getattr(app, name), name
+    assert first.metrics is second.metrics
+
+    # Un objeto creado en una ejecución sigue siendo instancia en la siguiente
+    cache = first.StatusCache(shared_state.MemoryState())
+    assert isinstance(cache, second.StatusCache)
+    assert isinstance(first.PlaybookCancelled(), jobs.PlaybookCancelled)
+    assert second.StatusPoller is status_cache.StatusPoller
+
+    # Los handlers de auditoría no se duplican entre ejecuciones
+    assert logging.getLogger('rebootwebapp.audit').handlers == audit_handlers
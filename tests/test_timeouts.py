@@ -0,0 +1,47 @@
+# Timeouts adaptativos: qué duraciones se aprenden y a qué se aplican
+
+import time
+
+import status_history
+
+
+def test_status_durations_exclude_fork_queue_wait(app, fake_ansible, monkeypatch):
+    # Con un solo fork los hosts esperan su turno; cada uno debe registrar
+    # solo su propia consulta
+    monkeypatch.setenv('BENCH_LATENCY', '0.3')
+    monkeypatch.setattr(app, 'STATUS_FORKS', 1)
+    hostnames = ['SRV01', 'SRV02', 'SRV03']
+    status = app.get_services_status_batch({hostname: ['Svc1', 'Svc2'] for hostname in hostnames})
+    assert all(host_status == {'Svc1': 'running', 'Svc2': 'running'} for host_status in status.values())
+
+    advisor = app.get_timeout_advisor()
+    for hostname in hostnames:
+        [seconds] = advisor._window(('status', hostname.lower(), ''))
+        assert 0.25 < seconds < 0.5
+
+
+def test_status_batch_timeout_scales_with_services_per_host(app, fake_ansible, monkeypatch):
+    # El timeout aprendido es por servicio: el corte del lote lo multiplica
+    # por la cantidad de servicios del host
+    observed = {}
+    monkeypatch.setattr(app.metrics, 'observe',
+                        lambda name, value, **labels: observed.setdefault((name, labels.get('operation')), value))
+    advisor = app.get_timeout_advisor()
+    for _ in range(status_history.TIMEOUT_MIN_SAMPLES):
+        advisor.record('status', 'SRV01', 1.0)
+    assert advisor.timeout('status', 'SRV01') == app.STATUS_TIMEOUT_FLOOR
+
+    app.get_services_status_batch({'SRV01': ['Svc1', 'Svc2', 'Svc3']})
+    expected = app.STATUS_TIMEOUT_FLOOR * 3 + app.STATUS_TIMEOUT_MARGIN
+    assert observed[('rebootwebapp_timeout_seconds', 'status')] == min(expected, app.STATUS_TIMEOUT)
+
+
+def test_history_keeps_only_the_samples_the_advisor_reads(app, tmp_path):
+    history = app.StatusHistory(tmp_path / "historial.db")
+    now = time.time()
+    history._flush([('duration', 'SRV01', '', now + n, 'status', float(n)) for n in range(status_history.TIMEOUT_SAMPLES + 30)])
+    history._flush([('duration', 'SRV02', 'Svc1', now, 'restart', 5.0)])
+
+    kept = history.durations('SRV01', '', 'status', status_history.TIMEOUT_SAMPLES * 2)
+    assert sorted(kept) == [float(n) for n in range(30, status_history.TIMEOUT_SAMPLES + 30)]
+    assert history.durations('SRV02', 'Svc1', 'restart', status_history.TIMEOUT_SAMPLES) == [5.0]
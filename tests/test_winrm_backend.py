@@ -0,0 +1,67 @@
+# Backend de estado WinRM contra el endpoint WS-Man falso (bench/fake_winrm.py)
+
+import subprocess
+
+import pytest
+
+from fake_winrm import FakeWinRM, start_server
+
+
+@pytest.fixture
+def winrm_endpoint():
+    fake = FakeWinRM({'Svc2': 'Stopped', 'Svc3': 'StartPending', 'Svc4': 'Missing'}, 'rb', 'secreto')
+    server = start_server(fake)
+    yield fake, f"http://127.0.0.1:{server.server_port}/wsman"
+    server.shutdown()
+    server.server_close()
+
+
+def write_credentials(path, user='rb', password='secreto'):
+    path.write_text(f"ansible_user: {user}\nansible_password: {password}\n")
+    return path
+
+
+def test_status_through_fake_endpoint(app, winrm_endpoint, tmp_path):
+    fake, endpoint = winrm_endpoint
+    pool = app.WinRMStatusPool(endpoint, 'basic', write_credentials(tmp_path / "windows.yml"), validate_cert=False)
+    services = ['Svc1', 'Svc2', 'Svc3', 'Svc4']
+
+    status = pool.get_status({'SERVER01': services, 'SERVER02': ['Svc1']})
+
+    assert status['SERVER01'] == {'Svc1': 'running', 'Svc2': 'stopped', 'Svc3': 'start_pending', 'Svc4': 'unknown'}
+    assert status['SERVER02'] == {'Svc1': 'running'}
+    # La segunda consulta reutiliza el shell abierto
+    pool.get_host_status('SERVER01', services)
+    assert fake.requests.count('Create') == 2
+
+
+def test_rejected_credentials_mark_hosts_as_error(app, winrm_endpoint, tmp_path):
+    _, endpoint = winrm_endpoint
+    pool = app.WinRMStatusPool(endpoint, 'basic', write_credentials(tmp_path / "windows.yml", password='otra'),
+                               validate_cert=False)
+    assert pool.get_host_status('SERVER01', ['Svc1']) == {'Svc1': 'error'}
+
+
+def test_vaulted_credentials_without_password_file_fail_on_creation(app, tmp_path, monkeypatch):
+    monkeypatch.delenv('ANSIBLE_VAULT_PASSWORD_FILE', raising=False)
+    path = tmp_path / "windows.yml"
+    path.write_text("ansible_user: rb\nansible_password: !vault |\n  $ANSIBLE_VAULT;1.1;AES256\n  3031\n")
+    with pytest.raises(ValueError, match="vault_password_file"):
+        app.WinRMStatusPool("http://127.0.0.1:1/wsman", 'basic', path)
+
+
+def test_vaulted_credentials_are_decrypted(app, winrm_endpoint, tmp_path):
+    pytest.importorskip('ansible.parsing.vault')
+    _, endpoint = winrm_endpoint
+    password_file = tmp_path / "vault-pass"
+    password_file.write_text("clave-vault\n")
+    encrypted = subprocess.run(
+        ['ansible-vault', 'encrypt_string', '--vault-password-file', str(password_file), 'secreto',
+         '--name', 'ansible_password'],
+        capture_output=True, text=True, check=True
+    ).stdout
+    path = tmp_path / "windows.yml"
+    path.write_text("ansible_user: rb\n" + encrypted)
+
+    pool = app.WinRMStatusPool(endpoint, 'basic', path, validate_cert=False, vault_password_file=str(password_file))
+    assert pool.get_host_status('SERVER01', ['Svc2']) == {'Svc2': 'stopped'}
@@ -0,0 +1,215 @@
+# /opt/rebootwebapp/ansible_runner.py
+# Runner de Ansible con estado precargado para RebootWebApp
+#
+# Carga una sola vez los módulos de Ansible, los plugins usados por los
+# playbooks y el inventario, y atiende pedidos de ejecución por un socket Unix.
+# Cada pedido se ejecuta en un proceso hijo (fork) que hereda ese estado, así
+# no se paga el arranque del intérprete ni la carga de Ansible en cada llamada.
+#
+# Protocolo: un pedido por conexión
+#   -> {"playbook", "inventory", "extra_vars", "forks", "timeout"}
+#   <- eventos del callback rebootwebapp_events, una línea JSON cada uno, a
+#      medida que ocurren
+#   <- {"runner_exit": true, "rc", "stderr", "timed_out", "cancelled"}
+# Si el cliente cierra la conexión antes de terminar, la ejecución se cancela.
+
+import argparse
+import json
+import os
+import select
+import signal
+import socketserver
+import sys
+import tempfile
+import time
+import traceback
+
+DEFAULT_SOCKET = "/run/rebootwebapp/ansible-runner.sock"
+DEFAULT_INVENTORY = "/opt/ansible/inventories/prod/hosts"
+DEFAULT_CALLBACK_PLUGINS = "/opt/ansible/playbooks/windows/callback_plugins"
+EVENTS_CALLBACK = "rebootwebapp_events"
+DEFAULT_WORKERS = 8
+DEFAULT_TIMEOUT = 300
+
+WARM = {}
+
+
+def warm_up(inventory_path):
+    from ansible.parsing.dataloader import DataLoader
+    from ansible.inventory.manager import InventoryManager
+    from ansible.cli.playbook import PlaybookCLI  # noqa: F401 - precarga
+    try:
+        from ansible.plugins.loader import init_plugin_loader
+        init_plugin_loader([])
+    except ImportError:
+        pass
+    from ansible.plugins.loader import callback_loader, connection_loader, module_loader
+
+    connection_loader.get('winrm', class_only=True)
+    callback_loader.get(EVENTS_CALLBACK, class_only=True)
+    for module in ('ansible.windows.win_service', 'ansible.windows.win_service_info'):
+        module_loader.find_plugin(module)
+
+    loader = DataLoader()
+    WARM['loader'] = loader
+    WARM['inventory_path'] = inventory_path
+    WARM['inventory'] = InventoryManager(loader=loader, sources=[inventory_path])
+    WARM['inventory_mtime'] = os.path.getmtime(inventory_path)
+
+
+def refresh_inventory():
+    mtime = os.path.getmtime(WARM['inventory_path'])
+    if mtime != WARM['inventory_mtime']:
+        WARM['inventory'].refresh_inventory()
+        WARM['inventory_mtime'] = mtime
+
+
+def run_playbook(request):
+    from ansible.cli import CLI
+    from ansible.cli.playbook import PlaybookCLI
+    from ansible.vars.manager import VariableManager
+
+    args = [
+        'ansible-playbook', request['playbook'],
+        '-i', request['inventory'],
+        '-e', json.dumps(request['extra_vars'])
+    ]
+    if request.get('forks'):
+        args += ['-f', str(request['forks'])]
+
+    cli_class = PlaybookCLI
+    if request['inventory'] == WARM['inventory_path']:
+        # Reutiliza loader e inventario precargados; las variables se arman
+        # por pedido porque dependen de los extra vars
+        class WarmPlaybookCLI(PlaybookCLI):
+            @staticmethod
+            def _play_prereqs():
+                variable_manager = VariableManager(
+                    loader=WARM['loader'],
+                    inventory=WARM['inventory'],
+                    version_info=CLI.version_info(gitinfo=False)
+                )
+                return WARM['loader'], WARM['inventory'], variable_manager
+        cli_class = WarmPlaybookCLI
+
+    return cli_class(args).run()
+
+
+def execute(request, conn):
+    timeout = request.get('timeout') or DEFAULT_TIMEOUT
+    with tempfile.TemporaryFile() as err:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Grupo de procesos propio para poder matar también los forks de Ansible
+            os.setpgid(0, 0)
+            os.close(read_fd)
+            os.dup2(write_fd, 1)
+            os.dup2(err.fileno(), 2)
+            rc = 250
+            try:
+                rc = run_playbook(request)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(rc if isinstance(rc, int) else 250)
+        os.close(write_fd)
+
+        # Reenvía la salida al cliente a medida que llega; si el cliente se
+        # desconecta o vence el timeout se mata el grupo de procesos
+        deadline = time.monotonic() + timeout
+        timed_out = cancelled = False
+        while True:
+            ready, _, _ = select.select([read_fd, conn], [], [], 0.5)
+            if read_fd in ready:
+                chunk = os.read(read_fd, 65536)
+                if not chunk:
+                    break
+                try:
+                    conn.sendall(chunk)
+                except OSError:
+                    cancelled = True
+            if conn in ready and not cancelled:
+                try:
+                    cancelled = not conn.recv(1)
+                except OSError:
+                    cancelled = True
+            if not cancelled and time.monotonic() > deadline:
+                timed_out = True
+            if cancelled or timed_out:
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                break
+        os.close(read_fd)
+        _, status = os.waitpid(pid, 0)
+        rc = os.waitstatus_to_exitcode(status)
+
+        err.seek(0)
+        return {
+            'runner_exit': True,
+            'rc': rc,
+            'stderr': err.read().decode('utf-8', errors='replace'),
+            'timed_out': timed_out,
+            'cancelled': cancelled
+        }
+
+
+class RunnerHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = execute(request, self.connection)
+        except Exception as e:
+            response = {'runner_exit': True, 'rc': 250, 'stderr': f"Error en runner: {e}",
+                        'timed_out': False, 'cancelled': False}
+        if response['cancelled']:
+            return
+        # Salto de línea previo por si la última salida quedó sin terminar
+        self.wfile.write(b'\n' + json.dumps(response).encode('utf-8') + b'\n')
+
+
+class RunnerServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    # Cada conexión se atiende en un fork del proceso precargado; max_children
+    # limita las ejecuciones simultáneas
+
+    def process_request(self, request, client_address):
+        try:
+            refresh_inventory()
+        except Exception as e:
+            print(f"Error recargando inventario: {e}", file=sys.stderr)
+        super().process_request(request, client_address)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runner de Ansible precargado para RebootWebApp")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    parser.add_argument("--inventory", default=DEFAULT_INVENTORY)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--callback-plugins", default=DEFAULT_CALLBACK_PLUGINS)
+    args = parser.parse_args()
+
+    # Deben definirse antes de importar Ansible
+    os.environ['ANSIBLE_STDOUT_CALLBACK'] = EVENTS_CALLBACK
+    os.environ['ANSIBLE_CALLBACK_PLUGINS'] = args.callback_plugins
+    warm_up(args.inventory)
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    server = RunnerServer(args.socket, RunnerHandler)
+    server.max_children = args.workers
+    os.chmod(args.socket, 0o660)
+    print(f"Runner de Ansible escuchando en {args.socket} ({args.workers} workers)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
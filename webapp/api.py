@@ -0,0 +1,286 @@
+# /opt/rebootwebapp/api.py
+# API HTTP sin UI para RebootWebApp
+#
+# Expone estado y reinicios en JSON para monitoreo y runbooks, sin sesión de
+# Streamlit. Usa el mismo motor que la UI (cache de estado, JobManager,
+# leases) importando app.py, y se comporta como una réplica más: para lanzar
+# reinicios requiere estado_compartido con backend sqlite o redis.
+#
+# Autenticación: "Authorization: Bearer <token>"; los tokens se definen (como
+# hash SHA-256) en config/api.yml, con permisos "estado" y/o "reinicio".
+#
+#   GET  /api/v1/status[?host=H|grupo=G][&max_age=S][&force=1]
+#   GET  /api/v1/services[?q=texto][&grupo=G][&estado=stopped,unreachable]   búsqueda en el inventario
+#   POST /api/v1/restart          {"grupo": G} | {"grupos": [...], "servicios": [[H, S], ...]}, "modo"
+#   GET  /api/v1/jobs/<id>[?since=N][&wait=S]   long-poll: responde al haber mensajes nuevos o al terminar
+#   POST /api/v1/jobs/<id>/cancel
+
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+os.environ.setdefault('REBOOTWEBAPP_REPLICA', f"{os.uname().nodename}-api")
+sys.path.insert(0, str(Path(__file__).parent))
+import app  # noqa: E402
+
+API_CONFIG_PATH = Path(__file__).parent / "config" / "api.yml"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8600
+LONG_POLL_MAX_SECONDS = 60
+LONG_POLL_INTERVAL = 0.5
+MAX_BODY_BYTES = 64 * 1024
+API_PERMISSIONS = ('estado', 'reinicio')
+
+logger = logging.getLogger('rebootwebapp.api')
+
+
+class APIError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def validate_api_config(api_config):
+    if not isinstance(api_config, dict) or not isinstance(api_config.get('tokens'), list):
+        raise ValueError("falta la lista 'tokens'")
+    for token in api_config['tokens']:
+        for key in ('nombre', 'sha256', 'permisos'):
+            if not token.get(key):
+                raise ValueError(f"token {token.get('nombre', '?')}: falta la clave '{key}'")
+        unknown = set(token['permisos']) - set(API_PERMISSIONS)
+        if unknown:
+            raise ValueError(f"token {token['nombre']}: permisos desconocidos {sorted(unknown)}")
+
+
+def authenticate(header, permission):
+    # Devuelve el nombre del token; se compara el hash en tiempo constante
+    if not header or not header.startswith('Bearer '):
+        raise APIError(401, "falta el token (Authorization: Bearer ...)")
+    digest = hashlib.sha256(header[7:].strip().encode('utf-8')).hexdigest()
+    tokens = app.get_config_store().load(API_CONFIG_PATH, validate_api_config)['tokens']
+    for token in tokens:
+        if hmac.compare_digest(digest, token['sha256'].lower()):
+            if permission not in token['permisos']:
+                raise APIError(403, f"el token no tiene permiso de {permission}")
+            return token['nombre']
+    raise APIError(401, "token inválido")
+
+
+def find_grupo(grupo_id):
+    grupo = app.get_inventory().grupo(grupo_id)
+    if grupo is None:
+        raise APIError(404, f"grupo desconocido: {grupo_id}")
+    return grupo
+
+
+def get_status(params):
+    config = app.load_config()
+    inventory = app.get_inventory()
+    if 'grupo' in params:
+        host_services = inventory.host_services(find_grupo(params['grupo'])['id'])
+    elif 'host' in params:
+        host_services = app.get_host_services(inventory.servers_for_host(params['host']))
+        if not host_services:
+            raise APIError(404, f"servidor desconocido: {params['host']}")
+    else:
+        host_services = inventory.host_services()
+    ttl = float(params.get('max_age', config.get('cache_estado_segundos', app.STATUS_CACHE_TTL)))
+    force = params.get('force') in ('1', 'true')
+    status = {}
+    if host_services:
+        status = app.get_status_cache().get_many(host_services, ttl, force, app.get_status_fetcher(config))
+    return {'ts': time.time(), 'hosts': status}
+
+
+def search_services(params):
+    # El filtro de estado usa lo que haya en cache, sin consultar
+    inventory = app.get_inventory()
+    grupo_ids = [find_grupo(params['grupo'])['id']] if 'grupo' in params else None
+    states = [state for state in params.get('estado', '').split(',') if state]
+    unknown = set(states) - set(app.STATE_FILTERS)
+    if unknown:
+        raise APIError(400, f"estados desconocidos: {sorted(unknown)}")
+    status, _, _ = app.get_status_cache().peek(inventory.host_services())
+    return {'services': [
+        {
+            'grupo': entry['grupo_id'],
+            'hostname': entry['hostname'],
+            'display_name': entry['display_name'],
+            'service_name': entry['service_name'],
+            'service_display': entry['service_display'],
+            'state': status.get(entry['hostname'], {}).get(entry['service_name'])
+        }
+        for entry in inventory.search(params.get('q', ''), grupo_ids, states, status)
+    ]}
+
+
+def submit_restart(body, token_name):
+    config = app.load_config()
+    if (config.get('estado_compartido') or {}).get('backend', 'memoria') == 'memoria':
+        raise APIError(503, "los reinicios por API requieren estado_compartido con backend sqlite o redis")
+    mode = body.get('modo', 'paralelo')
+    if mode not in app.RESTART_MODES:
+        raise APIError(400, f"modo desconocido: {mode}")
+    if body.get('grupo') and not body.get('servicios'):
+        grupo = find_grupo(body['grupo'])
+    else:
+        grupos = [find_grupo(grupo_id) for grupo_id in (body.get('grupos') or [body.get('grupo')]) if grupo_id]
+        if not grupos:
+            raise APIError(400, "indicar 'grupo' o 'grupos'")
+        pairs = None
+        if body.get('servicios'):
+            pairs = {(hostname, service) for hostname, service in body['servicios']}
+        grupo = app.build_bulk_grupo(grupos, pairs)
+        if not grupo['servers']:
+            raise APIError(400, "la selección no incluye servicios de los grupos indicados")
+
+    manager = app.get_job_manager()
+    app.configure_background_status(config)
+    try:
+        job_id = manager.submit(grupo, f"api:{token_name}", mode)
+    except app.RestartConflict as e:
+        raise APIError(409, str(e))
+    logger.info(f"REINICIO API | Token: {token_name} | Grupo: {grupo['nombre']} | Trabajo: {job_id}")
+    return {'job_id': job_id}
+
+
+def job_view(job, since):
+    return {
+        'id': job['id'],
+        'status': job['status'],
+        'grupo': job['grupo_nombre'],
+        'mode': job['mode'],
+        'user': job['user'],
+        'created': job['created'],
+        'started': job['started'],
+        'finished': job['finished'],
+        'cancelled': job['cancelled'],
+        'label': job['label'],
+        'items': [
+            {key: item.get(key) for key in ('hostname', 'service_name', 'result', 'verified', 'time_to_running')}
+            for item in job['items']
+        ],
+        'messages': job['messages'][since:],
+        'next': len(job['messages'])
+    }
+
+
+def get_job(job_id, params):
+    # Long-poll: espera hasta que haya mensajes después de `since`, el
+    # trabajo termine o venza `wait`
+    manager = app.get_job_manager()
+    since = int(params.get('since', 0))
+    deadline = time.monotonic() + min(float(params.get('wait', 0)), LONG_POLL_MAX_SECONDS)
+    while True:
+        job = manager.get(job_id)
+        if job is None:
+            raise APIError(404, f"trabajo desconocido: {job_id}")
+        finished = job['status'] not in ('queued', 'running')
+        if finished or len(job['messages']) > since or time.monotonic() >= deadline:
+            return job_view(job, since)
+        time.sleep(LONG_POLL_INTERVAL)
+
+
+def cancel_job(job_id, token_name):
+    manager = app.get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        raise APIError(404, f"trabajo desconocido: {job_id}")
+    manager.cancel(job_id)
+    logger.info(f"CANCELACION API | Token: {token_name} | Trabajo: {job_id}")
+    return {'job_id': job_id, 'cancel_requested': True}
+
+
+class APIHandler(BaseHTTPRequestHandler):
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise APIError(413, "cuerpo demasiado grande")
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            raise APIError(400, "el cuerpo no es JSON válido")
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split('/') if part]
+        auth = self.headers.get('Authorization')
+        try:
+            if parts[:2] != ['api', 'v1']:
+                raise APIError(404, "ruta desconocida")
+            route = parts[2:]
+            if method == 'GET' and route == ['status']:
+                authenticate(auth, 'estado')
+                return self._send(200, get_status(params))
+            if method == 'GET' and route == ['services']:
+                authenticate(auth, 'estado')
+                return self._send(200, search_services(params))
+            if method == 'POST' and route == ['restart']:
+                token_name = authenticate(auth, 'reinicio')
+                return self._send(202, submit_restart(self._body(), token_name))
+            if method == 'GET' and len(route) == 2 and route[0] == 'jobs':
+                authenticate(auth, 'estado')
+                return self._send(200, get_job(route[1], params))
+            if method == 'POST' and len(route) == 3 and route[0] == 'jobs' and route[2] == 'cancel':
+                token_name = authenticate(auth, 'reinicio')
+                return self._send(200, cancel_job(route[1], token_name))
+            raise APIError(404, "ruta desconocida")
+        except APIError as e:
+            self._send(e.status, {'error': str(e)})
+        except (ValueError, TypeError) as e:
+            self._send(400, {'error': f"parámetros inválidos: {e}"})
+        except Exception as e:
+            logger.error(f"Error en API {method} {url.path}: {e}")
+            self._send(500, {'error': "error interno"})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP de RebootWebApp")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    # Valida la configuración al arrancar en lugar de en el primer pedido
+    app.get_config_store().load(API_CONFIG_PATH, validate_api_config)
+    # El sondeo automático arranca con la API, igual que en una réplica de la UI
+    app.configure_background_status(app.load_config())
+    server = ThreadingHTTPServer((args.host, args.port), APIHandler)
+    server.daemon_threads = True
+    logger.info(f"API escuchando en http://{args.host}:{args.port} (réplica {app.REPLICA_ID})")
+    print(f"API escuchando en http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
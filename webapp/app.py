@@ -6,25 +6,79 @@ import streamlit as st
 import subprocess
 import yaml
 import json
+import hashlib
+import heapq
 import logging
-import re
-import msal
-import requests
+import math
+import os
+import signal
+import socket
+import threading
 import time
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from audit_log import build_audit_handlers, query_audit
+from host_health import HostHealth, winrm_port
+from inventory import RUNNING_STATES, STATE_FILTERS, InventoryIndex, get_host_services
+from jobs import JobManager, PlaybookCancelled
+from shared_state import REPLICA_ID, MemoryState, RedisState, RestartConflict, SQLiteState
+from status_cache import StatusCache, StatusLoader, StatusPoller
+from status_history import HISTORY_DAY, HISTORY_RAW_RETENTION_DAYS, StatusHistory, TimeoutAdvisor
+from telemetry import metrics, serve_metrics
+from winrm_status import WinRMStatusPool
+
 # --- Configuración ---
 CONFIG_PATH = Path(__file__).parent / "config" / "services_windows.yml"
 AUTH_CONFIG_PATH = Path(__file__).parent / "config" / "azure_auth.yml"
 PLAYBOOK_RESTART = "/opt/ansible/playbooks/windows/restart_services.yml"
 PLAYBOOK_STATUS = "/opt/ansible/playbooks/windows/check_services.yml"
 INVENTORY_PATH = "/opt/ansible/inventories/prod/hosts"
+ANSIBLE_RUNNER_SOCKET = "/run/rebootwebapp/ansible-runner.sock"
+ANSIBLE_CALLBACK_PLUGINS_PATH = "/opt/ansible/playbooks/windows/callback_plugins"
+ANSIBLE_EVENTS_CALLBACK = "rebootwebapp_events"
 LOG_PATH = Path(__file__).parent / "logs" / "reinicios.log"
+AUDIT_LOG_PATH = Path(__file__).parent / "logs" / "auditoria.jsonl"
+AUDIT_DB_PATH = Path(__file__).parent / "logs" / "auditoria.db"
 LOGO_PATH = Path(__file__).parent / "static" / "logo.png"
+JOBS_PATH = Path(__file__).parent / "jobs"
+STATE_DB_PATH = Path(__file__).parent / "state" / "estado.db"
+STATE_REDIS_URL = "redis://localhost:6379/0"
+JOB_RETENTION_DAYS = 30
+HISTORY_DB_PATH = Path(__file__).parent / "state" / "historial.db"
 ANSIBLE_TIMEOUT = 300
+RESTART_TASK_TIMEOUT = 180
+RESTART_TIMEOUT_FLOOR = 30
+RESTART_TIMEOUT_MARGIN = 60
 SEQUENTIAL_WAIT_SECONDS = 60
+HEALTH_POLL_SECONDS = 2
+HEALTH_POLL_BACKOFF = 1.5
+HEALTH_POLL_MAX_SECONDS = 15
+RESTART_CONCURRENCY = 4
+BULK_GRUPO_ID = "masivo"
+STATUS_CACHE_TTL = 30
+STATUS_TIMEOUT = 60
+STATUS_TASK_TIMEOUT = 30
+STATUS_TIMEOUT_FLOOR = 10
+STATUS_TIMEOUT_MARGIN = 15
+STATUS_FORKS = 25
+STATUS_UI_POLL_SECONDS = 2
+STATUS_TABLE_MAX_ROWS = 40
+STATUS_GRID_HEIGHT = 600
+STATUS_COLUMN = 2
+STATUS_TASK_NAME = "Obtener estado de servicios"
+RESTART_TASK_NAME = "Reiniciar servicios solicitados"
+WINRM_ENDPOINT = "http://{hostname}:5985/wsman"
+WINRM_CREDENTIALS_PATH = "/opt/ansible/inventories/prod/group_vars/windows.yml"
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+GRAPH_TIMEOUT = 10
+AUTH_CACHE_TTL = 600
+AUTH_DENIED_CACHE_TTL = 60
+AUDIT_STDERR_TAIL = 2000
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464
+STREAMLIT_BASE_PORT = 8501
 
 # --- Configurar logging ---
 LOG_PATH.parent.mkdir(exist_ok=True)
@@ -37,20 +91,238 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# --- Log de auditoría estructurado ---
+# Líneas JSON por réplica más un índice SQLite (ver audit_log.py)
+audit_logger = logging.getLogger('rebootwebapp.audit')
+if not audit_logger.handlers:
+    audit_logger.propagate = False
+    audit_logger.setLevel(logging.INFO)
+    for handler in build_audit_handlers(AUDIT_LOG_PATH, AUDIT_DB_PATH, os.environ.get('REBOOTWEBAPP_REPLICA')):
+        audit_logger.addHandler(handler)
+
+
+def audit(event, **fields):
+    record = {'ts': datetime.now().isoformat(timespec='seconds'), 'event': event}
+    record.update(fields)
+    audit_logger.info(event, extra={'audit': record})
+
+
+# --- Métricas ---
+# Una instancia de Metrics por proceso (telemetry.py), expuesta en formato
+# Prometheus en http://METRICS_HOST:METRICS_PORT/metrics.
+@st.cache_resource
+def start_metrics_server(host=METRICS_HOST, port=None):
+    if port is None:
+        # Con varias réplicas cada una usa METRICS_PORT + (puerto de Streamlit - 8501)
+        port = METRICS_PORT + st.get_option('server.port') - STREAMLIT_BASE_PORT
+    return serve_metrics(host, port)
+
+
+# ============================================================================
+# CONFIG FILES
+# ============================================================================
+
+# Los YAML se cargan y validan una vez por proceso y se recargan solo cuando
+# cambia el archivo (mtime/tamaño y luego hash). Si una recarga no pasa la
+# validación se sigue usando la última versión válida.
+class ConfigStore:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def load(self, path, validate):
+        path = Path(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            stat = path.stat()
+            stat_key = (stat.st_mtime_ns, stat.st_size)
+            if entry and entry['stat'] == stat_key:
+                return entry['data']
+            
+            raw = path.read_bytes()
+            digest = hashlib.sha256(raw).hexdigest()
+            if entry and entry['hash'] == digest:
+                entry['stat'] = stat_key
+                return entry['data']
+            
+            try:
+                data = yaml.safe_load(raw)
+                validate(data)
+            except Exception as e:
+                if not entry:
+                    raise
+                logger.error(f"Configuración inválida en {path.name}, se mantiene la versión anterior: {e}")
+                entry['stat'] = stat_key
+                entry['error'] = str(e)
+                return entry['data']
+            
+            if entry:
+                logger.info(f"Configuración recargada: {path.name}")
+            self._entries[path] = {'stat': stat_key, 'hash': digest, 'data': data, 'error': None}
+            return data
+
+    def version(self, path):
+        with self._lock:
+            entry = self._entries.get(Path(path))
+            return entry['hash'][:12] if entry else None
+
+    def last_error(self, path):
+        with self._lock:
+            entry = self._entries.get(Path(path))
+            return entry['error'] if entry else None
+
+
+@st.cache_resource
+def get_config_store():
+    return ConfigStore()
+
+
+def validate_auth_config(auth_config):
+    if not isinstance(auth_config, dict):
+        raise ValueError("el archivo no contiene un diccionario")
+    for key in ('client_id', 'tenant_id', 'client_secret', 'redirect_uri', 'scope', 'authorized_group_id'):
+        if not auth_config.get(key):
+            raise ValueError(f"falta la clave '{key}'")
+    if not isinstance(auth_config['scope'], list):
+        raise ValueError("'scope' debe ser una lista")
+
+
+def validate_config(config):
+    if not isinstance(config, dict) or not isinstance(config.get('grupos'), list):
+        raise ValueError("falta la lista 'grupos'")
+    shared = config.get('estado_compartido') or {}
+    if shared.get('backend', 'memoria') not in ('memoria', 'sqlite', 'redis'):
+        raise ValueError(f"estado_compartido.backend desconocido: {shared['backend']}")
+    retention = shared.get('retencion_trabajos_dias', JOB_RETENTION_DAYS)
+    if not isinstance(retention, (int, float)) or retention <= 0:
+        raise ValueError("estado_compartido.retencion_trabajos_dias debe ser un número positivo")
+    grupo_ids = set()
+    for grupo in config['grupos']:
+        for key in ('id', 'nombre', 'icono', 'nombre_operacion', 'servers'):
+            if key not in grupo:
+                raise ValueError(f"grupo {grupo.get('id', '?')}: falta la clave '{key}'")
+        if grupo['id'] in grupo_ids:
+            raise ValueError(f"id de grupo duplicado: {grupo['id']}")
+        if grupo['id'] == BULK_GRUPO_ID:
+            raise ValueError(f"el id de grupo '{BULK_GRUPO_ID}' está reservado para el reinicio masivo")
+        grupo_ids.add(grupo['id'])
+        for server in grupo['servers']:
+            for key in ('hostname', 'display_name', 'services'):
+                if key not in server:
+                    raise ValueError(f"grupo {grupo['id']}: servidor sin '{key}'")
+            for svc in server['services']:
+                if 'name' not in svc or 'display_name' not in svc:
+                    raise ValueError(f"grupo {grupo['id']}, {server['hostname']}: servicio sin 'name'/'display_name'")
+                timeout = svc.get('timeout_segundos')
+                if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+                    raise ValueError(f"grupo {grupo['id']}, {server['hostname']}, {svc['name']}: "
+                                     f"timeout_segundos debe ser un número positivo")
+                settle = svc.get('espera_adicional_segundos', 0)
+                if not isinstance(settle, (int, float)) or isinstance(settle, bool) or settle < 0:
+                    raise ValueError(f"grupo {grupo['id']}, {server['hostname']}, {svc['name']}: "
+                                     f"espera_adicional_segundos debe ser un número no negativo")
+        # depende_de: servicios del mismo grupo, por nombre o "hostname/servicio"
+        # (como los resuelve order_by_dependencies)
+        names = set()
+        for server in grupo['servers']:
+            for svc in server['services']:
+                names.update((svc['name'], f"{server['hostname']}/{svc['name']}"))
+        for server in grupo['servers']:
+            for svc in server['services']:
+                deps = svc.get('depende_de', [])
+                if not isinstance(deps, list) or not all(isinstance(dep, str) for dep in deps):
+                    raise ValueError(f"grupo {grupo['id']}, {server['hostname']}, {svc['name']}: "
+                                     f"depende_de debe ser una lista de nombres de servicio")
+                unknown = [dep for dep in deps if dep not in names]
+                if unknown:
+                    raise ValueError(f"grupo {grupo['id']}, {server['hostname']}, {svc['name']}: "
+                                     f"depende_de incluye servicios que no están en el grupo: {', '.join(unknown)}")
+
+
+# ============================================================================
+# SHARED STATE
+# ============================================================================
+
+# Cache de estado, trabajos, cancelaciones y leases compartidos entre réplicas;
+# las implementaciones (memoria, sqlite, redis) están en shared_state.py
+
+def build_state_store(settings):
+    backend = settings.get('backend', 'memoria')
+    job_retention = settings.get('retencion_trabajos_dias', JOB_RETENTION_DAYS) * 86400
+    if backend == 'sqlite':
+        return SQLiteState(settings.get('ruta', STATE_DB_PATH), job_retention)
+    if backend == 'redis':
+        return RedisState(settings.get('url', STATE_REDIS_URL), job_retention)
+    return MemoryState(JOBS_PATH, job_retention)
+
+
+@st.cache_resource
+def get_state_store():
+    # Se elige una vez por proceso; cambiar de backend requiere reiniciar
+    try:
+        settings = load_config().get('estado_compartido') or {}
+    except Exception as e:
+        logger.error(f"Error leyendo estado_compartido, se usa memoria: {e}")
+        settings = {}
+    logger.info(f"Estado compartido: {settings.get('backend', 'memoria')} (réplica {REPLICA_ID})")
+    return build_state_store(settings)
+
+
+# ============================================================================
+# STATUS HISTORY
+# ============================================================================
+
+# Serie temporal local de estados y reinicios y duraciones de cada consulta y
+# reinicio para los timeouts adaptativos (ver status_history.py)
+
+@st.cache_resource
+def get_status_history():
+    return StatusHistory(HISTORY_DB_PATH)
+
+
+# --- Timeouts adaptativos ---
+# Piso, techo y valor sin historial de cada operación; el cálculo por
+# servidor y servicio lo hace TimeoutAdvisor (status_history.py)
+def timeout_limits(operation):
+    # (sin historial, piso, techo) en segundos
+    if operation == 'status':
+        return STATUS_TASK_TIMEOUT, STATUS_TIMEOUT_FLOOR, STATUS_TIMEOUT
+    ceiling = max(RESTART_TIMEOUT_FLOOR, ANSIBLE_TIMEOUT - RESTART_TIMEOUT_MARGIN)
+    return RESTART_TASK_TIMEOUT, RESTART_TIMEOUT_FLOOR, ceiling
+
+
+@st.cache_resource
+def get_timeout_advisor():
+    return TimeoutAdvisor(timeout_limits, get_status_history())
+
+
 # ============================================================================
 # AZURE AD AUTHENTICATION
 # ============================================================================
 
 def load_auth_config():
-    with open(AUTH_CONFIG_PATH, 'r') as f:
-        return yaml.safe_load(f)
+    return get_config_store().load(AUTH_CONFIG_PATH, validate_auth_config)
 
 
-def get_msal_app(auth_config):
+@st.cache_resource
+def build_msal_app(client_id, authority, client_secret):
+    # Un solo cliente MSAL por proceso, compartido entre sesiones (evita
+    # repetir el discovery de la authority en cada login). Los tokens solo se
+    # usan en el login, para las consultas a Graph de authorize_user
+    import msal
     return msal.ConfidentialClientApplication(
+        client_id,
+        authority=authority,
+        client_credential=client_secret
+    )
+
+
+def get_msal_app(auth_config):
+    return build_msal_app(
         auth_config['client_id'],
-        authority=f"https://login.microsoftonline.com/{auth_config['tenant_id']}",
-        client_credential=auth_config['client_secret']
+        f"https://login.microsoftonline.com/{auth_config['tenant_id']}",
+        auth_config['client_secret']
     )
 
 
@@ -69,30 +341,96 @@ def get_token_from_code(auth_config, msal_app, code):
     )
 
 
+@st.cache_resource
+def get_graph_session():
+    # Sesión HTTP compartida: reutiliza conexiones TLS con Graph entre logins
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504), allowed_methods=None)
+    session.mount('https://', HTTPAdapter(pool_maxsize=16, max_retries=retry))
+    return session
+
+
 def get_user_info(access_token):
     headers = {'Authorization': f'Bearer {access_token}'}
-    response = requests.get('https://graph.microsoft.com/v1.0/me', headers=headers)
+    response = get_graph_session().get(f'{GRAPH_URL}/me', headers=headers, timeout=GRAPH_TIMEOUT)
     if response.status_code == 200:
         return response.json()
     return None
 
 
 def check_user_in_group(access_token, group_id):
+    # checkMemberGroups resuelve la pertenencia (incluida la transitiva) en
+    # el servidor sin descargar la lista de grupos del usuario
     headers = {'Authorization': f'Bearer {access_token}'}
-    url = 'https://graph.microsoft.com/v1.0/me/memberOf'
-    response = requests.get(url, headers=headers)
+    session = get_graph_session()
+    response = session.post(
+        f'{GRAPH_URL}/me/checkMemberGroups',
+        headers=headers,
+        json={'groupIds': [group_id]},
+        timeout=GRAPH_TIMEOUT
+    )
     if response.status_code == 200:
-        groups = response.json().get('value', [])
-        for group in groups:
-            if group.get('id') == group_id:
-                return True
+        return group_id in response.json().get('value', [])
+    
+    # Alternativa: recorrer transitiveMemberOf siguiendo la paginación
+    url = f'{GRAPH_URL}/me/transitiveMemberOf/microsoft.graph.group?$select=id&$top=999'
+    while url:
+        response = session.get(url, headers=headers, timeout=GRAPH_TIMEOUT)
+        if response.status_code != 200:
+            return False
+        data = response.json()
+        if any(group.get('id') == group_id for group in data.get('value', [])):
+            return True
+        url = data.get('@odata.nextLink')
     return False
 
 
-def check_authentication():
-    auth_config = load_auth_config()
-    msal_app = get_msal_app(auth_config)
+# Resultado de la autorización por usuario (oid del id_token), para que un
+# nuevo login o una nueva sesión no repita las consultas a Graph
+class AuthorizationCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, oid, group_id):
+        with self._lock:
+            entry = self._entries.get((oid, group_id))
+            if entry and time.time() < entry[2]:
+                return entry[0], entry[1]
+            return None
+
+    def set(self, oid, group_id, user_info, is_authorized):
+        ttl = AUTH_CACHE_TTL if is_authorized else AUTH_DENIED_CACHE_TTL
+        with self._lock:
+            self._entries[(oid, group_id)] = (user_info, is_authorized, time.time() + ttl)
+
+
+@st.cache_resource
+def get_authorization_cache():
+    return AuthorizationCache()
+
+
+def authorize_user(token_result, group_id):
+    oid = token_result.get('id_token_claims', {}).get('oid')
+    auth_cache = get_authorization_cache()
+    cached = auth_cache.get(oid, group_id) if oid else None
+    if cached:
+        return cached
     
+    user_info = get_user_info(token_result['access_token'])
+    if not user_info:
+        return None, False
+    is_authorized = check_user_in_group(token_result['access_token'], group_id)
+    auth_cache.set(oid or user_info.get('id'), group_id, user_info, is_authorized)
+    return user_info, is_authorized
+
+
+@metrics.timed('rebootwebapp_render_seconds', section='auth')
+def check_authentication(auth_config, msal_app):
     if 'user' in st.session_state and st.session_state.user:
         return True, st.session_state.user, None
     
@@ -102,17 +440,13 @@ def check_authentication():
         result = get_token_from_code(auth_config, msal_app, code)
         
         if 'access_token' in result:
-            user_info = get_user_info(result['access_token'])
+            user_info, is_authorized = authorize_user(result, auth_config['authorized_group_id'])
             if user_info:
-                is_authorized = check_user_in_group(
-                    result['access_token'], 
-                    auth_config['authorized_group_id']
-                )
-                
                 user_email = user_info.get('mail') or user_info.get('userPrincipalName', '')
                 
                 if not is_authorized:
                     logger.warning(f"ACCESO DENEGADO | Usuario: {user_email}")
+                    audit('ACCESO DENEGADO', user=user_email)
                     st.query_params.clear()
                     return False, None, "no_autorizado"
                 
@@ -123,6 +457,7 @@ def check_authentication():
                 }
                 st.query_params.clear()
                 logger.info(f"LOGIN | Usuario: {st.session_state.user['email']}")
+                audit('LOGIN', user=st.session_state.user['email'])
                 return True, st.session_state.user, None
         else:
             logger.error(f"Error de autenticación: {result.get('error_description', 'Unknown error')}")
@@ -168,129 +503,895 @@ def show_access_denied():
 # ============================================================================
 
 def load_config():
-    with open(CONFIG_PATH, 'r') as f:
-        return yaml.safe_load(f)
+    return get_config_store().load(CONFIG_PATH, validate_config)
 
 
-def get_service_status(hostname, services):
-    services_json = json.dumps(services)
+# --- Ejecución de playbooks ---
+# Si el runner de Ansible (ansible_runner.py) está levantado, los playbooks se
+# ejecutan ahí con módulos, plugins e inventario ya cargados; si no, se lanza
+# ansible-playbook como subproceso. En ambos casos la salida es el callback
+# rebootwebapp_events (un evento JSON por línea), que se entrega a on_event a
+# medida que llega, y se devuelve un subprocess.CompletedProcess al terminar.
+
+def parse_event(line):
+    line = line.strip()
+    if not line.startswith('{'):
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def dispatch_event(line, on_event):
+    if on_event is None:
+        return
+    event = parse_event(line)
+    if event is None:
+        return
+    try:
+        on_event(event)
+    except Exception as e:
+        logger.error(f"Error procesando evento de Ansible: {e}")
+
+
+def run_playbook(playbook, extra_vars, timeout, forks=None, on_event=None, cancel=None):
+    name = os.path.basename(playbook)
+    outcome = 'error'
+    start = time.monotonic()
+    try:
+        with metrics.inflight('rebootwebapp_ansible_inflight', playbook=name):
+            result = execute_playbook(playbook, extra_vars, timeout, forks, on_event, cancel)
+        outcome = 'ok' if result.returncode == 0 else 'failed'
+        return result
+    except subprocess.TimeoutExpired:
+        outcome = 'timeout'
+        raise
+    except PlaybookCancelled:
+        outcome = 'cancelled'
+        raise
+    finally:
+        metrics.observe('rebootwebapp_ansible_duration_seconds', time.monotonic() - start,
+                        playbook=name, outcome=outcome)
+
+
+def execute_playbook(playbook, extra_vars, timeout, forks=None, on_event=None, cancel=None):
     cmd = [
-        "ansible-playbook", PLAYBOOK_STATUS,
+        "ansible-playbook", playbook,
         "-i", INVENTORY_PATH,
-        "-e", f"target_host={hostname}",
-        "-e", f'{{"services":{services_json}}}'
+        "-e", json.dumps(extra_vars)
     ]
+    if forks:
+        cmd += ["-f", str(forks)]
+    
+    if os.path.exists(ANSIBLE_RUNNER_SOCKET):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(ANSIBLE_RUNNER_SOCKET)
+        except OSError as e:
+            sock.close()
+            logger.warning(f"Runner de Ansible no disponible, se usa ansible-playbook: {e}")
+        else:
+            # Una vez aceptado el pedido no se reintenta por subprocess: un
+            # reinicio podría ejecutarse dos veces
+            with sock:
+                return run_playbook_runner(sock, cmd, playbook, extra_vars, timeout, forks, on_event, cancel)
+    
+    env = dict(
+        os.environ,
+        ANSIBLE_STDOUT_CALLBACK=ANSIBLE_EVENTS_CALLBACK,
+        ANSIBLE_CALLBACK_PLUGINS=ANSIBLE_CALLBACK_PLUGINS_PATH
+    )
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1,
+        env=env, start_new_session=True
+    )
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+    
+    # Corta la ejecución (incluidos los forks de Ansible) por timeout o cancelación
+    stop_reason = []
+    def watchdog():
+        deadline = time.monotonic() + timeout
+        while process.poll() is None:
+            if cancel is not None and cancel.is_set():
+                stop_reason.append('cancelled')
+            elif time.monotonic() > deadline:
+                stop_reason.append('timeout')
+            if stop_reason:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                return
+            time.sleep(0.2)
+    threading.Thread(target=watchdog, daemon=True).start()
+    
+    lines = []
+    for line in process.stdout:
+        lines.append(line)
+        dispatch_event(line, on_event)
+    process.wait()
+    stderr_reader.join()
+    stdout = ''.join(lines)
+    stderr = ''.join(stderr_chunks)
+    
+    if 'timeout' in stop_reason:
+        raise subprocess.TimeoutExpired(cmd, timeout, output=stdout, stderr=stderr)
+    if 'cancelled' in stop_reason:
+        raise PlaybookCancelled(playbook)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+def run_playbook_runner(sock, cmd, playbook, extra_vars, timeout, forks, on_event, cancel):
+    request = {
+        'playbook': playbook,
+        'inventory': INVENTORY_PATH,
+        'extra_vars': extra_vars,
+        'forks': forks,
+        'timeout': timeout
+    }
+    sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+    sock.settimeout(0.5)
+    # El runner aplica el timeout; este margen solo cubre un runner colgado
+    deadline = time.monotonic() + timeout + 30
+    lines = []
+    buffer = b''
+    while True:
+        if cancel is not None and cancel.is_set():
+            # Al cerrar la conexión el runner mata la ejecución
+            raise PlaybookCancelled(playbook)
+        if time.monotonic() > deadline:
+            raise subprocess.TimeoutExpired(cmd, timeout, output=''.join(lines))
+        try:
+            chunk = sock.recv(65536)
+        except socket.timeout:
+            continue
+        if not chunk:
+            raise ConnectionError("El runner de Ansible cerró la conexión sin respuesta")
+        buffer += chunk
+        *complete, buffer = buffer.split(b'\n')
+        for raw in complete:
+            line = raw.decode('utf-8', errors='replace')
+            event = parse_event(line)
+            if event is not None and event.get('runner_exit'):
+                stdout = ''.join(lines)
+                if event.get('timed_out'):
+                    raise subprocess.TimeoutExpired(cmd, timeout, output=stdout, stderr=event['stderr'])
+                return subprocess.CompletedProcess(cmd, event['rc'], stdout, event['stderr'])
+            lines.append(line + '\n')
+            dispatch_event(line, on_event)
+
+
+def parse_playbook_results(stdout):
+    # Resultados por host y por tarea a partir de los eventos:
+    # {'hosts': {hostname: {nombre_tarea: resultado}}, 'stats': {...}}
+    hosts = {}
+    stats = {}
+    for line in stdout.splitlines():
+        event = parse_event(line)
+        if event is None:
+            continue
+        if event['event'] == 'host_result':
+            hosts.setdefault(event['host'], {})[event['task']] = event['result']
+        elif event['event'] == 'stats':
+            stats = event['stats']
+    return {'hosts': hosts, 'stats': stats}
+
+
+def result_timed_out(result):
+    # Tarea cortada por su propio timeout (palabra clave timeout del playbook)
+    return bool(result.get('timedout')) or 'expected time frame' in str(result.get('msg', ''))
+
+
+def host_status_from_result(host_result, services):
+    if host_result.get('unreachable'):
+        return {svc: 'unreachable' for svc in services}
+    if result_timed_out(host_result) and not host_result.get('results'):
+        return {svc: 'timeout' for svc in services}
+    status = {}
+    for item in host_result.get('results', []):
+        if result_timed_out(item):
+            status[item['item']] = 'timeout'
+            continue
+        found = item.get('services') or [{}]
+        status[item['item']] = found[0].get('state', 'unknown')
+    return status
+
+
+def parse_status_output(stdout, host_services):
+    status = {hostname: {} for hostname in host_services}
+    results = parse_playbook_results(stdout)
+    for hostname, tasks in results['hosts'].items():
+        if hostname in status and STATUS_TASK_NAME in tasks:
+            status[hostname] = host_status_from_result(tasks[STATUS_TASK_NAME], host_services[hostname])
+    return status
+
+
+def get_services_status_batch(host_services, on_host=None):
+    # Una sola ejecución de check_services.yml para todos los hosts;
+    # el fan-out lo hacen los forks de Ansible. on_host recibe el estado de
+    # cada host apenas Ansible lo informa.
+    # Cada host tiene su timeout adaptativo, que la tarea aplica a cada
+    # servicio (ítem del loop) y por eso se aprende por servicio: el del
+    # servicio más lento de cada consulta. La ejecución completa se corta al
+    # mayor timeout por la cantidad de servicios del host más un margen, sin
+    # pasar de STATUS_TIMEOUT.
+    hostnames = list(host_services)
+    advisor = get_timeout_advisor()
+    timeouts = {hostname: advisor.timeout('status', hostname) for hostname in hostnames}
+    timeout = min(
+        max(timeouts[hostname] * len(host_services[hostname]) for hostname in hostnames) + STATUS_TIMEOUT_MARGIN,
+        STATUS_TIMEOUT
+    )
+    metrics.observe('rebootwebapp_timeout_seconds', timeout, operation='status')
+    extra_vars = {
+        'target_host': ','.join(hostnames),
+        'services_map': host_services,
+        'status_timeouts': timeouts
+    }
+    
+    start = time.monotonic()
+    # Resultado de cada host a medida que llega; si la ejecución se corta,
+    # los que ya respondieron lo conservan. Las duraciones se miden desde que
+    # un fork toma el host (host_start), sin la espera por un fork libre; cada
+    # servicio, desde el anterior
+    reported = {}
+    host_start = {}
+    last_item = {}
+    slowest_item = {}
+    def on_event(event):
+        hostname = event.get('host')
+        if event.get('task') != STATUS_TASK_NAME or hostname not in host_services:
+            return
+        now = time.monotonic()
+        if event['event'] == 'host_start':
+            host_start[hostname] = last_item[hostname] = now
+        elif event['event'] == 'item':
+            slowest_item[hostname] = max(slowest_item.get(hostname, 0), now - last_item.get(hostname, start))
+            last_item[hostname] = now
+        elif event['event'] == 'host_result':
+            elapsed = now - host_start.get(hostname, start)
+            metrics.observe('rebootwebapp_host_duration_seconds', elapsed, host=hostname, operation='status')
+            host_status = host_status_from_result(event['result'], host_services[hostname])
+            if 'timeout' in host_status.values():
+                advisor.record_timeout('status', hostname)
+                metrics.inc('rebootwebapp_host_errors_total', host=hostname, operation='status', kind='timeout')
+            elif event['status'] in ('failed', 'unreachable'):
+                metrics.inc('rebootwebapp_host_errors_total', host=hostname, operation='status',
+                            kind=event['status'])
+            else:
+                advisor.record('status', hostname, slowest_item.get(hostname, elapsed))
+            reported[hostname] = host_status
+            if on_host:
+                on_host(hostname, host_status)
+    
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-        status = {}
-        pattern = r'"msg":\s*"([^|]+)\|(\w+)"'
-        matches = re.findall(pattern, result.stdout)
-        for svc_name, state in matches:
-            status[svc_name] = state
-        return status
+        result = run_playbook(
+            PLAYBOOK_STATUS, extra_vars, timeout,
+            forks=min(len(hostnames), STATUS_FORKS), on_event=on_event
+        )
+        return parse_status_output(result.stdout, host_services)
     except subprocess.TimeoutExpired:
-        logger.error(f"Timeout consultando estado de {hostname}")
-        return {svc: 'timeout' for svc in services}
+        missing = [hostname for hostname in hostnames if hostname not in reported]
+        logger.error(f"Timeout ({timeout}s) consultando estado de {', '.join(missing)}")
+        for hostname in missing:
+            advisor.record_timeout('status', hostname)
+            metrics.inc('rebootwebapp_host_errors_total', host=hostname, operation='status', kind='timeout')
+        return {h: reported.get(h) or {svc: 'timeout' for svc in svcs} for h, svcs in host_services.items()}
     except Exception as e:
-        logger.error(f"Error consultando estado de {hostname}: {e}")
-        return {svc: 'error' for svc in services}
+        missing = [hostname for hostname in hostnames if hostname not in reported]
+        logger.error(f"Error consultando estado de {', '.join(missing)}: {e}")
+        for hostname in missing:
+            metrics.inc('rebootwebapp_host_errors_total', host=hostname, operation='status', kind='error')
+        return {h: reported.get(h) or {svc: 'error' for svc in svcs} for h, svcs in host_services.items()}
 
 
-def get_all_status(servers):
-    all_status = {}
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        futures = {}
-        for server in servers:
-            svc_names = [s['name'] for s in server['services']]
-            futures[executor.submit(get_service_status, server['hostname'], svc_names)] = server['hostname']
-        for future in as_completed(futures):
-            hostname = futures[future]
-            all_status[hostname] = future.result()
-    return all_status
+def get_service_status(hostname, services):
+    return get_services_status_batch({hostname: services})[hostname]
 
 
-def restart_service(hostname, services, user_email, grupo_nombre):
-    services_json = json.dumps(services)
-    cmd = [
-        "ansible-playbook", PLAYBOOK_RESTART,
-        "-i", INVENTORY_PATH,
-        "-e", f"target_host={hostname}",
-        "-e", f'{{"services":{services_json}}}'
-    ]
+# --- Backend de estado WinRM (opcional) ---
+# Conexiones WinRM reutilizadas por host, una llamada a Get-Service por host
+# (ver winrm_status.py)
+@st.cache_resource
+def get_winrm_pool(endpoint, transport, credentials_path, validate_cert=True, vault_password_file=None):
+    return WinRMStatusPool(endpoint, transport, credentials_path, validate_cert, vault_password_file, STATUS_TIMEOUT)
+
+
+# --- Salud por host (circuit breaker) ---
+# Los hosts que no responden se informan como inalcanzables sin consultarlos
+# hasta que vuelva a responder su puerto WinRM (ver host_health.py)
+@st.cache_resource
+def get_host_health():
+    return HostHealth()
+
+
+def get_status_fetcher(config):
+    winrm_config = config.get('winrm', {})
+    endpoint = winrm_config.get('endpoint', WINRM_ENDPOINT)
+    fetch = get_services_status_batch
+    if config.get('estado_backend', 'ansible') == 'winrm':
+        pool = get_winrm_pool(
+            endpoint,
+            winrm_config.get('transport', 'ntlm'),
+            winrm_config.get('credenciales', WINRM_CREDENTIALS_PATH),
+            winrm_config.get('validar_certificado', True),
+            winrm_config.get('vault_password_file')
+        )
+        fetch = pool.get_status
+    return get_host_health().guard(fetch, winrm_port(endpoint))
+
+
+# Cache de estado compartido entre sesiones, con single-flight por host; la
+# carga en segundo plano y el sondeo automático también están en
+# status_cache.py
+@st.cache_resource
+def get_status_cache():
+    return StatusCache(get_state_store(), get_status_history())
+
+
+@st.cache_resource(max_entries=4)
+def build_inventory(config_version, _config):
+    return InventoryIndex(_config)
+
+
+def get_inventory():
+    config = load_config()
+    return build_inventory(get_config_store().version(CONFIG_PATH), config)
+
+
+def get_all_status(servers, ttl=STATUS_CACHE_TTL, force=False, fetch=get_services_status_batch):
+    host_services = get_host_services(servers)
+    if not host_services:
+        return {}
+    return get_status_cache().get_many(host_services, ttl, force, fetch)
+
+
+@st.cache_resource
+def get_status_loader():
+    return StatusLoader(get_status_cache())
+
+
+@st.cache_resource
+def get_status_poller():
+    return StatusPoller(get_status_cache())
+
+
+def configure_background_status(config):
+    # Sondeo automático y backend de estado de los trabajos. Se aplica en cada
+    # ejecución, antes del login: el sondeo no espera a que alguien inicie
+    # sesión y toma los cambios de configuración
+    status_fetch = get_status_fetcher(config)
+    get_status_poller().configure(get_inventory().host_services(), config.get('auto_refresh_segundos', 0), status_fetch)
+    get_job_manager().status_fetch = status_fetch
+    return status_fetch
+
+
+def audit_restart(event, hostname, services, fields, **extra):
+    for svc in services:
+        audit(event, host=hostname, service=svc, **fields, **extra)
+
+
+def restart_timeouts(hostname, services, overrides=None):
+    # Timeout de cada servicio y de la ejecución completa: los servicios se
+    # reinician uno tras otro, así que se suman. Sin timeout_segundos
+    # configurado la ejecución no pasa de ANSIBLE_TIMEOUT. El total no va al
+    # playbook (Ansible aplica timeout por tarea e ítem): lo aplica
+    # run_playbook. timeout_segundos es solo de reinicio; las consultas de
+    # estado usan el timeout adaptativo del servidor.
+    overrides = overrides or {}
+    advisor = get_timeout_advisor()
+    timeouts = {svc: advisor.timeout('restart', hostname, svc, overrides.get(svc)) for svc in services}
+    total = sum(timeouts.values()) + RESTART_TIMEOUT_MARGIN
+    if not any(overrides.get(svc) for svc in services):
+        total = min(total, ANSIBLE_TIMEOUT)
+    return timeouts, round(total)
+
+
+def restart_service(hostname, services, user_email, grupo_nombre, op_id=None, mode=None,
+                    on_service=None, cancel=None, timeouts=None):
+    # timeouts: timeout_segundos configurado por servicio, si lo hay
+    audit_fields = {'op_id': op_id, 'user': user_email, 'grupo': grupo_nombre, 'mode': mode}
     logger.info(f"INICIO | Grupo: {grupo_nombre} | Usuario: {user_email} | Servidor: {hostname} | Servicios: {services}")
+    audit_restart('INICIO', hostname, services, audit_fields)
+    advisor = get_timeout_advisor()
+    service_timeouts, timeout = restart_timeouts(hostname, services, timeouts)
+    metrics.observe('rebootwebapp_timeout_seconds', timeout, operation='restart')
+    
+    # Resultado de cada servicio apenas win_service lo reinicia; como se
+    # reinician en orden, cada uno tardó desde el resultado anterior (el
+    # primero, desde que la tarea empezó en el host)
+    item_results = {}
+    last_item = [time.monotonic()]
+    def on_event(event):
+        if event['event'] == 'host_start' and event['task'] == RESTART_TASK_NAME and event['host'] == hostname:
+            last_item[0] = time.monotonic()
+        if event['event'] == 'item' and event['task'] == RESTART_TASK_NAME and event['host'] == hostname:
+            ok = event['status'] == 'ok'
+            item_results[event['item']] = ok
+            now = time.monotonic()
+            if ok:
+                advisor.record('restart', hostname, now - last_item[0], event['item'])
+            elif result_timed_out(event['result']):
+                advisor.record_timeout('restart', hostname, event['item'])
+                logger.warning(f"TIMEOUT | Servidor: {hostname} | Servicio: {event['item']} | "
+                               f"{service_timeouts.get(event['item'])}s")
+            last_item[0] = now
+            if on_service:
+                on_service(event['item'], ok)
+    
+    start = time.monotonic()
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=ANSIBLE_TIMEOUT)
+        with metrics.inflight('rebootwebapp_restarts_inflight'):
+            result = run_playbook(
+                PLAYBOOK_RESTART,
+                {'target_host': hostname, 'services': services, 'service_timeouts': service_timeouts},
+                timeout, on_event=on_event, cancel=cancel
+            )
+        duration = round(time.monotonic() - start, 1)
+        metrics.observe('rebootwebapp_host_duration_seconds', duration, host=hostname, operation='restart')
+        stderr_tail = result.stderr[-AUDIT_STDERR_TAIL:] or None
         if result.returncode == 0:
             logger.info(f"EXITO | Grupo: {grupo_nombre} | Usuario: {user_email} | Servidor: {hostname} | Servicios: {services}")
+            audit_restart('EXITO', hostname, services, audit_fields, duration=duration, rc=0)
             return True, hostname
         else:
             logger.error(f"FALLO | Grupo: {grupo_nombre} | Usuario: {user_email} | Servidor: {hostname} | RC: {result.returncode}")
+            # rc 4: host inalcanzable
+            metrics.inc('rebootwebapp_host_errors_total', host=hostname, operation='restart',
+                        kind='unreachable' if result.returncode == 4 else 'failed')
+            succeeded = [svc for svc in services if item_results.get(svc)]
+            failed = [svc for svc in services if not item_results.get(svc)]
+            audit_restart('EXITO', hostname, succeeded, audit_fields, duration=duration, rc=result.returncode)
+            audit_restart('FALLO', hostname, failed, audit_fields,
+                          duration=duration, rc=result.returncode, stderr_tail=stderr_tail)
             return False, hostname
+    except PlaybookCancelled:
+        logger.warning(f"CANCELADO | Grupo: {grupo_nombre} | Usuario: {user_email} | Servidor: {hostname} | Servicios: {services}")
+        audit_restart('CANCELADO', hostname, [svc for svc in services if svc not in item_results], audit_fields,
+                      duration=round(time.monotonic() - start, 1))
+        raise
     except Exception as e:
         logger.error(f"ERROR | Grupo: {grupo_nombre} | Usuario: {user_email} | Servidor: {hostname} | {e}")
+        timed_out = isinstance(e, subprocess.TimeoutExpired)
+        if timed_out:
+            for svc in services:
+                if svc not in item_results:
+                    advisor.record_timeout('restart', hostname, svc)
+        metrics.inc('rebootwebapp_host_errors_total', host=hostname, operation='restart',
+                    kind='timeout' if timed_out else 'error')
+        audit_restart('ERROR', hostname, services, audit_fields,
+                      duration=round(time.monotonic() - start, 1), stderr_tail=str(e)[-AUDIT_STDERR_TAIL:])
         return False, hostname
 
 
-def restart_single_service(hostname, service_name, user_email, grupo_nombre):
-    services_json = json.dumps([service_name])
-    cmd = [
-        "ansible-playbook", PLAYBOOK_RESTART,
-        "-i", INVENTORY_PATH,
-        "-e", f"target_host={hostname}",
-        "-e", f'{{"services":{services_json}}}'
-    ]
-    logger.info(f"INICIO | Grupo: {grupo_nombre} | Usuario: {user_email} | Servidor: {hostname} | Servicio: {service_name}")
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=ANSIBLE_TIMEOUT)
-        if result.returncode == 0:
-            logger.info(f"EXITO | Grupo: {grupo_nombre} | Usuario: {user_email} | Servidor: {hostname} | Servicio: {service_name}")
-            return True, hostname, service_name
+def restart_single_service(hostname, service_name, user_email, grupo_nombre, op_id=None, mode=None, cancel=None,
+                           timeout=None):
+    success, hostname = restart_service(hostname, [service_name], user_email, grupo_nombre, op_id, mode,
+                                        cancel=cancel, timeouts={service_name: timeout})
+    return success, hostname, service_name
+
+
+# ============================================================================
+# RESTART JOBS
+# ============================================================================
+
+# Reinicio masivo: varios grupos (o pares servidor/servicio sueltos) se
+# combinan en un único plan, deduplicado y agrupado por servidor, así cada
+# servidor recibe una sola ejecución de Ansible aunque aparezca en varios
+# grupos. El plan tiene la forma de un grupo y se ejecuta como cualquier otro
+# trabajo, con un solo op_id.
+def build_bulk_grupo(grupos, pairs=None):
+    # pairs: conjunto opcional de (hostname, servicio) a incluir. El plan
+    # lleva además sus entradas del inventario (entries), que es lo que
+    # recorren plan_restart_job y el resumen del diálogo
+    inventory = get_inventory()
+    servers = {}
+    host_entries = {}
+    seen = set()
+    duplicates = 0
+    for grupo in grupos:
+        for entry in inventory.grupo_entries(grupo['id']):
+            if pairs is not None and (entry['hostname'], entry['service_name']) not in pairs:
+                continue
+            key = (entry['hostname'].lower(), entry['service_name'].lower())
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            host_entries.setdefault(key[0], []).append(entry)
+            servers.setdefault(key[0], {
+                'hostname': entry['hostname'],
+                'display_name': entry['display_name'],
+                'services': []
+            })['services'].append(entry['service'])
+    
+    # Espera y concurrencia, las más holgadas de los grupos elegidos; ola y
+    # umbral de fallos, los más prudentes (la ola más chica y el umbral más
+    # bajo). Como pueden ser números o porcentajes, se comparan ya resueltos
+    # sobre los servidores del plan
+    total = len(servers)
+    return {
+        'id': BULK_GRUPO_ID,
+        'nombre': ", ".join(grupo['nombre'] for grupo in grupos),
+        'grupos': [grupo['id'] for grupo in grupos],
+        'servers': list(servers.values()),
+        'entries': [entry for entries in host_entries.values() for entry in entries],
+        'duplicates': duplicates,
+        'espera_max_segundos': max(grupo.get('espera_max_segundos', SEQUENTIAL_WAIT_SECONDS) for grupo in grupos),
+        'concurrencia_max': max(grupo.get('concurrencia_max', RESTART_CONCURRENCY) for grupo in grupos),
+        'ola': min(resolve_count(grupo.get('ola', 1), total) for grupo in grupos),
+        'umbral_fallos': min(resolve_count(grupo.get('umbral_fallos', 1), total) for grupo in grupos)
+    }
+
+
+def grupo_entries(grupo):
+    # Entradas del inventario de un grupo configurado o de un plan masivo
+    if 'entries' in grupo:
+        return grupo['entries']
+    return get_inventory().grupo_entries(grupo['id'])
+
+
+def plan_restart_job(grupo, user_email, mode):
+    # Servicios y parámetros de un trabajo nuevo; el JobManager le agrega id,
+    # estado y leases. Solo grupos de la configuración cargada: uno que se
+    # quitó mientras la página seguía abierta se rechaza en lugar de
+    # reiniciar una lista de servicios vieja o vacía
+    inventory = get_inventory()
+    for grupo_id in grupo.get('grupos', [grupo['id']]):
+        if inventory.grupo(grupo_id) is None:
+            raise RestartConflict(f"El grupo {grupo_id} no está en la configuración actual.")
+    items = [{
+        'hostname': entry['hostname'],
+        'display_name': entry['display_name'],
+        'service_name': entry['service_name'],
+        'service_display': entry['service_display'],
+        'depends_on': entry['service'].get('depende_de', []),
+        'settle_seconds': entry['service'].get('espera_adicional_segundos', 0),
+        'timeout': entry['service'].get('timeout_segundos'),
+        'result': 'pending',
+        'restarted_at': None,
+        'verified': None,
+        'time_to_running': None
+    } for entry in grupo_entries(grupo)]
+    return {
+        'grupo_id': grupo['id'],
+        'grupo_ids': grupo.get('grupos', [grupo['id']]),
+        'grupo_nombre': grupo['nombre'],
+        'user': user_email,
+        'mode': mode,
+        'max_wait': grupo.get('espera_max_segundos', SEQUENTIAL_WAIT_SECONDS),
+        'concurrency': grupo.get('concurrencia_max', RESTART_CONCURRENCY),
+        'wave_size': grupo.get('ola', 1),
+        'failure_threshold': grupo.get('umbral_fallos', 1),
+        'items': items
+    }
+
+
+# Los reinicios se ejecutan como trabajos en un pool de workers propio, con
+# leases sobre su grupo y sus servidores (ver jobs.py)
+@st.cache_resource
+def get_job_manager():
+    return JobManager(get_status_cache(), plan_restart_job, execute_restart_job, get_services_status_batch)
+
+
+def order_by_dependencies(items):
+    # Orden topológico según depende_de (nombre de servicio o "hostname/servicio"),
+    # respetando el orden del archivo de configuración entre independientes.
+    # Las dependencias se resuelven con un índice por nombre, sin comparar
+    # cada par de servicios
+    index = {}
+    for pos, item in enumerate(items):
+        index.setdefault(item['service_name'], []).append(pos)
+        index.setdefault(f"{item['hostname']}/{item['service_name']}", []).append(pos)
+    blockers = [set() for _ in items]
+    dependents = [[] for _ in items]
+    for pos, item in enumerate(items):
+        for dep in item.get('depends_on', []):
+            for other in index.get(dep, []):
+                if other != pos and other not in blockers[pos]:
+                    blockers[pos].add(other)
+                    dependents[other].append(pos)
+    
+    ready = [pos for pos in range(len(items)) if not blockers[pos]]
+    heapq.heapify(ready)
+    done = [False] * len(items)
+    ordered = []
+    while len(ordered) < len(items):
+        if not ready:
+            remaining = [pos for pos in range(len(items)) if not done[pos]]
+            logger.warning(f"Dependencia circular entre servicios: {[items[pos]['service_name'] for pos in remaining]}")
+            ready = [remaining[0]]
+        pos = heapq.heappop(ready)
+        if done[pos]:
+            continue
+        done[pos] = True
+        ordered.append(items[pos])
+        for other in dependents[pos]:
+            blockers[other].discard(pos)
+            if not blockers[other] and not done[other]:
+                heapq.heappush(ready, other)
+    return ordered
+
+
+def verify_running(manager, job_id, targets, max_wait, cancel):
+    # Verificación posterior al reinicio: consulta solo los servicios
+    # reiniciados que todavía no están en Running, con intervalos crecientes,
+    # hasta que converjan todos o venza max_wait. Cada consulta actualiza el
+    # cache (y la tabla) host por host. Devuelve lo que no llegó a Running.
+    job = manager.get(job_id)
+    items = {(item['hostname'], item['service_name']): item for item in job['items']}
+    pending = {hostname: list(services) for hostname, services in targets.items() if services}
+    deadline = time.time() + max_wait
+    interval = HEALTH_POLL_SECONDS
+    while pending and not cancel.is_set():
+        status = manager.cache.get_many(pending, 0, force=True, fetch=manager.status_fetch)
+        now = time.time()
+        for hostname in list(pending):
+            for service_name in list(pending[hostname]):
+                if status.get(hostname, {}).get(service_name, '').lower() not in RUNNING_STATES:
+                    continue
+                item = items[(hostname, service_name)]
+                elapsed = round(now - (item.get('restarted_at') or now), 1)
+                manager.set_item_verified(job_id, hostname, service_name, True, elapsed)
+                manager.write(job_id, f"🟢 {item['display_name']} → {item['service_display']} en Running ({elapsed}s)")
+                metrics.observe('rebootwebapp_time_to_running_seconds', elapsed, service=service_name)
+                pending[hostname].remove(service_name)
+            if not pending[hostname]:
+                del pending[hostname]
+        if not pending or now >= deadline:
+            break
+        cancel.wait(min(interval, deadline - now))
+        interval = min(interval * HEALTH_POLL_BACKOFF, HEALTH_POLL_MAX_SECONDS)
+    
+    if not cancel.is_set():
+        for hostname, services in pending.items():
+            for service_name in services:
+                item = items[(hostname, service_name)]
+                manager.set_item_verified(job_id, hostname, service_name, False)
+                manager.write(job_id, f"⚠️ {item['display_name']} → {item['service_display']} no volvió a Running en {max_wait}s")
+    return pending
+
+
+def resolve_count(value, total):
+    # Acepta un número absoluto o un porcentaje ("25%") sobre el total
+    if isinstance(value, str) and value.strip().endswith('%'):
+        return max(1, math.ceil(total * float(value.strip()[:-1]) / 100))
+    return max(1, int(value))
+
+
+def restart_host(manager, job_id, hostname, services, user_email, grupo_nombre):
+    job = manager.get(job_id)
+    labels = {
+        item['service_name']: f"{item['display_name']} → {item['service_display']}"
+        for item in job['items'] if item['hostname'] == hostname
+    }
+    timeouts = {item['service_name']: item.get('timeout') for item in job['items'] if item['hostname'] == hostname}
+    
+    def on_service(service_name, ok):
+        manager.set_item_result(job_id, hostname, [service_name], 'ok' if ok else 'error')
+        manager.write(job_id, f"{'✅' if ok else '❌'} {labels.get(service_name, service_name)}")
+    
+    cancel = manager.cancel_event(job_id)
+    if cancel.is_set():
+        raise PlaybookCancelled(hostname)
+    manager.set_item_result(job_id, hostname, services, 'running')
+    return restart_service(
+        hostname, services, user_email, grupo_nombre, job_id, job['mode'],
+        on_service=on_service, cancel=cancel, timeouts=timeouts
+    )
+
+
+def execute_restart_job(manager, job_id):
+    job = manager.get(job_id)
+    user_email = job['user']
+    grupo_nombre = job['grupo_nombre']
+    items = job['items']
+    cancel = manager.cancel_event(job_id)
+    manager.update(job_id, status='running', started=datetime.now().isoformat(timespec='seconds'))
+    if job['grupo_id'] == BULK_GRUPO_ID:
+        logger.info(f"REINICIO MASIVO | Usuario: {user_email} | Grupos: {job['grupo_ids']} | "
+                    f"Servidores: {len({item['hostname'] for item in items})} | Servicios: {len(items)} | "
+                    f"Trabajo: {job_id}")
+        audit('REINICIO MASIVO', op_id=job_id, user=user_email, grupo=grupo_nombre, mode=job['mode'])
+    
+    if job['mode'] in ('paralelo', 'olas'):
+        host_services = {}
+        display_names = {}
+        for item in items:
+            host_services.setdefault(item['hostname'], []).append(item['service_name'])
+            display_names[item['hostname']] = item['display_name']
+        hostnames = list(host_services)
+        
+        if job['mode'] == 'paralelo':
+            manager.update(job_id, label="🔄 Reiniciando servicios en paralelo...")
+            manager.write(job_id, "Iniciando reinicio de todos los servidores simultáneamente...")
+            waves = [hostnames]
+            threshold = None
         else:
-            logger.error(f"FALLO | Grupo: {grupo_nombre} | Usuario: {user_email} | Servidor: {hostname} | Servicio: {service_name} | RC: {result.returncode}")
-            return False, hostname, service_name
-    except Exception as e:
-        logger.error(f"ERROR | Grupo: {grupo_nombre} | Usuario: {user_email} | Servidor: {hostname} | Servicio: {service_name} | {e}")
-        return False, hostname, service_name
+            wave_size = resolve_count(job['wave_size'], len(hostnames))
+            waves = [hostnames[i:i + wave_size] for i in range(0, len(hostnames), wave_size)]
+            threshold = resolve_count(job['failure_threshold'], len(hostnames))
+            manager.write(job_id, f"Reinicio en {len(waves)} olas de hasta {wave_size} servidores")
+        
+        # Fallos por servidor: uno cuyo playbook falló y que además tiene
+        # servicios sin volver a Running cuenta una sola vez para el umbral
+        failed_hosts = set()
+        for wave_idx, wave in enumerate(waves):
+            if cancel.is_set():
+                break
+            if threshold is not None and len(failed_hosts) >= threshold:
+                skipped = [h for w in waves[wave_idx:] for h in w]
+                for hostname in skipped:
+                    manager.set_item_result(job_id, hostname, host_services[hostname], 'aborted')
+                manager.write(job_id, f"⛔ Umbral de fallos alcanzado ({len(failed_hosts)}), se cancelan {len(skipped)} servidores restantes")
+                break
+            if len(waves) > 1:
+                manager.update(job_id, label=f"🔄 Reiniciando ola {wave_idx+1}/{len(waves)}...")
+            
+            with ThreadPoolExecutor(max_workers=max(1, min(job['concurrency'], len(wave)))) as executor:
+                futures = {}
+                for hostname in wave:
+                    futures[executor.submit(
+                        restart_host, manager, job_id, hostname, host_services[hostname], user_email, grupo_nombre
+                    )] = hostname
+                
+                for future in as_completed(futures):
+                    hostname = futures[future]
+                    try:
+                        success, _ = future.result()
+                    except PlaybookCancelled:
+                        continue
+                    # Servicios sin resultado propio (p. ej. host inalcanzable)
+                    # toman el resultado del host
+                    pending = [
+                        item['service_name'] for item in manager.get(job_id)['items']
+                        if item['hostname'] == hostname and item['result'] == 'running'
+                    ]
+                    manager.set_item_result(job_id, hostname, pending, 'ok' if success else 'error')
+                    if success:
+                        manager.write(job_id, f"✅ {display_names[hostname]} - Completado")
+                    else:
+                        failed_hosts.add(hostname)
+                        manager.write(job_id, f"❌ {display_names[hostname]} - Error")
+            
+            # Antes de la siguiente ola, los servicios reiniciados deben quedar
+            # en Running; los servidores que no convergen cuentan como fallo
+            if cancel.is_set():
+                break
+            targets = {hostname: [] for hostname in wave}
+            for item in manager.get(job_id)['items']:
+                if item['hostname'] in targets and item['result'] == 'ok':
+                    targets[item['hostname']].append(item['service_name'])
+            manager.update(job_id, label="🔎 Verificando que los servicios queden en Running...",
+                           wait_until=time.time() + job['max_wait'])
+            not_running = verify_running(manager, job_id, targets, job['max_wait'], cancel)
+            manager.update(job_id, wait_until=None)
+            failed_hosts.update(not_running)
+    
+    else:
+        items = order_by_dependencies(items)
+        total = len(items)
+        max_wait = job.get('max_wait', SEQUENTIAL_WAIT_SECONDS)
+        for idx, item in enumerate(items):
+            if cancel.is_set():
+                break
+            manager.update(job_id, label=f"🔄 Reiniciando servicio {idx+1}/{total}...", wait_until=None)
+            manager.write(job_id, f"▶️ {item['display_name']} → {item['service_display']}")
+            manager.set_item_result(job_id, item['hostname'], [item['service_name']], 'running')
+            
+            success, _, _ = restart_single_service(
+                item['hostname'], item['service_name'], user_email, grupo_nombre, job_id, job['mode'], cancel,
+                item.get('timeout')
+            )
+            manager.set_item_result(job_id, item['hostname'], [item['service_name']], 'ok' if success else 'error')
+            
+            if success:
+                manager.write(job_id, "✅ Completado")
+            else:
+                manager.write(job_id, "❌ Error")
+            
+            if success:
+                # Se pasa al siguiente en cuanto el servicio vuelve a Running;
+                # la espera fija queda solo como máximo
+                manager.update(
+                    job_id,
+                    label=f"⏳ Esperando que quede en Running ({idx+1}/{total} completados)...",
+                    wait_until=time.time() + max_wait
+                )
+                running = not verify_running(
+                    manager, job_id, {item['hostname']: [item['service_name']]}, max_wait, cancel
+                )
+                if running and item['settle_seconds'] and idx < total - 1:
+                    manager.update(
+                        job_id,
+                        label=f"⏳ Espera adicional antes del siguiente ({idx+1}/{total} completados)...",
+                        wait_until=time.time() + item['settle_seconds']
+                    )
+                    cancel.wait(item['settle_seconds'])
+            elif idx < total - 1:
+                manager.update(
+                    job_id,
+                    label=f"⏳ Esperando antes del siguiente ({idx+1}/{total} completados)...",
+                    wait_until=time.time() + max_wait
+                )
+                cancel.wait(max_wait)
 
 
 # ============================================================================
 # UI COMPONENTS
 # ============================================================================
 
-def render_status_table(servers, status_data):
-    running_states = ['running', 'started']
-    stopped_states = ['stopped']
-    
-    table_data = []
-    for server in servers:
-        hostname = server['hostname']
-        server_status = status_data.get(hostname, {})
+RESTART_MODES = {
+    'paralelo': "Paralelo",
+    'olas': "Por olas - N servidores a la vez, se detiene ante fallos",
+    'secuencial': "Secuencial - Un servicio por vez, esperando que vuelva a Running"
+}
+
+
+def status_text(state):
+    if state == 'pending':
+        return '⏳ Cargando'
+    if state in RUNNING_STATES:
+        return '🟢 Running'
+    if state == 'stopped':
+        return '🔴 Stopped'
+    if state == 'unreachable':
+        return '⚫ Sin conexión'
+    return f'🟡 {state.capitalize()}'
+
+
+@st.cache_resource(max_entries=256)
+def get_status_layout(config_version, grupo_id, _servers):
+    # Filas (servidor, servicio) de la tabla de un grupo, armadas una vez por
+    # versión de services_windows.yml y compartidas entre sesiones
+    layout = {'keys': [], 'Servidor': [], 'Servicio': [], 'host_services': get_host_services(_servers)}
+    for server in _servers:
         for svc in server['services']:
-            state = server_status.get(svc['name'], 'unknown').lower()
-            if state in running_states:
-                status_text = '🟢 Running'
-            elif state in stopped_states:
-                status_text = '🔴 Stopped'
-            else:
-                status_text = f'🟡 {state.capitalize()}'
-            table_data.append({
-                'Servidor': server['display_name'],
-                'Servicio': svc['display_name'],
-                'Estado': status_text
-            })
+            layout['keys'].append((server['hostname'], svc['name']))
+            layout['Servidor'].append(server['display_name'])
+            layout['Servicio'].append(svc['display_name'])
+    return layout
+
+
+def get_grupo_layout(grupo_id, servers):
+    return get_status_layout(get_config_store().version(CONFIG_PATH), grupo_id, servers)
+
+
+def render_status_table(grupo_id, layout, status_data):
+    # La tabla se arma una vez por sesión y versión del layout; en cada
+    # render solo se reescriben las celdas de Estado que cambiaron
+    states = [status_data.get(hostname, {}).get(svc, 'pending').lower() for hostname, svc in layout['keys']]
+    cache_key = f'status_table_{grupo_id}'
+    previous = st.session_state.get(cache_key)
+    large = len(states) > STATUS_TABLE_MAX_ROWS
+    if previous and previous['layout'] is layout:
+        table = previous['table']
+        for idx, (old, new) in enumerate(zip(previous['states'], states)):
+            if old != new:
+                if large:
+                    table['Estado'][idx] = status_text(new)
+                else:
+                    table.iat[idx, STATUS_COLUMN] = status_text(new)
+    else:
+        table = {'Servidor': layout['Servidor'], 'Servicio': layout['Servicio'],
+                 'Estado': [status_text(state) for state in states]}
+        if not large:
+            import pandas as pd
+            table = pd.DataFrame(table, index=range(1, len(states) + 1))
+    st.session_state[cache_key] = {'layout': layout, 'states': states, 'table': table}
     
-    import pandas as pd
-    df = pd.DataFrame(table_data)
-    df.index = df.index + 1
-    st.table(df)
+    if large:
+        # Grilla virtualizada: solo se dibujan las filas visibles
+        st.dataframe(table, use_container_width=True, hide_index=True, height=STATUS_GRID_HEIGHT)
+    else:
+        st.table(table)
 
 
-def get_services_summary(servers):
-    summary = []
-    for server in servers:
-        for svc in server['services']:
-            summary.append(f"• {server['display_name']} → {svc['display_name']}")
-    return summary
+def get_services_summary(grupo):
+    return [f"• {entry['display_name']} → {entry['service_display']}" for entry in grupo_entries(grupo)]
 
 
 def show_guide():
@@ -309,11 +1410,12 @@ def show_guide():
     2. **Verifique el estado** de los servicios en la tabla:
        - 🟢 Running = Funcionando correctamente
        - 🔴 Stopped = Detenido
+       - ⚫ Sin conexión = El servidor no responde; se reintenta automáticamente
        - 🟡 Otro estado = Requiere atención
     3. **Haga clic en el botón de reinicio** (azul)
     4. **Confirme la operación** en el popup que aparece
     5. **Espere** mientras se muestra el progreso del reinicio
-    6. **Verifique** que todos los servicios vuelvan a 🟢 Running
+    6. **Verifique** que todos los servicios vuelvan a 🟢 Running (la aplicación lo comprueba sola después de cada reinicio)
     
     ---
     
@@ -322,9 +1424,10 @@ def show_guide():
     | Modo | Descripción | Cuándo usarlo |
     |------|-------------|---------------|
     | **Paralelo** (por defecto) | Reinicia todos los servicios simultáneamente | Urgencias |
-    | **Secuencial** | Reinicia un servicio por vez con espera entre cada uno | Reinicios controlados |
+    | **Por olas** | Reinicia los servidores en tandas; si fallan demasiados se cancelan las tandas restantes | Grupos grandes |
+    | **Secuencial** | Reinicia un servicio por vez y espera a que vuelva a Running antes del siguiente | Reinicios controlados |
     
-    Para usar modo secuencial, marque la casilla antes de presionar el botón de reinicio.
+    Seleccione el modo antes de presionar el botón de reinicio.
     
     ---
     
@@ -338,12 +1441,14 @@ def show_guide():
 
 
 @st.dialog("⚠️ Confirmar Reinicio")
-def show_restart_dialog(grupo, servers, user, sequential_mode):
-    services_summary = get_services_summary(servers)
+def show_restart_dialog(grupo, servers, user, restart_mode):
+    services_summary = get_services_summary(grupo)
     total_services = len(services_summary)
     total_servers = len(servers)
     
     st.markdown(f"Está por reiniciar **{total_services} servicios** en **{total_servers} servidores**.")
+    if grupo.get('duplicates'):
+        st.caption(f"Se omitieron {grupo['duplicates']} servicios repetidos entre grupos.")
     
     with st.expander("Ver detalle de servicios", expanded=False):
         for item in services_summary:
@@ -360,130 +1465,294 @@ def show_restart_dialog(grupo, servers, user, sequential_mode):
     with col_confirm:
         if st.button("✅ Confirmar Reinicio", type="primary", use_container_width=True):
             st.session_state[f'execute_restart_{grupo["id"]}'] = True
-            st.session_state[f'sequential_mode_{grupo["id"]}'] = sequential_mode
+            st.session_state[f'restart_mode_{grupo["id"]}'] = restart_mode
             st.rerun()
 
 
-def execute_restart_with_status(servers, parallel, user_email, grupo_nombre, grupo_id):
-    if parallel:
-        with st.status("🔄 Reiniciando servicios en paralelo...", expanded=True) as status:
-            st.write("Iniciando reinicio de todos los servidores simultáneamente...")
-            
-            results = []
-            with ThreadPoolExecutor(max_workers=4) as executor:
-                futures = {}
-                for server in servers:
-                    svc_names = [s['name'] for s in server['services']]
-                    futures[executor.submit(restart_service, server['hostname'], svc_names, user_email, grupo_nombre)] = server['display_name']
-                
-                for future in as_completed(futures):
-                    server_name = futures[future]
-                    success, hostname = future.result()
-                    results.append((success, hostname))
-                    if success:
-                        st.write(f"✅ {server_name} - Completado")
-                    else:
-                        st.write(f"❌ {server_name} - Error")
-            
-            success_count = sum(1 for r in results if r[0])
-            total_count = len(results)
-            
-            if success_count == total_count:
-                status.update(label="✅ Reinicio completado exitosamente", state="complete", expanded=False)
-            else:
-                status.update(label=f"⚠️ Reinicio con errores ({success_count}/{total_count})", state="error", expanded=True)
-        
-        return results
+def render_job_progress(job_id, grupo_id):
+    was_running = get_job_manager().get(job_id)['status'] in ('queued', 'running')
+    run_every = STATUS_UI_POLL_SECONDS if was_running else None
+    st.fragment(run_every=run_every)(_job_progress_fragment)(job_id, grupo_id, was_running)
+
+
+@metrics.timed('rebootwebapp_render_seconds', section='job_progress')
+def _job_progress_fragment(job_id, grupo_id, was_running):
+    job = get_job_manager().get(job_id)
+    running = job['status'] in ('queued', 'running')
+    
+    success_count = sum(1 for item in job['items'] if item['result'] == 'ok')
+    total_count = len(job['items'])
+    unverified = sum(1 for item in job['items'] if item.get('verified') is False)
     
+    if running:
+        label = job['label']
+        if job['wait_until']:
+            remaining = max(int(job['wait_until'] - time.time()), 0)
+            label = f"{label} ({remaining}s)"
+        state, expanded = "running", True
+    elif job.get('cancelled'):
+        label = f"⛔ Reinicio cancelado ({success_count}/{total_count})"
+        state, expanded = "error", True
+    elif job['status'] == 'interrupted':
+        label = f"⚠️ Reinicio interrumpido ({success_count}/{total_count})"
+        state, expanded = "error", True
+    elif success_count == total_count and unverified:
+        label = f"⚠️ Reinicio completado, {unverified} servicios no volvieron a Running"
+        state, expanded = "error", True
+    elif success_count == total_count:
+        label = "✅ Reinicio completado exitosamente"
+        state, expanded = "complete", False
     else:
-        all_services = []
-        for server in servers:
-            for svc in server['services']:
-                all_services.append({
-                    'hostname': server['hostname'],
-                    'display_name': server['display_name'],
-                    'service_name': svc['name'],
-                    'service_display': svc['display_name']
-                })
-        
-        total = len(all_services)
-        results = []
-        
-        with st.status(f"🔄 Reiniciando servicios en secuencia (0/{total})...", expanded=True) as status:
-            for idx, item in enumerate(all_services):
-                status.update(label=f"🔄 Reiniciando servicio {idx+1}/{total}...")
-                st.write(f"▶️ {item['display_name']} → {item['service_display']}")
-                
-                success, hostname, svc_name = restart_single_service(
-                    item['hostname'], item['service_name'], user_email, grupo_nombre
-                )
-                results.append((success, hostname, svc_name))
-                
-                if success:
-                    st.write(f"✅ Completado")
-                else:
-                    st.write(f"❌ Error")
-                
-                if idx < total - 1:
-                    for remaining in range(SEQUENTIAL_WAIT_SECONDS, 0, -1):
-                        status.update(label=f"⏳ Esperando {remaining}s antes del siguiente ({idx+1}/{total} completados)...")
-                        time.sleep(1)
-            
-            success_count = sum(1 for r in results if r[0])
-            
-            if success_count == total:
-                status.update(label="✅ Reinicio secuencial completado", state="complete", expanded=False)
-            else:
-                status.update(label=f"⚠️ Reinicio con errores ({success_count}/{total})", state="error", expanded=True)
-        
-        return results
+        label = f"⚠️ Reinicio con errores ({success_count}/{total_count})"
+        state, expanded = "error", True
+    
+    with st.status(label, state=state, expanded=expanded):
+        st.caption(f"Trabajo {job['id']} · {job['mode']} · {job['user']} · {job['created']}")
+        for message in job['messages']:
+            st.write(message)
+    
+    if was_running and not running:
+        if success_count == total_count:
+            st.toast(f"✅ Reinicio completado: {success_count}/{total_count}", icon="✅")
+        else:
+            st.toast(f"⚠️ Reinicio con errores: {success_count}/{total_count}", icon="⚠️")
+        st.rerun()
+    
+    col_cancel, col_detach = st.columns(2)
+    with col_cancel:
+        if running and not job.get('cancelled'):
+            if st.button("⛔ Cancelar reinicio", key=f"cancel_{grupo_id}_{job_id}", use_container_width=True):
+                get_job_manager().cancel(job_id)
+                st.toast("⛔ Cancelación solicitada", icon="⛔")
+    with col_detach:
+        if st.button("Ocultar progreso", key=f"detach_{grupo_id}_{job_id}", use_container_width=True):
+            st.session_state[f'job_{grupo_id}'] = None
+            st.session_state[f'job_detached_{grupo_id}'] = job_id
+            st.rerun()
+
+
+def render_status_section(grupo_id, servers, auto_refresh=None, live=False):
+    # Mientras haya una carga o un reinicio en curso (live) el fragmento se
+    # refresca solo; con el sondeo automático activo relee el cache cada
+    # auto_refresh segundos
+    was_loading = get_status_loader().is_loading(grupo_id)
+    run_every = STATUS_UI_POLL_SECONDS if was_loading or live else auto_refresh
+    st.fragment(run_every=run_every)(_status_section_fragment)(grupo_id, servers, was_loading)
+
+
+@metrics.timed('rebootwebapp_render_seconds', section='status_section')
+def _status_section_fragment(grupo_id, servers, was_loading):
+    loading = get_status_loader().is_loading(grupo_id)
+    if was_loading and not loading:
+        st.rerun()
+    
+    layout = get_grupo_layout(grupo_id, servers)
+    status_data, last_update, _ = get_status_cache().peek(layout['host_services'])
+    
+    if last_update:
+        st.caption(f"Última actualización: {datetime.fromtimestamp(last_update).strftime('%H:%M:%S')}")
+    if loading:
+        st.caption("⏳ Consultando estado de servicios...")
+    
+    if not status_data:
+        st.info("⏳ Estado aún no cargado")
+        return
+    
+    render_status_table(grupo_id, layout, status_data)
+
+
+HISTORY_PERIODS = {
+    "Últimas 24 horas": 1,
+    "Últimos 7 días": 7,
+    "Últimos 30 días": 30,
+    "Últimos 90 días": 90,
+    "Último año": 365
+}
+
+RESTART_OUTCOMES = {
+    'running': '🟢 Volvió a Running',
+    'not_running': '⚠️ No volvió a Running',
+    'error': '❌ Falló el reinicio'
+}
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return ''
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+
+
+@metrics.timed('rebootwebapp_render_seconds', section='history')
+def render_history_tab(config):
+    view = st.radio("Ver", ["Auditoría de reinicios", "Disponibilidad de servicios"],
+                    horizontal=True, key="history_view", label_visibility="collapsed")
+    if view == "Disponibilidad de servicios":
+        render_availability_history(config)
+        return
+    
+    col_host, col_service, col_user, col_dates = st.columns([1, 1, 1, 1])
+    with col_host:
+        host = st.text_input("Servidor", key="history_host")
+    with col_service:
+        service = st.text_input("Servicio", key="history_service")
+    with col_user:
+        user_filter = st.text_input("Usuario", key="history_user")
+    with col_dates:
+        today = datetime.now().date()
+        dates = st.date_input("Período", value=(today - timedelta(days=30), today), key="history_dates")
+    
+    since = until = None
+    if isinstance(dates, (list, tuple)) and dates:
+        since = datetime.combine(dates[0], datetime.min.time())
+        until = datetime.combine(dates[-1], datetime.min.time()) + timedelta(days=1)
+    
+    rows = query_audit(AUDIT_DB_PATH, host=host, service=service, user=user_filter, since=since, until=until)
+    st.caption(f"{len(rows)} registros (máximo 500, más recientes primero)")
+    if rows:
+        st.dataframe(rows, use_container_width=True, hide_index=True)
 
 
+def render_availability_history(config):
+    grupos = config['grupos']
+    col_grupo, col_period = st.columns([2, 1])
+    with col_grupo:
+        grupo = st.selectbox("Grupo", grupos, format_func=lambda g: f"{g['icono']} {g['nombre']}",
+                             key="availability_grupo")
+    with col_period:
+        period = st.selectbox("Período", list(HISTORY_PERIODS), key="availability_period")
+    
+    until = time.time()
+    since = until - HISTORY_PERIODS[period] * HISTORY_DAY
+    host_services = get_inventory().host_services(grupo['id'])
+    history = get_status_history()
+    availability = history.availability(host_services, since, until)
+    restarts = history.restarts(host_services, since, until)
+    
+    durations = {}
+    failed = {}
+    for restart in restarts:
+        key = (restart['hostname'], restart['service'])
+        if restart['time_to_running'] is not None:
+            durations.setdefault(key, []).append(restart['time_to_running'])
+        elif restart['outcome'] != 'running':
+            failed[key] = failed.get(key, 0) + 1
+    
+    rows = []
+    for server in grupo['servers']:
+        for svc in server['services']:
+            key = (server['hostname'], svc['name'])
+            entry = availability.get(key, {})
+            times = sorted(durations.get(key, []))
+            rows.append({
+                'Servidor': server['display_name'],
+                'Servicio': svc['display_name'],
+                'Disponibilidad': entry.get('availability'),
+                'Tendencia': [value for _, value in entry.get('points', [])],
+                'Cambios de estado': entry.get('transitions', 0),
+                'Reinicios': len(times) + failed.get(key, 0),
+                'A Running (mediana)': format_duration(times[len(times) // 2]) if times else '',
+                'A Running (máx)': format_duration(times[-1]) if times else '',
+                'Sin volver a Running': failed.get(key, 0)
+            })
+    
+    st.caption("Disponibilidad = tiempo en Running sobre el tiempo observado. "
+               f"Tendencia {'por hora' if HISTORY_PERIODS[period] <= 2 else 'por día'}.")
+    st.dataframe(
+        rows,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            'Disponibilidad': st.column_config.ProgressColumn(format="%.2f%%", min_value=0, max_value=100),
+            'Tendencia': st.column_config.LineChartColumn(y_min=0, y_max=100)
+        }
+    )
+    
+    services = [(server, svc) for server in grupo['servers'] for svc in server['services']]
+    server, svc = st.selectbox(
+        "Detalle de servicio", services,
+        format_func=lambda pair: f"{pair[0]['display_name']} → {pair[1]['display_name']}",
+        key="availability_service"
+    )
+    col_changes, col_restarts = st.columns(2)
+    with col_changes:
+        st.markdown("**Cambios de estado**")
+        segments = history.segments(server['hostname'], svc['name'], since, until)
+        if HISTORY_PERIODS[period] > HISTORY_RAW_RETENTION_DAYS:
+            st.caption(f"El detalle se conserva {HISTORY_RAW_RETENTION_DAYS} días")
+        if segments:
+            st.dataframe([{
+                'Desde': datetime.fromtimestamp(segment['start']).strftime('%Y-%m-%d %H:%M:%S'),
+                'Duración': format_duration(segment['end'] - segment['start']),
+                'Estado': segment['state'].capitalize()
+            } for segment in reversed(segments)], use_container_width=True, hide_index=True)
+        else:
+            st.info("Sin observaciones en el período")
+    with col_restarts:
+        st.markdown("**Reinicios**")
+        own = [restart for restart in restarts
+               if (restart['hostname'], restart['service']) == (server['hostname'], svc['name'])]
+        if own:
+            st.dataframe([{
+                'Fecha': datetime.fromtimestamp(restart['ts']).strftime('%Y-%m-%d %H:%M:%S'),
+                'Resultado': RESTART_OUTCOMES.get(restart['outcome'], restart['outcome']),
+                'A Running': format_duration(restart['time_to_running']),
+                'Trabajo': restart['op_id']
+            } for restart in own], use_container_width=True, hide_index=True)
+        else:
+            st.info("Sin reinicios en el período")
+
+
+@metrics.timed('rebootwebapp_render_seconds', section='grupo_tab')
 def render_grupo_tab(grupo, user, config):
     grupo_id = grupo['id']
     servers = grupo['servers']
     
     # Inicializar estados
-    status_key = f'status_data_{grupo_id}'
-    refresh_key = f'last_refresh_{grupo_id}'
     execute_key = f'execute_restart_{grupo_id}'
-    sequential_key = f'sequential_mode_{grupo_id}'
+    mode_key = f'restart_mode_{grupo_id}'
     guide_key = f'show_guide_{grupo_id}'
+    job_key = f'job_{grupo_id}'
+    cache_ttl = config.get('cache_estado_segundos', STATUS_CACHE_TTL)
+    status_fetch = get_status_fetcher(config)
+    loader = get_status_loader()
     
-    if status_key not in st.session_state:
-        st.session_state[status_key] = {}
-    if refresh_key not in st.session_state:
-        st.session_state[refresh_key] = None
     if execute_key not in st.session_state:
         st.session_state[execute_key] = False
     if guide_key not in st.session_state:
         st.session_state[guide_key] = False
+    if job_key not in st.session_state:
+        st.session_state[job_key] = None
     
-    # Ejecutar reinicio si fue confirmado
+    # Encolar reinicio si fue confirmado
+    job_manager = get_job_manager()
+    active_jobs = job_manager.active_jobs(grupo_id)
     if st.session_state[execute_key]:
         st.session_state[execute_key] = False
-        use_sequential = st.session_state.get(sequential_key, False)
-        
-        st.toast("🚀 Iniciando reinicio de servicios...", icon="🔄")
-        
-        results = execute_restart_with_status(
-            servers, 
-            parallel=not use_sequential, 
-            user_email=user['email'],
-            grupo_nombre=grupo['nombre'],
-            grupo_id=grupo_id
-        )
-        
-        with st.spinner("Actualizando estado..."):
-            st.session_state[status_key] = get_all_status(servers)
-            st.session_state[refresh_key] = datetime.now()
+        restart_mode = st.session_state.get(mode_key, 'paralelo')
         
-        success_count = sum(1 for r in results if r[0])
-        total_count = len(results)
-        if success_count == total_count:
-            st.toast(f"✅ Reinicio completado: {success_count}/{total_count}", icon="✅")
+        if active_jobs:
+            st.warning("Ya hay un reinicio en curso para este grupo.")
         else:
-            st.toast(f"⚠️ Reinicio con errores: {success_count}/{total_count}", icon="⚠️")
+            try:
+                st.session_state[job_key] = job_manager.submit(grupo, user['email'], restart_mode)
+            except RestartConflict as e:
+                st.warning(f"⛔ Reinicio rechazado: {e}")
+            else:
+                active_jobs = [st.session_state[job_key]]
+                st.toast("🚀 Iniciando reinicio de servicios...", icon="🔄")
+    
+    # Reenganche automático a un reinicio en curso (p. ej. tras recargar la página)
+    if st.session_state[job_key] is None and active_jobs:
+        if active_jobs[0] != st.session_state.get(f'job_detached_{grupo_id}'):
+            st.session_state[job_key] = active_jobs[0]
+    
+    if st.session_state[job_key]:
+        render_job_progress(st.session_state[job_key], grupo_id)
     
     # Botones de operación
     col1, col2, col3 = st.columns([1, 1, 1])
@@ -509,10 +1778,12 @@ def render_grupo_tab(grupo, user, config):
             st.session_state[guide_key] = not st.session_state[guide_key]
             st.rerun()
     
-    sequential_mode = st.checkbox(
-        "Reinicio secuencial - Un servicio cada 1 minuto", 
-        value=False,
-        key=f"sequential_{grupo_id}"
+    restart_mode = st.radio(
+        "Modo de reinicio",
+        options=list(RESTART_MODES),
+        format_func=RESTART_MODES.get,
+        horizontal=True,
+        key=f"mode_{grupo_id}"
     )
     
     st.markdown("---")
@@ -521,29 +1792,142 @@ def render_grupo_tab(grupo, user, config):
         show_guide()
         st.markdown("---")
     
-    if refresh_btn or st.session_state[refresh_key] is None:
-        with st.spinner("Consultando estado de servicios..."):
-            st.session_state[status_key] = get_all_status(servers)
-            st.session_state[refresh_key] = datetime.now()
-    
-    if st.session_state[refresh_key]:
-        st.caption(f"Última actualización: {st.session_state[refresh_key].strftime('%H:%M:%S')}")
+    poller = get_status_poller()
+    if refresh_btn:
+        loader.submit(grupo_id, servers, cache_ttl, force=True, fetch=status_fetch)
+    else:
+        # Solo se consulta lo que falta (o lo que expiró si no hay sondeo
+        # automático), en segundo plano
+        _, last_update, complete = get_status_cache().peek(get_grupo_layout(grupo_id, servers)['host_services'])
+        expired = last_update is None or time.time() - last_update >= cache_ttl
+        if not complete or (not poller.active and expired):
+            loader.submit(grupo_id, servers, cache_ttl, fetch=status_fetch)
     
-    render_status_table(servers, st.session_state[status_key])
+    auto_refresh = config.get('auto_refresh_segundos', 0) if poller.active else None
+    render_status_section(grupo_id, servers, auto_refresh, live=bool(active_jobs))
     
     if restart_btn:
-        show_restart_dialog(grupo, servers, user, sequential_mode)
+        if active_jobs:
+            st.warning("Ya hay un reinicio en curso para este grupo.")
+        else:
+            show_restart_dialog(grupo, servers, user, restart_mode)
+
+
+@metrics.timed('rebootwebapp_render_seconds', section='bulk_tab')
+def render_bulk_tab(config, user):
+    grupo_id = BULK_GRUPO_ID
+    execute_key = f'execute_restart_{grupo_id}'
+    mode_key = f'restart_mode_{grupo_id}'
+    job_key = f'job_{grupo_id}'
+    if job_key not in st.session_state:
+        st.session_state[job_key] = None
+    
+    job_manager = get_job_manager()
+    active_jobs = job_manager.active_jobs(grupo_id)
+    if st.session_state.get(execute_key):
+        st.session_state[execute_key] = False
+        restart_mode = st.session_state.get(mode_key, 'paralelo')
+        
+        if active_jobs:
+            st.warning("Ya hay un reinicio masivo en curso.")
+        else:
+            try:
+                st.session_state[job_key] = job_manager.submit(st.session_state['bulk_plan'], user['email'], restart_mode)
+            except RestartConflict as e:
+                st.warning(f"⛔ Reinicio rechazado: {e}")
+            else:
+                active_jobs = [st.session_state[job_key]]
+                st.toast("🚀 Iniciando reinicio masivo...", icon="🔄")
+    
+    if st.session_state[job_key] is None and active_jobs:
+        if active_jobs[0] != st.session_state.get(f'job_detached_{grupo_id}'):
+            st.session_state[job_key] = active_jobs[0]
+    
+    if st.session_state[job_key]:
+        render_job_progress(st.session_state[job_key], grupo_id)
+    
+    st.caption("Busque servicios en todos los grupos o elija grupos completos y reinícielos en una sola "
+               "operación. Cada servidor recibe una única ejecución, aunque aparezca en más de un grupo.")
+    inventory = get_inventory()
+    col_query, col_grupos, col_states = st.columns([2, 2, 1])
+    with col_query:
+        query = st.text_input("Buscar", placeholder="Servidor, servicio o nombre visible", key="bulk_query")
+    with col_grupos:
+        selected = st.multiselect(
+            "Grupos", config['grupos'], format_func=lambda g: f"{g['icono']} {g['nombre']}", key="bulk_grupos"
+        )
+    with col_states:
+        states = st.multiselect("Estado", list(STATE_FILTERS), format_func=STATE_FILTERS.get, key="bulk_states")
+    if not (query.strip() or selected or states):
+        st.info("Busque servicios o seleccione uno o más grupos")
+        return
+    
+    status, _, _ = get_status_cache().peek(inventory.host_services())
+    results = inventory.search(query, [grupo['id'] for grupo in selected], states, status)
+    if not results:
+        st.info("Ningún servicio coincide con la búsqueda")
+        return
+    
+    st.caption(f"{len(results)} servicios encontrados. Seleccione filas para reiniciar solo esas; "
+               "sin selección se reinician todos.")
+    event = st.dataframe(
+        [{
+            'Grupo': entry['grupo_nombre'],
+            'Servidor': entry['display_name'],
+            'Servicio': entry['service_display'],
+            'Estado': status_text(status.get(entry['hostname'], {}).get(entry['service_name'], 'pending').lower())
+        } for entry in results],
+        use_container_width=True,
+        hide_index=True,
+        height=min(STATUS_GRID_HEIGHT, 38 + 35 * len(results)),
+        on_select="rerun",
+        selection_mode="multi-row",
+        key="bulk_results"
+    )
+    chosen = [results[idx] for idx in event.selection.rows if idx < len(results)] or results
+    
+    grupo_ids = dict.fromkeys(entry['grupo_id'] for entry in chosen)
+    plan = build_bulk_grupo(
+        [inventory.grupo(grupo_id) for grupo_id in grupo_ids],
+        {(entry['hostname'], entry['service_name']) for entry in chosen}
+    )
+    total_services = sum(len(server['services']) for server in plan['servers'])
+    summary = f"Plan: **{total_services} servicios** en **{len(plan['servers'])} servidores**"
+    if plan['duplicates']:
+        summary += f" ({plan['duplicates']} repetidos entre grupos, se reinician una sola vez)"
+    st.markdown(summary)
+    
+    restart_mode = st.radio(
+        "Modo de reinicio",
+        options=list(RESTART_MODES),
+        format_func=RESTART_MODES.get,
+        horizontal=True,
+        key=f"mode_{grupo_id}"
+    )
+    
+    if st.button("🔄 Reiniciar selección", type="primary", disabled=not plan['servers'], key="restart_bulk"):
+        if active_jobs:
+            st.warning("Ya hay un reinicio masivo en curso.")
+        else:
+            st.session_state['bulk_plan'] = plan
+            show_restart_dialog(plan, plan['servers'], user, restart_mode)
 
 
 # ============================================================================
 # MAIN APPLICATION
 # ============================================================================
 
+@metrics.timed('rebootwebapp_render_seconds', section='main')
 def main():
+    start_metrics_server()
+    try:
+        configure_background_status(load_config())
+    except Exception as e:
+        logger.error(f"Error configurando el sondeo de estado: {e}")
     auth_config = load_auth_config()
     msal_app = get_msal_app(auth_config)
     
-    is_authenticated, user, error = check_authentication()
+    is_authenticated, user, error = check_authentication(auth_config, msal_app)
     
     if error == "no_autorizado":
         show_access_denied()
@@ -565,6 +1949,17 @@ def main():
         st.error(f"Error cargando configuración: {e}")
         return
     
+    config_error = get_config_store().last_error(CONFIG_PATH)
+    if config_error:
+        st.warning(f"⚠️ services_windows.yml tiene errores, se usa la última versión válida: {config_error}")
+    
+    try:
+        get_status_fetcher(config)
+    except Exception as e:
+        logger.error(f"Error creando el backend de estado: {e}")
+        st.error(f"Error en el backend de estado ({config.get('estado_backend', 'ansible')}): {e}")
+        return
+    
     # Header
     col_logo, col_title, col_user = st.columns([1, 3, 1])
     with col_logo:
@@ -576,6 +1971,7 @@ def main():
         st.markdown(f"<div style='text-align: right; margin-top: 25px;'>👤 {user['name']}</div>", unsafe_allow_html=True)
         if st.button("Cerrar sesión", key="logout"):
             logger.info(f"LOGOUT | Usuario: {user['email']}")
+            audit('LOGOUT', user=user['email'])
             st.session_state.clear()
             st.rerun()
     
@@ -601,12 +1997,18 @@ def main():
     
     # Tabs
     grupos = config['grupos']
-    tab_labels = [f"{g['icono']} {g['nombre']}" for g in grupos]
+    tab_labels = [f"{g['icono']} {g['nombre']}" for g in grupos] + ["🔎 Buscar / Reinicio masivo", "📜 Historial"]
     tabs = st.tabs(tab_labels)
     
-    for idx, tab in enumerate(tabs):
+    for idx, tab in enumerate(tabs[:len(grupos)]):
         with tab:
             render_grupo_tab(grupos[idx], user, config)
+    
+    with tabs[-2]:
+        render_bulk_tab(config, user)
+    
+    with tabs[-1]:
+        render_history_tab(config)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,172 @@
+# /opt/rebootwebapp/audit_log.py
+# Log de auditoría estructurado de RebootWebApp
+#
+# Cada registro se agrega como una línea JSON (con rotación por tamaño) y se
+# indexa en SQLite para consultar el historial por servidor/servicio/usuario/fecha.
+# RotatingFileHandler no rota bien si varios procesos escriben el mismo
+# archivo, así que cada réplica (REBOOTWEBAPP_REPLICA) escribe el suyo:
+# auditoria-<réplica>.jsonl. El índice es uno solo; al rotar se recorta al
+# registro más viejo que sigue en los archivos JSON de cualquier réplica.
+#
+# Vive fuera de app.py para que los handlers se definan una sola vez por
+# proceso y no en cada rerun de Streamlit.
+
+import json
+import logging
+import logging.handlers
+import sqlite3
+from pathlib import Path
+
+logger = logging.getLogger('rebootwebapp.audit_log')
+
+AUDIT_MAX_BYTES = 10 * 1024 * 1024
+AUDIT_BACKUP_COUNT = 20
+AUDIT_FIELDS = ('ts', 'op_id', 'event', 'user', 'grupo', 'host', 'service', 'mode', 'duration', 'rc', 'stderr_tail')
+
+AUDIT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    op_id TEXT,
+    event TEXT,
+    user TEXT COLLATE NOCASE,
+    grupo TEXT,
+    host TEXT COLLATE NOCASE,
+    service TEXT COLLATE NOCASE,
+    mode TEXT,
+    duration REAL,
+    rc INTEGER,
+    stderr_tail TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_audit_ts ON audit (ts);
+CREATE INDEX IF NOT EXISTS idx_audit_host ON audit (host, ts);
+CREATE INDEX IF NOT EXISTS idx_audit_service ON audit (service, ts);
+CREATE INDEX IF NOT EXISTS idx_audit_user ON audit (user, ts);
+CREATE INDEX IF NOT EXISTS idx_audit_op ON audit (op_id);
+"""
+
+
+class AuditJSONFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.audit, ensure_ascii=False)
+
+
+class AuditSQLiteHandler(logging.Handler):
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._conn = None
+
+    def emit(self, record):
+        try:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.executescript(AUDIT_SCHEMA)
+            self._conn.execute(
+                f"INSERT INTO audit ({', '.join(AUDIT_FIELDS)}) VALUES ({', '.join('?' * len(AUDIT_FIELDS))})",
+                [record.audit.get(field) for field in AUDIT_FIELDS]
+            )
+            self._conn.commit()
+        except Exception:
+            self.handleError(record)
+
+    def prune(self, before):
+        self.acquire()
+        try:
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM audit WHERE ts < ?", (before,))
+                self._conn.commit()
+        finally:
+            self.release()
+
+
+def audit_log_path(base_path, replica=None):
+    if not replica:
+        return Path(base_path)
+    base_path = Path(base_path)
+    return base_path.with_name(f"{base_path.stem}-{replica}{base_path.suffix}")
+
+
+def audit_oldest_ts(base_path):
+    # ts más viejo que sigue en algún archivo JSON de auditoría (de cualquier
+    # réplica, rotado o no). Si un archivo desaparece mientras se recorre
+    # (otra réplica rotando) no se devuelve nada y el recorte queda para la
+    # próxima rotación
+    base_path = Path(base_path)
+    oldest = None
+    for path in base_path.parent.glob(f"{base_path.stem}*{base_path.suffix}*"):
+        try:
+            with open(path, encoding='utf-8') as f:
+                line = f.readline()
+        except FileNotFoundError:
+            return None
+        try:
+            ts = json.loads(line).get('ts')
+        except ValueError:
+            continue
+        if ts and (oldest is None or ts < oldest):
+            oldest = ts
+    return oldest
+
+
+class AuditRotatingFileHandler(logging.handlers.RotatingFileHandler):
+
+    def __init__(self, *args, index=None, base_path=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index = index
+        self.base_path = base_path or self.baseFilename
+
+    def doRollover(self):
+        super().doRollover()
+        if self.index is None:
+            return
+        try:
+            oldest = audit_oldest_ts(self.base_path)
+            if oldest:
+                self.index.prune(oldest)
+        except Exception as e:
+            logger.error(f"Error recortando el índice de auditoría: {e}")
+
+
+def build_audit_handlers(log_path, db_path, replica=None, max_bytes=AUDIT_MAX_BYTES,
+                         backup_count=AUDIT_BACKUP_COUNT):
+    index = AuditSQLiteHandler(db_path)
+    json_handler = AuditRotatingFileHandler(
+        audit_log_path(log_path, replica), maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8',
+        index=index, base_path=log_path
+    )
+    json_handler.setFormatter(AuditJSONFormatter())
+    return [json_handler, index]
+
+
+def query_audit(db_path, host=None, service=None, user=None, since=None, until=None, limit=500):
+    # host/servicio/usuario filtran por prefijo sin distinguir mayúsculas
+    # (usa los índices); since/until son datetime
+    if not Path(db_path).exists():
+        return []
+    clauses = []
+    params = []
+    for column, value in (('host', host), ('service', service), ('user', user)):
+        if value:
+            escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            clauses.append(f"{column} LIKE ? ESCAPE '\\'")
+            params.append(escaped + '%')
+    if since:
+        clauses.append("ts >= ?")
+        params.append(since.isoformat(timespec='seconds'))
+    if until:
+        clauses.append("ts < ?")
+        params.append(until.isoformat(timespec='seconds'))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            f"SELECT {', '.join(AUDIT_FIELDS)} FROM audit {where} ORDER BY ts DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
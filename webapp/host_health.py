@@ -0,0 +1,132 @@
+# /opt/rebootwebapp/host_health.py
+# Salud por host (circuit breaker) de RebootWebApp
+#
+# Tras BREAKER_THRESHOLD consultas seguidas sin respuesta (timeout o
+# inalcanzable) el host queda marcado como inalcanzable durante un backoff
+# exponencial: se informa así al instante, sin lanzar consultas. Al vencer el
+# backoff se prueba primero el puerto WinRM con un connect TCP corto y solo
+# si responde vuelve a consultarse.
+#
+# Vive fuera de app.py para que el estado de cada host sobreviva a los reruns
+# de Streamlit y sea el mismo para la UI, el sondeo y los trabajos.
+
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from telemetry import metrics
+
+logger = logging.getLogger('rebootwebapp.health')
+
+BREAKER_THRESHOLD = 2
+BREAKER_BACKOFF_SECONDS = 30
+BREAKER_BACKOFF_MAX_SECONDS = 600
+BREAKER_PROBE_TIMEOUT = 2
+BREAKER_PROBE_WORKERS = 32
+
+
+def probe_port(hostname, port, timeout=BREAKER_PROBE_TIMEOUT):
+    try:
+        with socket.create_connection((hostname, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def winrm_port(endpoint):
+    parsed = urlparse(endpoint.format(hostname='host'))
+    return parsed.port or (5986 if parsed.scheme == 'https' else 5985)
+
+
+class HostHealth:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def state(self, hostname, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._hosts.get(hostname)
+            if not entry or not entry['open_until']:
+                return 'closed'
+            return 'open' if now < entry['open_until'] else 'half_open'
+
+    def record_failure(self, hostname):
+        with self._lock:
+            entry = self._hosts.setdefault(hostname, {'failures': 0, 'open_until': None})
+            entry['failures'] += 1
+            if entry['failures'] < BREAKER_THRESHOLD:
+                return
+            backoff = min(
+                BREAKER_BACKOFF_SECONDS * 2 ** (entry['failures'] - BREAKER_THRESHOLD),
+                BREAKER_BACKOFF_MAX_SECONDS
+            )
+            if not entry['open_until']:
+                metrics.inc('rebootwebapp_hosts_unreachable')
+                logger.warning(f"Servidor {hostname} marcado como inalcanzable ({entry['failures']} fallos seguidos)")
+            entry['open_until'] = time.time() + backoff
+
+    def record_success(self, hostname):
+        with self._lock:
+            entry = self._hosts.pop(hostname, None)
+        if entry and entry['open_until']:
+            metrics.inc('rebootwebapp_hosts_unreachable', -1)
+            logger.info(f"Servidor {hostname} vuelve a responder")
+
+    def observe(self, hostname, host_status):
+        # Solo timeout/inalcanzable cuentan como fallo del host; un 'error'
+        # puede ser local (p. ej. ansible-playbook falló) y no cambia nada
+        states = set(host_status.values())
+        if states and states <= {'unreachable', 'timeout'}:
+            self.record_failure(hostname)
+        elif states - {'unreachable', 'timeout', 'error'}:
+            self.record_success(hostname)
+
+    def guard(self, fetch, port):
+        def guarded_fetch(host_services, on_host=None):
+            now = time.time()
+            status = {}
+            to_fetch = {}
+            to_probe = []
+            for hostname, services in host_services.items():
+                state = self.state(hostname, now)
+                if state == 'open':
+                    status[hostname] = {svc: 'unreachable' for svc in services}
+                elif state == 'half_open':
+                    to_probe.append(hostname)
+                else:
+                    to_fetch[hostname] = services
+            
+            if to_probe:
+                with ThreadPoolExecutor(max_workers=min(len(to_probe), BREAKER_PROBE_WORKERS)) as executor:
+                    reachable = executor.map(lambda h: probe_port(h, port), to_probe)
+                    for hostname, ok in zip(to_probe, reachable):
+                        metrics.inc('rebootwebapp_breaker_probes_total', result='ok' if ok else 'failed')
+                        if ok:
+                            to_fetch[hostname] = host_services[hostname]
+                        else:
+                            self.record_failure(hostname)
+                            status[hostname] = {svc: 'unreachable' for svc in host_services[hostname]}
+            
+            if on_host:
+                for hostname, host_status in status.items():
+                    on_host(hostname, host_status)
+            
+            if to_fetch:
+                observed = set()
+                def tracked(hostname, host_status):
+                    observed.add(hostname)
+                    self.observe(hostname, host_status)
+                    if on_host:
+                        on_host(hostname, host_status)
+                fetched = fetch(to_fetch, on_host=tracked)
+                for hostname, host_status in fetched.items():
+                    if hostname not in observed:
+                        self.observe(hostname, host_status)
+                status.update(fetched)
+            return status
+        return guarded_fetch
@@ -0,0 +1,167 @@
+# /opt/rebootwebapp/inventory.py
+# Inventario indexado de services_windows.yml
+#
+# Índice en memoria de todos los (grupo, servidor, servicio) de la
+# configuración, armado una vez por versión de services_windows.yml. Permite
+# ubicar un servicio por hostname, nombre, nombre visible o grupo sin recorrer
+# la lista anidada, y buscar por prefijo o por parte del nombre (trigramas).
+#
+# Vive fuera de app.py para que InventoryIndex sea la misma clase en todos los
+# reruns de Streamlit (el índice de cada versión se guarda con
+# st.cache_resource en app.py).
+
+import bisect
+
+RUNNING_STATES = ('running', 'started')
+
+
+def get_host_services(servers):
+    # Acepta los servidores de un grupo o de varios grupos a la vez
+    host_services = {}
+    for server in servers:
+        svc_names = host_services.setdefault(server['hostname'], [])
+        for svc in server['services']:
+            if svc['name'] not in svc_names:
+                svc_names.append(svc['name'])
+    return host_services
+
+
+STATE_FILTERS = {
+    'running': "🟢 Running",
+    'stopped': "🔴 Stopped",
+    'unreachable': "⚫ Sin conexión",
+    'otro': "🟡 Otro estado",
+    'pending': "⏳ Sin datos"
+}
+
+
+def state_filter(state):
+    state = (state or 'pending').lower()
+    if state in RUNNING_STATES:
+        return 'running'
+    if state in ('stopped', 'unreachable', 'pending'):
+        return state
+    return 'otro'
+
+
+class InventoryIndex:
+
+    def __init__(self, config):
+        self.entries = []
+        self._grupos = {}
+        self._grupo_entries = {}
+        self._grupo_host_services = {}
+        self._by_host = {}
+        self._by_service = {}
+        self._by_key = {}
+        self._trigrams = {}
+        self._terms = []
+        for grupo in config['grupos']:
+            self._grupos[grupo['id']] = grupo
+            self._grupo_entries[grupo['id']] = []
+            self._grupo_host_services[grupo['id']] = get_host_services(grupo['servers'])
+            for server in grupo['servers']:
+                for svc in server['services']:
+                    self._add({
+                        'grupo_id': grupo['id'],
+                        'grupo_nombre': grupo['nombre'],
+                        'hostname': server['hostname'],
+                        'display_name': server['display_name'],
+                        'service_name': svc['name'],
+                        'service_display': svc['display_name'],
+                        'server': server,
+                        'service': svc
+                    })
+        self._all_host_services = get_host_services(
+            [server for grupo in config['grupos'] for server in grupo['servers']]
+        )
+        # Términos ordenados para búsquedas por prefijo de menos de 3 caracteres
+        self._terms.sort()
+
+    def _add(self, entry):
+        idx = len(self.entries)
+        self.entries.append(entry)
+        hostname = entry['hostname'].lower()
+        service = entry['service_name'].lower()
+        self._grupo_entries[entry['grupo_id']].append(idx)
+        self._by_host.setdefault(hostname, []).append(idx)
+        self._by_service.setdefault(service, []).append(idx)
+        self._by_key.setdefault((hostname, service), []).append(idx)
+        for term in {hostname, service, entry['display_name'].lower(), entry['service_display'].lower()}:
+            self._terms.append((term, idx))
+            for pos in range(len(term) - 2):
+                self._trigrams.setdefault(term[pos:pos + 3], set()).add(idx)
+
+    # --- Búsquedas directas ---
+
+    def grupo(self, grupo_id):
+        return self._grupos.get(grupo_id)
+
+    def grupo_entries(self, grupo_id):
+        # Servicios del grupo en el orden del archivo de configuración
+        return [self.entries[idx] for idx in self._grupo_entries.get(grupo_id, [])]
+
+    def host_services(self, grupo_id=None):
+        # Mismo formato que get_host_services; precalculado, no copiar
+        if grupo_id is None:
+            return self._all_host_services
+        return self._grupo_host_services.get(grupo_id, {})
+
+    def by_host(self, hostname):
+        return [self.entries[idx] for idx in self._by_host.get(hostname.lower(), [])]
+
+    def by_service(self, service_name):
+        return [self.entries[idx] for idx in self._by_service.get(service_name.lower(), [])]
+
+    def lookup(self, hostname, service_name):
+        return [self.entries[idx] for idx in self._by_key.get((hostname.lower(), service_name.lower()), [])]
+
+    def servers_for_host(self, hostname):
+        servers = []
+        for entry in self.by_host(hostname):
+            if not any(server is entry['server'] for server in servers):
+                servers.append(entry['server'])
+        return servers
+
+    # --- Búsqueda por texto y estado ---
+
+    def _match(self, query):
+        # Índices de las entradas cuyo hostname, servicio o nombre visible
+        # contiene query (desde 3 caracteres) o empieza con query (1-2)
+        if len(query) < 3:
+            start = bisect.bisect_left(self._terms, (query,))
+            found = set()
+            for term, idx in self._terms[start:]:
+                if not term.startswith(query):
+                    break
+                found.add(idx)
+            return found
+        sets = sorted((self._trigrams.get(query[pos:pos + 3], set()) for pos in range(len(query) - 2)), key=len)
+        candidates = set(sets[0]).intersection(*sets[1:])
+        return {
+            idx for idx in candidates
+            if any(query in term.lower() for term in (
+                self.entries[idx]['hostname'], self.entries[idx]['service_name'],
+                self.entries[idx]['display_name'], self.entries[idx]['service_display']
+            ))
+        }
+
+    def search(self, query='', grupo_ids=None, states=None, status=None):
+        # states: claves de STATE_FILTERS; status: {hostname: {servicio: estado}}
+        query = (query or '').strip().lower()
+        if query:
+            found = self._match(query)
+        else:
+            found = range(len(self.entries))
+        if grupo_ids:
+            allowed = {idx for grupo_id in grupo_ids for idx in self._grupo_entries.get(grupo_id, [])}
+            found = [idx for idx in found if idx in allowed]
+        results = []
+        for idx in sorted(found):
+            entry = self.entries[idx]
+            if states:
+                state = (status or {}).get(entry['hostname'], {}).get(entry['service_name'])
+                if state_filter(state) not in states:
+                    continue
+            results.append(entry)
+        return results
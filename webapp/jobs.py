@@ -0,0 +1,264 @@
+# /opt/rebootwebapp/jobs.py
+# Trabajos de reinicio de RebootWebApp
+#
+# Vive fuera de app.py porque Streamlit vuelve a ejecutar app.py en cada rerun
+# mientras el JobManager (st.cache_resource) sobrevive con sus hilos: la clase
+# y PlaybookCancelled tienen que ser las mismas en todas las ejecuciones. Qué
+# se reinicia y cómo (Ansible, olas, verificación) lo pasa app.py.
+
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from shared_state import LEASE_TTL_SECONDS, REPLICA_ID, RestartConflict
+from telemetry import metrics
+
+logger = logging.getLogger('rebootwebapp.jobs')
+
+RESTART_WORKERS = 4
+JOB_MAINTENANCE_SECONDS = 1
+JOB_PRUNE_SECONDS = 3600
+
+
+class PlaybookCancelled(Exception):
+    pass
+
+
+# Los reinicios se ejecutan como trabajos en un pool de workers propio, fuera
+# del hilo del script de Streamlit. Cada trabajo se persiste en el estado
+# compartido para que la UI (de cualquier réplica) pueda reengancharse a su
+# progreso. Un trabajo toma leases sobre su grupo y sus servidores: mientras
+# corre se rechaza cualquier otro reinicio que se superponga.
+class JobManager:
+
+    def __init__(self, cache, plan, execute, status_fetch=None):
+        # plan(grupo, user_email, mode) arma los servicios y parámetros del
+        # trabajo y execute(manager, job_id) lo ejecuta; los pasa app.py
+        self.cache = cache
+        self.store = cache.store
+        self.history = cache.history
+        self.plan = plan
+        self.execute = execute
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._executor = ThreadPoolExecutor(max_workers=RESTART_WORKERS, thread_name_prefix='restart-job')
+        self.status_fetch = status_fetch
+        self._cancel_events = {}
+        self._load()
+        threading.Thread(target=self._maintain, name='restart-job-leases', daemon=True).start()
+
+    def _load(self):
+        # Trabajos de esta réplica que quedaron a medias por un reinicio de la aplicación
+        for job in self.store.list_active_jobs():
+            if job.get('owner', REPLICA_ID) == REPLICA_ID:
+                self._interrupt(job)
+
+    def _interrupt(self, job):
+        job['status'] = 'interrupted'
+        job['finished'] = datetime.now().isoformat(timespec='seconds')
+        self.store.save_job(job)
+
+    def _save(self, job):
+        self.store.save_job(job)
+
+    @staticmethod
+    def _lease_names(job):
+        # Un reinicio masivo toma además el lease de cada grupo incluido
+        grupo_ids = [job['grupo_id']] + [g for g in job.get('grupo_ids', []) if g != job['grupo_id']]
+        hostnames = sorted({item['hostname'].lower() for item in job['items']})
+        return [f"grupo:{grupo_id}" for grupo_id in grupo_ids] + [f"host:{hostname}" for hostname in hostnames]
+
+    def _acquire_leases(self, job):
+        acquired = []
+        for name in self._lease_names(job):
+            if not self.store.acquire_lease(name, job['id'], LEASE_TTL_SECONDS):
+                for held in acquired:
+                    self.store.release_lease(held, job['id'])
+                kind, target = name.split(':', 1)
+                if kind == 'grupo' and target == job['grupo_id']:
+                    raise RestartConflict("Ya hay un reinicio en curso para este grupo.")
+                if kind == 'grupo':
+                    raise RestartConflict(f"Ya hay un reinicio en curso para el grupo {target}.")
+                raise RestartConflict(f"{target} ya se está reiniciando en otro trabajo.")
+            acquired.append(name)
+
+    def _release_leases(self, job):
+        for name in self._lease_names(job):
+            self.store.release_lease(name, job['id'])
+
+    def _maintain(self):
+        # Renueva los leases de los trabajos de esta réplica, aplica las
+        # cancelaciones pedidas desde otras réplicas y borra los trabajos
+        # terminados más viejos que la retención
+        last_renewal = 0
+        last_prune = 0
+        while True:
+            time.sleep(JOB_MAINTENANCE_SECONDS)
+            if time.time() - last_prune >= JOB_PRUNE_SECONDS:
+                try:
+                    pruned = self.store.prune_jobs()
+                    if pruned:
+                        logger.info(f"Se borraron {pruned} trabajos terminados por retención")
+                except Exception as e:
+                    logger.error(f"Error borrando trabajos viejos: {e}")
+                last_prune = time.time()
+            with self._lock:
+                running = [(job_id, self._jobs[job_id]) for job_id in self._cancel_events]
+            renew = time.time() - last_renewal >= LEASE_TTL_SECONDS / 3
+            for job_id, job in running:
+                try:
+                    if renew:
+                        for name in self._lease_names(job):
+                            if not self.store.acquire_lease(name, job_id, LEASE_TTL_SECONDS):
+                                logger.error(f"Trabajo {job_id}: se perdió el lease {name}")
+                    if self.store.cancel_requested(job_id):
+                        self.cancel(job_id)
+                except Exception as e:
+                    logger.error(f"Error manteniendo el trabajo {job_id}: {e}")
+            if renew:
+                last_renewal = time.time()
+
+    def submit(self, grupo, user_email, mode):
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'owner': REPLICA_ID,
+            **self.plan(grupo, user_email, mode),
+            'status': 'queued',
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'started': None,
+            'finished': None,
+            'label': "⏳ En cola...",
+            'wait_until': None,
+            'cancelled': False,
+            'messages': []
+        }
+        self._acquire_leases(job)
+        with self._lock:
+            self._jobs[job['id']] = job
+            self._cancel_events[job['id']] = threading.Event()
+            self._save(job)
+        self._executor.submit(self._run, job['id'])
+        return job['id']
+
+    def cancel(self, job_id):
+        # Todo bajo el lock: el finally de _run puede estar cerrando el
+        # trabajo y sacándolo de _jobs al mismo tiempo
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+            if event is not None:
+                job = self._jobs[job_id]
+                if not event.is_set() and job['status'] != 'finished':
+                    event.set()
+                    job['cancelled'] = True
+                    job['messages'].append("⛔ Cancelación solicitada")
+                    self._save(job)
+                return
+        # Trabajo de otra réplica: lo aplica la réplica dueña
+        self.store.request_cancel(job_id)
+
+    def cancel_event(self, job_id):
+        with self._lock:
+            return self._cancel_events[job_id]
+
+    def _run(self, job_id):
+        try:
+            with metrics.inflight('rebootwebapp_restart_jobs_inflight'):
+                if not self.cancel_event(job_id).is_set():
+                    self.execute(self, job_id)
+        except PlaybookCancelled:
+            pass
+        except Exception as e:
+            logger.error(f"ERROR | Trabajo: {job_id} | {e}")
+            self.write(job_id, f"❌ Error inesperado: {e}")
+        finally:
+            job = self.get(job_id)
+            if job['cancelled']:
+                for item in job['items']:
+                    if item['result'] in ('pending', 'running'):
+                        self.set_item_result(job_id, item['hostname'], [item['service_name']], 'cancelled')
+            if job['cancelled']:
+                result = 'cancelled'
+            elif all(item['result'] == 'ok' for item in self.get(job_id)['items']):
+                result = 'ok'
+            else:
+                result = 'error'
+            metrics.inc('rebootwebapp_restart_jobs_total', mode=job['mode'], result=result)
+            self.update(job_id, status='finished', wait_until=None,
+                        finished=datetime.now().isoformat(timespec='seconds'))
+            # Lo verificado ya quedó fresco en cache; el resto se vuelve a consultar
+            self.cache.invalidate({item['hostname'] for item in self.get(job_id)['items'] if not item.get('verified')})
+            self._release_leases(job)
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+                self._jobs.pop(job_id, None)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return json.loads(json.dumps(job))
+        return self.store.load_job(job_id)
+
+    def update(self, job_id, persist=True, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            if persist:
+                self._save(job)
+
+    def set_item_result(self, job_id, hostname, service_names, result):
+        with self._lock:
+            job = self._jobs[job_id]
+            for item in job['items']:
+                if item['hostname'] == hostname and item['service_name'] in service_names:
+                    item['result'] = result
+                    if result == 'ok' and not item.get('restarted_at'):
+                        item['restarted_at'] = time.time()
+            self._save(job)
+        if result == 'error' and self.history:
+            for service_name in service_names:
+                self.history.record_restart(hostname, service_name, 'error', op_id=job_id)
+
+    def set_item_verified(self, job_id, hostname, service_name, verified, time_to_running=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            for item in job['items']:
+                if item['hostname'] == hostname and item['service_name'] == service_name:
+                    item['verified'] = verified
+                    item['time_to_running'] = time_to_running
+            self._save(job)
+        if self.history:
+            self.history.record_restart(hostname, service_name, 'running' if verified else 'not_running',
+                                        time_to_running, op_id=job_id)
+
+    def write(self, job_id, message):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['messages'].append(message)
+            self._save(job)
+
+    def active_jobs(self, grupo_id):
+        active = []
+        for job in self.store.list_active_jobs(grupo_id):
+            with self._lock:
+                local = job['id'] in self._jobs
+            # Sin lease de grupo vigente la réplica dueña ya no existe (se
+            # relee el trabajo por si terminó entre ambas consultas)
+            if not local and self.store.lease_owner(f"grupo:{grupo_id}") != job['id']:
+                job = self.store.load_job(job['id'])
+                if job['status'] in ('queued', 'running'):
+                    logger.warning(f"Trabajo {job['id']} de la réplica {job.get('owner')} sin lease, se marca interrumpido")
+                    self._interrupt(job)
+                continue
+            active.append(job['id'])
+        # Un reinicio masivo que incluye este grupo también cuenta
+        owner = self.store.lease_owner(f"grupo:{grupo_id}")
+        if owner and owner not in active:
+            job = self.get(owner)
+            if job and job['status'] in ('queued', 'running'):
+                active.append(owner)
+        return active
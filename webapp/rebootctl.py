@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# /opt/rebootwebapp/rebootctl.py
+# CLI de RebootWebApp sobre la API HTTP (api.py)
+#
+#   rebootctl.py status [--host H | --grupo G] [--force]
+#   rebootctl.py search [TEXTO] [--grupo G] [--estado stopped ...]
+#   rebootctl.py restart --grupo G [--grupo G2 ...] [--servicio HOST/SERVICIO ...] [--modo M] [--no-follow]
+#   rebootctl.py job ID [--follow]
+#   rebootctl.py cancel ID
+#
+# El token se toma de --token o de la variable REBOOTWEBAPP_TOKEN. Códigos de
+# salida: 0 ok, 1 error de la API, 2 reinicio con servicios fallidos o sin
+# volver a Running, 3 cancelado o interrumpido.
+
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+
+DEFAULT_URL = "http://127.0.0.1:8600"
+FOLLOW_WAIT_SECONDS = 30
+
+
+class CLIError(Exception):
+    pass
+
+
+def call(args, method, path, params=None, body=None, timeout=None):
+    url = args.url.rstrip('/') + path
+    if params:
+        url += '?' + urllib.parse.urlencode(params)
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={
+        'Authorization': f"Bearer {args.token}",
+        'Content-Type': 'application/json'
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=timeout or FOLLOW_WAIT_SECONDS + 30) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read()).get('error', e.reason)
+        except ValueError:
+            message = e.reason
+        raise CLIError(f"{e.code}: {message}")
+    except urllib.error.URLError as e:
+        raise CLIError(f"no se pudo conectar a {args.url}: {e.reason}")
+
+
+def cmd_status(args):
+    params = {}
+    if args.host:
+        params['host'] = args.host
+    if args.grupo:
+        params['grupo'] = args.grupo
+    if args.force:
+        params['force'] = '1'
+    result = call(args, 'GET', '/api/v1/status', params)
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        return 0
+    for hostname, services in sorted(result['hosts'].items()):
+        for service, state in sorted(services.items()):
+            print(f"{hostname}\t{service}\t{state}")
+    return 0
+
+
+def cmd_search(args):
+    params = {'q': args.texto}
+    if args.grupo:
+        params['grupo'] = args.grupo
+    if args.estado:
+        params['estado'] = ','.join(args.estado)
+    result = call(args, 'GET', '/api/v1/services', params)
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        return 0
+    for service in result['services']:
+        print(f"{service['grupo']}\t{service['hostname']}\t{service['service_name']}\t{service['state'] or '-'}")
+    return 0
+
+
+def follow(args, job_id):
+    since = 0
+    while True:
+        job = call(args, 'GET', f'/api/v1/jobs/{job_id}', {'since': since, 'wait': FOLLOW_WAIT_SECONDS})
+        for message in job['messages']:
+            print(message, flush=True)
+        since = job['next']
+        if job['status'] not in ('queued', 'running'):
+            return job
+
+
+def exit_code(job):
+    if job['cancelled'] or job['status'] == 'interrupted':
+        return 3
+    if any(item['result'] != 'ok' or item['verified'] is False for item in job['items']):
+        return 2
+    return 0
+
+
+def cmd_restart(args):
+    body = {'modo': args.modo}
+    if args.servicio:
+        body['servicios'] = [pair.split('/', 1) for pair in args.servicio]
+    if len(args.grupo) == 1 and not args.servicio:
+        body['grupo'] = args.grupo[0]
+    else:
+        body['grupos'] = args.grupo
+    job_id = call(args, 'POST', '/api/v1/restart', body=body)['job_id']
+    print(f"Trabajo {job_id}", file=sys.stderr)
+    if args.no_follow:
+        print(job_id)
+        return 0
+    return exit_code(follow(args, job_id))
+
+
+def cmd_job(args):
+    if args.follow:
+        return exit_code(follow(args, args.job_id))
+    print(json.dumps(call(args, 'GET', f'/api/v1/jobs/{args.job_id}'), indent=2, ensure_ascii=False))
+    return 0
+
+
+def cmd_cancel(args):
+    call(args, 'POST', f'/api/v1/jobs/{args.job_id}/cancel', body={})
+    print(f"Cancelación solicitada para {args.job_id}", file=sys.stderr)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI de RebootWebApp")
+    parser.add_argument("--url", default=os.environ.get('REBOOTWEBAPP_URL', DEFAULT_URL))
+    parser.add_argument("--token", default=os.environ.get('REBOOTWEBAPP_TOKEN'))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    status = commands.add_parser("status", help="Estado de servicios")
+    target = status.add_mutually_exclusive_group()
+    target.add_argument("--host")
+    target.add_argument("--grupo")
+    status.add_argument("--force", action="store_true", help="Ignorar el cache")
+    status.add_argument("--json", action="store_true")
+    status.set_defaults(func=cmd_status)
+
+    search = commands.add_parser("search", help="Buscar servicios en el inventario")
+    search.add_argument("texto", nargs="?", default="")
+    search.add_argument("--grupo")
+    search.add_argument("--estado", action="append",
+                        choices=("running", "stopped", "unreachable", "otro", "pending"))
+    search.add_argument("--json", action="store_true")
+    search.set_defaults(func=cmd_search)
+
+    restart = commands.add_parser("restart", help="Reiniciar uno o más grupos")
+    restart.add_argument("--grupo", action="append", required=True)
+    restart.add_argument("--servicio", action="append", help="HOST/SERVICIO; limita el reinicio a esos servicios")
+    restart.add_argument("--modo", default="paralelo", choices=("paralelo", "olas", "secuencial"))
+    restart.add_argument("--no-follow", action="store_true", help="Solo imprimir el id del trabajo")
+    restart.set_defaults(func=cmd_restart)
+
+    job = commands.add_parser("job", help="Estado de un trabajo de reinicio")
+    job.add_argument("job_id")
+    job.add_argument("--follow", action="store_true")
+    job.set_defaults(func=cmd_job)
+
+    cancel = commands.add_parser("cancel", help="Cancelar un trabajo de reinicio")
+    cancel.add_argument("job_id")
+    cancel.set_defaults(func=cmd_cancel)
+
+    args = parser.parse_args()
+    if not args.token:
+        parser.error("falta el token (--token o REBOOTWEBAPP_TOKEN)")
+    try:
+        sys.exit(args.func(args))
+    except CLIError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
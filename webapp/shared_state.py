@@ -0,0 +1,379 @@
+# /opt/rebootwebapp/shared_state.py
+# Estado compartido entre réplicas de RebootWebApp
+#
+# Cache de estado, registro de trabajos de reinicio, pedidos de cancelación y
+# leases (locks con vencimiento) por grupo y por servidor. Se elige con
+# `estado_compartido` en services_windows.yml:
+#   memoria  - en el proceso, trabajos en jobs/ (una sola réplica)
+#   sqlite   - archivo SQLite local compartido por las réplicas del mismo host
+#   redis    - servidor Redis (o compatible), réplicas en distintos hosts
+# Todas las implementaciones tienen la misma interfaz.
+#
+# Los trabajos terminados se conservan job_retention segundos desde que
+# terminaron (None: para siempre). memoria y sqlite los borran en
+# prune_jobs(), que el JobManager llama periódicamente; redis les pone
+# vencimiento al guardarlos.
+#
+# Vive fuera de app.py porque Streamlit vuelve a ejecutar app.py en cada rerun
+# mientras el JobManager (st.cache_resource) sobrevive: RestartConflict y los
+# stores tienen que ser las mismas clases en todas las ejecuciones.
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger('rebootwebapp.state')
+
+# Dueño de los trabajos y leases de este proceso
+REPLICA_ID = os.environ.get('REBOOTWEBAPP_REPLICA') or socket.gethostname()
+LEASE_TTL_SECONDS = 60
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS status (
+    hostname TEXT NOT NULL,
+    service TEXT NOT NULL,
+    state TEXT NOT NULL,
+    ts REAL NOT NULL,
+    PRIMARY KEY (hostname, service)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    grupo_id TEXT,
+    status TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, grupo_id);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cancels (
+    job_id TEXT PRIMARY KEY,
+    ts REAL NOT NULL
+);
+"""
+
+
+class RestartConflict(Exception):
+    pass
+
+
+def finished_cutoff(retention):
+    # job['finished'] es isoformat local a segundos: se compara como texto
+    return datetime.fromtimestamp(time.time() - retention).isoformat(timespec='seconds')
+
+
+def job_expired(job, cutoff):
+    return job['status'] not in ('queued', 'running') and bool(job.get('finished')) and job['finished'] < cutoff
+
+
+class MemoryState:
+
+    def __init__(self, jobs_path=None, job_retention=None):
+        self.jobs_path = Path(jobs_path) if jobs_path else None
+        self.job_retention = job_retention
+        self._lock = threading.Lock()
+        self._status = {}
+        self._jobs = {}
+        self._leases = {}
+        self._cancels = set()
+        if self.jobs_path:
+            self.jobs_path.mkdir(exist_ok=True)
+            for path in self.jobs_path.glob('*.json'):
+                try:
+                    with open(path, 'r') as f:
+                        job = json.load(f)
+                except Exception as e:
+                    logger.error(f"Error leyendo trabajo {path.name}: {e}")
+                    continue
+                self._jobs[job['id']] = job
+            self.prune_jobs()
+
+    def get_status(self, host_services):
+        with self._lock:
+            return {
+                hostname: {svc: self._status[(hostname, svc)] for svc in services if (hostname, svc) in self._status}
+                for hostname, services in host_services.items()
+            }
+
+    def put_status(self, hostname, host_status, ts):
+        with self._lock:
+            for svc, state in host_status.items():
+                self._status[(hostname, svc)] = (state, ts)
+
+    def delete_status(self, hostnames=None):
+        with self._lock:
+            if hostnames is None:
+                self._status.clear()
+            else:
+                hostnames = set(hostnames)
+                for key in [k for k in self._status if k[0] in hostnames]:
+                    del self._status[key]
+
+    def save_job(self, job):
+        data = json.dumps(job)
+        with self._lock:
+            self._jobs[job['id']] = json.loads(data)
+        if self.jobs_path:
+            tmp_path = self.jobs_path / f"{job['id']}.json.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.jobs_path / f"{job['id']}.json")
+
+    def load_job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job else None
+
+    def list_active_jobs(self, grupo_id=None):
+        with self._lock:
+            return [
+                json.loads(json.dumps(job)) for job in self._jobs.values()
+                if job['status'] in ('queued', 'running') and grupo_id in (None, job['grupo_id'])
+            ]
+
+    def prune_jobs(self):
+        if self.job_retention is None:
+            return 0
+        cutoff = finished_cutoff(self.job_retention)
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job_expired(job, cutoff)]
+            for job_id in expired:
+                del self._jobs[job_id]
+                self._cancels.discard(job_id)
+        if self.jobs_path:
+            for job_id in expired:
+                try:
+                    (self.jobs_path / f"{job_id}.json").unlink()
+                except FileNotFoundError:
+                    pass
+        return len(expired)
+
+    def request_cancel(self, job_id):
+        with self._lock:
+            self._cancels.add(job_id)
+
+    def cancel_requested(self, job_id):
+        with self._lock:
+            return job_id in self._cancels
+
+    def acquire_lease(self, name, owner, ttl):
+        # También renueva el lease si ya es de `owner`
+        with self._lock:
+            now = time.time()
+            current = self._leases.get(name)
+            if current and current[0] != owner and current[1] > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+    def release_lease(self, name, owner):
+        with self._lock:
+            if self._leases.get(name, (None,))[0] == owner:
+                del self._leases[name]
+
+    def lease_owner(self, name):
+        with self._lock:
+            current = self._leases.get(name)
+            return current[0] if current and current[1] > time.time() else None
+
+
+class SQLiteState:
+
+    def __init__(self, path, job_retention=None):
+        self.path = Path(path)
+        self.job_retention = job_retention
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(STATE_SCHEMA)
+
+    def _conn(self):
+        # Una conexión por hilo; WAL para lectores concurrentes entre procesos
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_status(self, host_services):
+        result = {hostname: {} for hostname in host_services}
+        hostnames = list(host_services)
+        for start in range(0, len(hostnames), 500):
+            chunk = hostnames[start:start + 500]
+            rows = self._conn().execute(
+                f"SELECT hostname, service, state, ts FROM status WHERE hostname IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            for hostname, svc, state, ts in rows:
+                if svc in host_services[hostname]:
+                    result[hostname][svc] = (state, ts)
+        return result
+
+    def put_status(self, hostname, host_status, ts):
+        self._conn().executemany(
+            "INSERT OR REPLACE INTO status (hostname, service, state, ts) VALUES (?, ?, ?, ?)",
+            [(hostname, svc, state, ts) for svc, state in host_status.items()]
+        )
+
+    def delete_status(self, hostnames=None):
+        if hostnames is None:
+            self._conn().execute("DELETE FROM status")
+            return
+        self._conn().executemany("DELETE FROM status WHERE hostname = ?", [(h,) for h in hostnames])
+
+    def save_job(self, job):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO jobs (id, grupo_id, status, data) VALUES (?, ?, ?, ?)",
+            (job['id'], job['grupo_id'], job['status'], json.dumps(job))
+        )
+
+    def load_job(self, job_id):
+        row = self._conn().execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list_active_jobs(self, grupo_id=None):
+        query = "SELECT data FROM jobs WHERE status IN ('queued', 'running')"
+        params = []
+        if grupo_id is not None:
+            query += " AND grupo_id = ?"
+            params.append(grupo_id)
+        return [json.loads(row[0]) for row in self._conn().execute(query, params)]
+
+    def prune_jobs(self):
+        if self.job_retention is None:
+            return 0
+        conn = self._conn()
+        cursor = conn.execute(
+            "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND json_extract(data, '$.finished') < ?",
+            (finished_cutoff(self.job_retention),)
+        )
+        conn.execute("DELETE FROM cancels WHERE ts < ?", (time.time() - self.job_retention,))
+        return cursor.rowcount
+
+    def request_cancel(self, job_id):
+        self._conn().execute("INSERT OR REPLACE INTO cancels (job_id, ts) VALUES (?, ?)", (job_id, time.time()))
+
+    def cancel_requested(self, job_id):
+        return self._conn().execute("SELECT 1 FROM cancels WHERE job_id = ?", (job_id,)).fetchone() is not None
+
+    def acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+            "WHERE leases.owner = excluded.owner OR leases.expires <= ?",
+            (name, owner, now + ttl, now)
+        )
+        return cursor.rowcount == 1
+
+    def release_lease(self, name, owner):
+        self._conn().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def lease_owner(self, name):
+        row = self._conn().execute(
+            "SELECT owner FROM leases WHERE name = ? AND expires > ?", (name, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+
+class RedisState:
+
+    PREFIX = "rebootwebapp:"
+    ACQUIRE_SCRIPT = """
+    local current = redis.call('get', KEYS[1])
+    if current == false or current == ARGV[1] then
+        redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+        return 1
+    end
+    return 0
+    """
+    RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url, job_retention=None):
+        import redis
+        self.job_retention = job_retention
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._acquire = self._redis.register_script(self.ACQUIRE_SCRIPT)
+        self._release = self._redis.register_script(self.RELEASE_SCRIPT)
+
+    def get_status(self, host_services):
+        pipe = self._redis.pipeline(transaction=False)
+        for hostname, services in host_services.items():
+            pipe.hmget(f"{self.PREFIX}status:{hostname}", services)
+        result = {}
+        for (hostname, services), values in zip(host_services.items(), pipe.execute()):
+            result[hostname] = {svc: tuple(json.loads(value)) for svc, value in zip(services, values) if value}
+        return result
+
+    def put_status(self, hostname, host_status, ts):
+        self._redis.hset(
+            f"{self.PREFIX}status:{hostname}",
+            mapping={svc: json.dumps([state, ts]) for svc, state in host_status.items()}
+        )
+
+    def delete_status(self, hostnames=None):
+        if hostnames is None:
+            keys = list(self._redis.scan_iter(f"{self.PREFIX}status:*"))
+        else:
+            keys = [f"{self.PREFIX}status:{hostname}" for hostname in hostnames]
+        if keys:
+            self._redis.delete(*keys)
+
+    def save_job(self, job):
+        pipe = self._redis.pipeline()
+        if job['status'] in ('queued', 'running'):
+            pipe.set(f"{self.PREFIX}job:{job['id']}", json.dumps(job))
+            pipe.sadd(f"{self.PREFIX}jobs:active", job['id'])
+        else:
+            # Terminado: vence solo después de job_retention
+            ttl = int(self.job_retention) if self.job_retention is not None else None
+            pipe.set(f"{self.PREFIX}job:{job['id']}", json.dumps(job), ex=ttl)
+            pipe.srem(f"{self.PREFIX}jobs:active", job['id'])
+        pipe.execute()
+
+    def load_job(self, job_id):
+        data = self._redis.get(f"{self.PREFIX}job:{job_id}")
+        return json.loads(data) if data else None
+
+    def list_active_jobs(self, grupo_id=None):
+        job_ids = sorted(self._redis.smembers(f"{self.PREFIX}jobs:active"))
+        if not job_ids:
+            return []
+        jobs = [json.loads(data) for data in self._redis.mget([f"{self.PREFIX}job:{i}" for i in job_ids]) if data]
+        return [
+            job for job in jobs
+            if job['status'] in ('queued', 'running') and grupo_id in (None, job['grupo_id'])
+        ]
+
+    def prune_jobs(self):
+        # Los trabajos terminados vencen solos (ver save_job)
+        return 0
+
+    def request_cancel(self, job_id):
+        self._redis.set(f"{self.PREFIX}cancel:{job_id}", 1, ex=86400)
+
+    def cancel_requested(self, job_id):
+        return bool(self._redis.exists(f"{self.PREFIX}cancel:{job_id}"))
+
+    def acquire_lease(self, name, owner, ttl):
+        return bool(self._acquire(keys=[f"{self.PREFIX}lease:{name}"], args=[owner, int(ttl * 1000)]))
+
+    def release_lease(self, name, owner):
+        self._release(keys=[f"{self.PREFIX}lease:{name}"], args=[owner])
+
+    def lease_owner(self, name):
+        return self._redis.get(f"{self.PREFIX}lease:{name}")
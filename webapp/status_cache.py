@@ -0,0 +1,235 @@
+# /opt/rebootwebapp/status_cache.py
+# Cache, carga en segundo plano y sondeo del estado de los servicios
+#
+# Vive fuera de app.py porque Streamlit vuelve a ejecutar app.py en cada rerun
+# mientras el cache, el loader y el poller (st.cache_resource) sobreviven:
+# tienen que ser las mismas clases en todas las ejecuciones. La función de
+# consulta (Ansible o WinRM, con el circuit breaker) la pasa app.py.
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from inventory import get_host_services
+from shared_state import LEASE_TTL_SECONDS, REPLICA_ID, MemoryState
+
+logger = logging.getLogger('rebootwebapp.status')
+
+# Resultados de una consulta fallida, que no pisan una entrada vigente
+FAILED_FETCH_STATES = {'timeout', 'error'}
+STATUS_LOADER_WORKERS = 4
+POLLER_JITTER = 0.1
+POLLER_IDLE_SECONDS = 5
+
+
+# Cache de estado compartido entre sesiones, por (hostname, servicio).
+# Las consultas concurrentes al mismo host esperan a la consulta en curso
+# y reutilizan su resultado en lugar de lanzar otro ansible-playbook.
+class StatusCache:
+
+    def __init__(self, store=None, history=None):
+        # Las entradas viven en el estado compartido; el single-flight es por proceso.
+        # Cada consulta se registra además en el historial, si hay uno
+        self.store = store or MemoryState()
+        self.history = history
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    @staticmethod
+    def _lookup(entries, services, now, ttl):
+        cached = {}
+        for svc in services:
+            entry = entries.get(svc)
+            if not entry or now - entry[1] >= ttl:
+                return None
+            cached[svc] = entry[0]
+        return cached
+
+    def _store(self, hostname, services, host_status, ttl=None):
+        # Un timeout/error del lote completo no pisa una entrada vigente
+        # (p. ej. guardada por otra réplica mientras tanto)
+        now = time.time()
+        statuses = {svc: host_status.get(svc, 'unknown') for svc in services}
+        if ttl is not None and set(statuses.values()) <= FAILED_FETCH_STATES:
+            current = self.store.get_status({hostname: services}).get(hostname, {})
+            if self._lookup(current, services, now, ttl) is not None:
+                return
+        self.store.put_status(hostname, statuses, now)
+        if self.history:
+            self.history.record_status(hostname, statuses, now)
+
+    def get_many(self, host_services, ttl, force=False, fetch=None):
+        # fetch: función de consulta (get_services_status_batch, WinRM, ...)
+        result = {}
+        pending = dict(host_services)
+        while pending:
+            to_fetch = {}
+            to_wait = []
+            own_event = threading.Event()
+            entries = {} if force else self.store.get_status(pending)
+            with self._lock:
+                now = time.time()
+                for hostname, services in list(pending.items()):
+                    if not force:
+                        cached = self._lookup(entries.get(hostname, {}), services, now, ttl)
+                        if cached is not None:
+                            result[hostname] = cached
+                            del pending[hostname]
+                            continue
+                    event = self._inflight.get(hostname)
+                    if event is None:
+                        to_fetch[hostname] = services
+                        self._inflight[hostname] = own_event
+                    else:
+                        to_wait.append(event)
+            if to_fetch:
+                try:
+                    # Cada host se publica en cuanto llega, sin esperar al resto del lote
+                    published = set()
+                    def on_host(hostname, host_status):
+                        published.add(hostname)
+                        self._store(hostname, to_fetch[hostname], host_status)
+                    fetched = fetch(to_fetch, on_host=on_host)
+                    for hostname, services in to_fetch.items():
+                        host_status = fetched.get(hostname, {})
+                        if hostname not in published:
+                            self._store(hostname, services, host_status, ttl)
+                        result[hostname] = host_status
+                        del pending[hostname]
+                finally:
+                    with self._lock:
+                        for hostname in to_fetch:
+                            if self._inflight.get(hostname) is own_event:
+                                del self._inflight[hostname]
+                    own_event.set()
+            # Hosts con una consulta en curso en otra sesión: se espera su resultado
+            for event in to_wait:
+                event.wait()
+            force = False
+        return result
+
+    def peek(self, host_services):
+        # Devuelve lo que haya en cache sin consultar ni respetar el TTL:
+        # (estado, timestamp de la entrada más antigua, si están todos los servicios)
+        status = {}
+        oldest = None
+        complete = True
+        entries = self.store.get_status(host_services)
+        for hostname, services in host_services.items():
+            for svc in services:
+                entry = entries.get(hostname, {}).get(svc)
+                if entry is None:
+                    complete = False
+                    continue
+                status.setdefault(hostname, {})[svc] = entry[0]
+                if oldest is None or entry[1] < oldest:
+                    oldest = entry[1]
+        return status, oldest, complete
+
+    def invalidate(self, hostnames=None):
+        self.store.delete_status(hostnames)
+
+
+# Carga de estado en segundo plano: el render nunca espera a Ansible, muestra
+# lo que haya en cache y se completa a medida que llegan los resultados.
+class StatusLoader:
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=STATUS_LOADER_WORKERS, thread_name_prefix='status-loader')
+        self._futures = {}
+        self._pending_force = {}
+
+    def submit(self, key, servers, ttl, force=False, fetch=None):
+        host_services = get_host_services(servers)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None or future.done():
+                future = self._executor.submit(self.cache.get_many, host_services, ttl, force, fetch)
+                self._futures[key] = future
+                return future
+            if not force:
+                return future
+            # La carga en curso puede haber leído antes de lo que motivó el
+            # refresco forzado (p. ej. un reinicio): se descarta el cache de
+            # esos hosts y se encadena otra carga forzada al terminar
+            self.cache.invalidate(list(host_services))
+            chain = key not in self._pending_force
+            self._pending_force[key] = (host_services, ttl, fetch)
+        if chain:
+            future.add_done_callback(lambda _: self._run_pending_force(key))
+        return future
+
+    def _run_pending_force(self, key):
+        with self._lock:
+            pending = self._pending_force.pop(key, None)
+            if pending is None:
+                return
+            host_services, ttl, fetch = pending
+            self._futures[key] = self._executor.submit(self.cache.get_many, host_services, ttl, True, fetch)
+
+    def is_loading(self, key):
+        with self._lock:
+            future = self._futures.get(key)
+            return key in self._pending_force or (future is not None and not future.done())
+
+
+# Sondeo periódico de todos los hosts configurados (auto_refresh_segundos),
+# independiente de las sesiones abiertas. En cada tick se consultan todos los
+# hosts en un solo lote; el jitter va sobre el tick, para que las réplicas y
+# los reinicios del proceso no queden sincronizados.
+class StatusPoller:
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._host_services = {}
+        self._next_tick = 0
+        self._interval = 0
+        self._fetch = None
+        self._thread = None
+
+    @property
+    def active(self):
+        return self._interval > 0
+
+    def configure(self, host_services, interval, fetch):
+        with self._lock:
+            if interval != self._interval:
+                self._next_tick = time.time() + random.uniform(0, interval * POLLER_JITTER)
+            self._host_services = host_services
+            self._interval = interval
+            self._fetch = fetch
+            if interval > 0 and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='status-poller', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                interval = self._interval
+                host_services = self._host_services
+                fetch = self._fetch
+                next_tick = self._next_tick if interval > 0 else now + POLLER_IDLE_SECONDS
+
+            if interval > 0 and host_services and next_tick <= now:
+                # Con varias réplicas sondea solo la que tiene el lease; el
+                # resultado llega a las demás por el estado compartido
+                try:
+                    if self.cache.store.acquire_lease('poller', REPLICA_ID, max(interval * 3, LEASE_TTL_SECONDS)):
+                        self.cache.get_many(host_services, interval, force=True, fetch=fetch)
+                except Exception as e:
+                    logger.error(f"Error en sondeo de estado: {e}")
+                with self._lock:
+                    jitter = self._interval * POLLER_JITTER
+                    self._next_tick = time.time() + self._interval + random.uniform(-jitter, jitter)
+                continue
+
+            self._wakeup.wait(max(next_tick - now, 0.1))
+            self._wakeup.clear()
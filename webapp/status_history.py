@@ -0,0 +1,421 @@
+# /opt/rebootwebapp/status_history.py
+# Historial de estados y timeouts adaptativos de RebootWebApp
+#
+# Vive fuera de app.py para que StatusHistory (con su hilo de escritura) y
+# TimeoutAdvisor se definan una sola vez por proceso y no en cada rerun de
+# Streamlit.
+
+import logging
+import math
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from inventory import RUNNING_STATES
+from telemetry import metrics
+
+logger = logging.getLogger('rebootwebapp.history')
+
+HISTORY_FLUSH_SECONDS = 5
+HISTORY_QUEUE_MAX = 100000
+HISTORY_GAP_SECONDS = 600
+HISTORY_PRUNE_SECONDS = 3600
+HISTORY_RAW_RETENTION_DAYS = 30
+HISTORY_HOURLY_RETENTION_DAYS = 180
+HISTORY_DAILY_RETENTION_DAYS = 1095
+TIMEOUT_PERCENTILE = 0.95
+TIMEOUT_FACTOR = 3
+TIMEOUT_SAMPLES = 50
+TIMEOUT_MIN_SAMPLES = 5
+
+# Serie temporal local de estados y reinicios, para ver cuánto flapea un
+# servicio y cuánto tarda en volver a Running. Las observaciones se encolan y
+# un hilo las escribe en lotes, así el refresco de estado no espera al disco.
+#   segments - tramos de estado constante (detalle, HISTORY_RAW_RETENTION_DAYS)
+#   rollups  - segundos observados y en Running y cambios de estado, por hora
+#              y por día; se actualizan al escribir cada tramo
+#   restarts - resultado de cada reinicio y tiempo hasta Running
+#   durations - duración de cada consulta (por servidor) y de cada reinicio
+#              (por servicio), para los timeouts adaptativos; solo las
+#              últimas TIMEOUT_SAMPLES de cada serie
+# Las consultas por período leen los rollups, no el detalle.
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    hostname TEXT NOT NULL COLLATE NOCASE,
+    service TEXT NOT NULL COLLATE NOCASE,
+    UNIQUE (hostname, service)
+);
+CREATE TABLE IF NOT EXISTS segments (
+    series_id INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (series_id, start)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    series_id INTEGER NOT NULL,
+    resolution INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    observed INTEGER NOT NULL,
+    running INTEGER NOT NULL,
+    transitions INTEGER NOT NULL,
+    PRIMARY KEY (series_id, resolution, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS restarts (
+    series_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    outcome TEXT NOT NULL,
+    time_to_running REAL,
+    op_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_restarts_series ON restarts (series_id, ts);
+CREATE INDEX IF NOT EXISTS idx_restarts_ts ON restarts (ts);
+CREATE TABLE IF NOT EXISTS durations (
+    series_id INTEGER NOT NULL,
+    operation TEXT NOT NULL,
+    ts REAL NOT NULL,
+    seconds REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_durations_series ON durations (series_id, operation, ts);
+"""
+HISTORY_HOUR = 3600
+HISTORY_DAY = 86400
+# Estados que no son una observación real del servicio
+HISTORY_SKIP_STATES = ('unknown', 'pending')
+
+
+def history_bucket(ts, resolution):
+    # Las horas se alinean al epoch; los días a la medianoche local
+    if resolution == HISTORY_HOUR:
+        return ts - ts % HISTORY_HOUR
+    return int(datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+
+
+def history_next_bucket(bucket, resolution):
+    if resolution == HISTORY_HOUR:
+        return bucket + HISTORY_HOUR
+    return int((datetime.fromtimestamp(bucket) + timedelta(days=1)).timestamp())
+
+
+class StatusHistory:
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._queue = queue.Queue(maxsize=HISTORY_QUEUE_MAX)
+        self._local = threading.local()
+        self._series = {}
+        self._conn().executescript(HISTORY_SCHEMA)
+        threading.Thread(target=self._run, name='status-history', daemon=True).start()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # --- Escritura: solo encola; si la cola está llena se descarta ---
+
+    def _put(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc('rebootwebapp_history_dropped_total')
+
+    def record_status(self, hostname, host_status, ts):
+        observed = {svc: state.lower() for svc, state in host_status.items()
+                    if state.lower() not in HISTORY_SKIP_STATES}
+        if observed:
+            self._put(('status', hostname, observed, int(ts)))
+
+    def record_restart(self, hostname, service, outcome, time_to_running=None, op_id=None):
+        self._put(('restart', hostname, service, time.time(), outcome, time_to_running, op_id))
+
+    def record_duration(self, hostname, service, operation, seconds):
+        # service vacío: consultas de estado del servidor (el servicio más
+        # lento de cada consulta)
+        self._put(('duration', hostname, service, time.time(), operation, seconds))
+
+    def _run(self):
+        last_prune = 0
+        while True:
+            time.sleep(HISTORY_FLUSH_SECONDS)
+            batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    start = time.monotonic()
+                    self._flush(batch)
+                    metrics.observe('rebootwebapp_history_flush_seconds', time.monotonic() - start)
+                if time.time() - last_prune >= HISTORY_PRUNE_SECONDS:
+                    self._prune()
+                    last_prune = time.time()
+            except Exception as e:
+                metrics.inc('rebootwebapp_history_dropped_total', len(batch))
+                logger.error(f"Error escribiendo historial de estado: {e}")
+
+    def _flush(self, batch):
+        # Una transacción por lote; BEGIN IMMEDIATE serializa a las réplicas
+        # que comparten el archivo, y cada tramo se relee antes de extenderlo
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            trimmed = set()
+            for record in batch:
+                if record[0] == 'status':
+                    _, hostname, observed, ts = record
+                    for service, state in observed.items():
+                        self._observe(conn, self._series_id(conn, hostname, service), state, ts)
+                elif record[0] == 'restart':
+                    _, hostname, service, ts, outcome, time_to_running, op_id = record
+                    conn.execute(
+                        "INSERT INTO restarts (series_id, ts, outcome, time_to_running, op_id) VALUES (?, ?, ?, ?, ?)",
+                        (self._series_id(conn, hostname, service), ts, outcome, time_to_running, op_id)
+                    )
+                else:
+                    _, hostname, service, ts, operation, seconds = record
+                    series_id = self._series_id(conn, hostname, service)
+                    conn.execute(
+                        "INSERT INTO durations (series_id, operation, ts, seconds) VALUES (?, ?, ?, ?)",
+                        (series_id, operation, ts, seconds)
+                    )
+                    trimmed.add((series_id, operation))
+            # TimeoutAdvisor solo lee las últimas TIMEOUT_SAMPLES duraciones
+            # de cada serie: no se guardan más
+            for series_id, operation in trimmed:
+                conn.execute(
+                    "DELETE FROM durations WHERE series_id = ? AND operation = ? AND ts < ("
+                    "SELECT ts FROM durations WHERE series_id = ? AND operation = ? "
+                    "ORDER BY ts DESC LIMIT 1 OFFSET ?)",
+                    (series_id, operation, series_id, operation, TIMEOUT_SAMPLES - 1)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            self._series.clear()
+            raise
+
+    def _series_id(self, conn, hostname, service):
+        key = (hostname.lower(), service.lower())
+        series_id = self._series.get(key)
+        if series_id is None:
+            conn.execute("INSERT OR IGNORE INTO series (hostname, service) VALUES (?, ?)", key)
+            series_id = conn.execute(
+                "SELECT id FROM series WHERE hostname = ? AND service = ?", key
+            ).fetchone()[0]
+            self._series[key] = series_id
+        return series_id
+
+    def _observe(self, conn, series_id, state, ts):
+        # El tiempo entre dos observaciones se atribuye al estado anterior;
+        # un hueco mayor a HISTORY_GAP_SECONDS (aplicación caída) no se cuenta
+        row = conn.execute(
+            "SELECT start, end, state FROM segments WHERE series_id = ? ORDER BY start DESC LIMIT 1",
+            (series_id,)
+        ).fetchone()
+        if row is not None:
+            start, end, last_state = row
+            if ts <= end:
+                return
+            if ts - end <= HISTORY_GAP_SECONDS:
+                conn.execute("UPDATE segments SET end = ? WHERE series_id = ? AND start = ?", (ts, series_id, start))
+                self._cover(conn, series_id, end, ts, last_state)
+                if state == last_state:
+                    return
+            if state != last_state:
+                for resolution in (HISTORY_HOUR, HISTORY_DAY):
+                    self._add(conn, series_id, resolution, history_bucket(ts, resolution), 0, 0, 1)
+        conn.execute("INSERT INTO segments (series_id, start, end, state) VALUES (?, ?, ?, ?)",
+                     (series_id, ts, ts, state))
+
+    def _cover(self, conn, series_id, since, until, state):
+        running = state in RUNNING_STATES
+        for resolution in (HISTORY_HOUR, HISTORY_DAY):
+            t = since
+            while t < until:
+                bucket = history_bucket(t, resolution)
+                limit = min(until, history_next_bucket(bucket, resolution))
+                self._add(conn, series_id, resolution, bucket, limit - t, limit - t if running else 0, 0)
+                t = limit
+
+    @staticmethod
+    def _add(conn, series_id, resolution, bucket, observed, running, transitions):
+        conn.execute(
+            "INSERT INTO rollups (series_id, resolution, bucket, observed, running, transitions) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (series_id, resolution, bucket) DO UPDATE SET observed = observed + excluded.observed, "
+            "running = running + excluded.running, transitions = transitions + excluded.transitions",
+            (series_id, resolution, bucket, observed, running, transitions)
+        )
+
+    def _prune(self):
+        now = int(time.time())
+        conn = self._conn()
+        conn.execute("DELETE FROM segments WHERE end < ?", (now - HISTORY_RAW_RETENTION_DAYS * HISTORY_DAY,))
+        conn.execute("DELETE FROM rollups WHERE resolution = ? AND bucket < ?",
+                     (HISTORY_HOUR, now - HISTORY_HOURLY_RETENTION_DAYS * HISTORY_DAY))
+        conn.execute("DELETE FROM rollups WHERE resolution = ? AND bucket < ?",
+                     (HISTORY_DAY, now - HISTORY_DAILY_RETENTION_DAYS * HISTORY_DAY))
+        conn.execute("DELETE FROM restarts WHERE ts < ?", (now - HISTORY_DAILY_RETENTION_DAYS * HISTORY_DAY,))
+        conn.execute("DELETE FROM durations WHERE ts < ?", (now - HISTORY_RAW_RETENTION_DAYS * HISTORY_DAY,))
+
+    # --- Consultas ---
+
+    def _lookup_series(self, host_services):
+        # {series_id: (hostname, service)} para los pares pedidos que tengan historial
+        wanted = {(hostname.lower(), svc.lower()): (hostname, svc)
+                  for hostname, services in host_services.items() for svc in services}
+        hostnames = list(host_services)
+        found = {}
+        for start in range(0, len(hostnames), 500):
+            chunk = hostnames[start:start + 500]
+            rows = self._conn().execute(
+                f"SELECT id, hostname, service FROM series WHERE hostname IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            for series_id, hostname, svc in rows:
+                key = wanted.get((hostname.lower(), svc.lower()))
+                if key:
+                    found[series_id] = key
+        return found
+
+    def _select(self, sql, series_ids, params):
+        ids = list(series_ids)
+        rows = []
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows += self._conn().execute(
+                sql.format(ids=', '.join('?' * len(chunk))), chunk + list(params)
+            ).fetchall()
+        return rows
+
+    def availability(self, host_services, since, until):
+        # Por (host, servicio): disponibilidad y cambios de estado en el
+        # período, más la serie por hora (períodos de hasta 2 días) o por día
+        # para el gráfico
+        series = self._lookup_series(host_services)
+        resolution = HISTORY_HOUR if until - since <= 2 * HISTORY_DAY else HISTORY_DAY
+        rows = self._select(
+            "SELECT series_id, bucket, observed, running, transitions FROM rollups "
+            "WHERE series_id IN ({ids}) AND resolution = ? AND bucket >= ? AND bucket < ? ORDER BY series_id, bucket",
+            series, (resolution, history_bucket(int(since), resolution), int(until))
+        )
+        result = {}
+        for series_id, bucket, observed, running, transitions in rows:
+            entry = result.setdefault(series[series_id], {'observed': 0, 'running': 0, 'transitions': 0, 'points': []})
+            entry['observed'] += observed
+            entry['running'] += running
+            entry['transitions'] += transitions
+            if observed:
+                entry['points'].append((bucket, round(100 * running / observed, 1)))
+        for entry in result.values():
+            entry['availability'] = round(100 * entry['running'] / entry['observed'], 2) if entry['observed'] else None
+        return result
+
+    def restarts(self, host_services, since, until):
+        series = self._lookup_series(host_services)
+        rows = self._select(
+            "SELECT series_id, ts, outcome, time_to_running, op_id FROM restarts "
+            "WHERE series_id IN ({ids}) AND ts >= ? AND ts < ? ORDER BY ts DESC",
+            series, (since, until)
+        )
+        return [{'hostname': series[series_id][0], 'service': series[series_id][1], 'ts': ts,
+                 'outcome': outcome, 'time_to_running': time_to_running, 'op_id': op_id}
+                for series_id, ts, outcome, time_to_running, op_id in rows]
+
+    def segments(self, hostname, service, since, until):
+        series = self._lookup_series({hostname: [service]})
+        rows = self._select(
+            "SELECT start, end, state FROM segments WHERE series_id IN ({ids}) AND end >= ? AND start < ? ORDER BY start",
+            series, (int(since), int(until))
+        )
+        return [{'start': start, 'end': end, 'state': state} for start, end, state in rows]
+
+    def durations(self, hostname, service, operation, limit):
+        # Las últimas `limit` duraciones, de la más vieja a la más nueva
+        rows = self._conn().execute(
+            "SELECT d.seconds FROM durations d JOIN series s ON s.id = d.series_id "
+            "WHERE s.hostname = ? AND s.service = ? AND d.operation = ? ORDER BY d.ts DESC LIMIT ?",
+            (hostname, service, operation, limit)
+        ).fetchall()
+        return [seconds for seconds, in reversed(rows)]
+
+
+# --- Timeouts adaptativos ---
+# El timeout de cada consulta de estado (por servidor, aplicado a cada
+# servicio consultado) y de cada reinicio (por servicio) sale de lo que
+# tardaron las últimas TIMEOUT_SAMPLES ejecuciones
+# completas: percentil TIMEOUT_PERCENTILE por TIMEOUT_FACTOR, entre un piso y
+# un techo por operación. Con menos de TIMEOUT_MIN_SAMPLES muestras se usa el
+# valor fijo del playbook. Cada timeout seguido duplica el valor (hasta el
+# techo) para que un servidor que se volvió más lento no quede fallando; la
+# siguiente ejecución completa vuelve al cálculo normal. timeout_segundos en
+# la configuración del servicio reemplaza el cálculo.
+# limits(operation) devuelve (sin historial, piso, techo) en segundos.
+class TimeoutAdvisor:
+
+    def __init__(self, limits, history=None):
+        self.limits = limits
+        self.history = history
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._misses = {}
+
+    def _window(self, key):
+        # Las muestras de cada serie se cargan del historial la primera vez
+        with self._lock:
+            window = self._samples.get(key)
+        if window is None:
+            loaded = []
+            if self.history is not None:
+                operation, hostname, service = key
+                try:
+                    loaded = self.history.durations(hostname, service, operation, TIMEOUT_SAMPLES)
+                except Exception as e:
+                    logger.error(f"Error leyendo duraciones de {hostname} {service}: {e}")
+            with self._lock:
+                window = self._samples.setdefault(key, deque(loaded, maxlen=TIMEOUT_SAMPLES))
+        return window
+
+    def record(self, operation, hostname, seconds, service=''):
+        key = (operation, hostname.lower(), service.lower())
+        window = self._window(key)
+        with self._lock:
+            window.append(seconds)
+            self._misses.pop(key, None)
+        if self.history is not None:
+            self.history.record_duration(hostname, service, operation, round(seconds, 2))
+
+    def record_timeout(self, operation, hostname, service=''):
+        key = (operation, hostname.lower(), service.lower())
+        with self._lock:
+            self._misses[key] = self._misses.get(key, 0) + 1
+
+    def timeout(self, operation, hostname, service='', override=None):
+        if override:
+            return float(override)
+        default, floor, ceiling = self.limits(operation)
+        key = (operation, hostname.lower(), service.lower())
+        window = self._window(key)
+        with self._lock:
+            samples = sorted(window)
+            misses = self._misses.get(key, 0)
+        value = default
+        if len(samples) >= TIMEOUT_MIN_SAMPLES:
+            index = min(len(samples) - 1, math.ceil(TIMEOUT_PERCENTILE * len(samples)) - 1)
+            value = samples[index] * TIMEOUT_FACTOR
+        value = min(max(value, floor), ceiling)
+        if misses:
+            value = min(value * 2 ** misses, ceiling)
+        return round(value, 1)
@@ -0,0 +1,151 @@
+# /opt/rebootwebapp/telemetry.py
+# Métricas de RebootWebApp en formato Prometheus
+#
+# Contadores, gauges e histogramas en memoria, compartidos por todo el proceso
+# (UI, trabajos de reinicio, sondeo y API), expuestos en
+# http://<host>:<puerto>/metrics.
+#
+# Vive fuera de app.py para que haya una sola instancia de Metrics por
+# proceso: los reruns de Streamlit reutilizan este módulo.
+
+import bisect
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('rebootwebapp.telemetry')
+
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+METRICS_HELP = {
+    'rebootwebapp_ansible_duration_seconds': ('histogram', "Duración de cada ejecución de ansible-playbook"),
+    'rebootwebapp_ansible_inflight': ('gauge', "Ejecuciones de ansible-playbook en curso"),
+    'rebootwebapp_host_duration_seconds': ('histogram', "Tiempo hasta el resultado de cada host, por operación"),
+    'rebootwebapp_host_errors_total': ('counter', "Errores por host, operación y tipo (timeout, unreachable, failed, error)"),
+    'rebootwebapp_restarts_inflight': ('gauge', "Servidores con un reinicio en curso"),
+    'rebootwebapp_restart_jobs_inflight': ('gauge', "Trabajos de reinicio en ejecución"),
+    'rebootwebapp_restart_jobs_total': ('counter', "Trabajos de reinicio finalizados, por modo y resultado"),
+    'rebootwebapp_time_to_running_seconds': ('histogram', "Tiempo desde el reinicio hasta ver el servicio en Running"),
+    'rebootwebapp_hosts_unreachable': ('gauge', "Servidores marcados como inalcanzables (circuito abierto)"),
+    'rebootwebapp_breaker_probes_total': ('counter', "Sondeos de puerto WinRM a servidores inalcanzables, por resultado"),
+    'rebootwebapp_history_flush_seconds': ('histogram', "Duración de cada escritura por lotes del historial de estado"),
+    'rebootwebapp_history_dropped_total': ('counter', "Observaciones de estado descartadas por el historial (cola llena o error)"),
+    'rebootwebapp_timeout_seconds': ('histogram', "Timeout aplicado a cada ejecución de Ansible, por operación"),
+    'rebootwebapp_render_seconds': ('histogram', "Duración de cada render de la UI, por sección")
+}
+
+
+class Metrics:
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def inc(self, name, value=1, **labels):
+        # También para gauges, con valores negativos
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                # Conteo por bucket (no acumulado), suma y total
+                hist = series[key] = [0] * len(self.buckets) + [0.0, 0]
+            idx = bisect.bisect_left(self.buckets, value)
+            if idx < len(self.buckets):
+                hist[idx] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    @contextmanager
+    def inflight(self, name, **labels):
+        self.inc(name, 1, **labels)
+        try:
+            yield
+        finally:
+            self.inc(name, -1, **labels)
+
+    def timed(self, name, **labels):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.monotonic()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.monotonic() - start, **labels)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ''
+        escaped = []
+        for k, v in pairs:
+            v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            escaped.append(f'{k}="{v}"')
+        return '{' + ','.join(escaped) + '}'
+
+    def render(self):
+        with self._lock:
+            snapshot = {name: {key: list(v) if isinstance(v, list) else v for key, v in series.items()}
+                        for name, series in self._series.items()}
+        lines = []
+        for name in sorted(snapshot):
+            kind, help_text = METRICS_HELP.get(name, ('untyped', name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(snapshot[name].items()):
+                if kind != 'histogram':
+                    lines.append(f"{name}{self._labels(key)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{self._labels(key, [('le', '+Inf')])} {value[-1]}")
+                lines.append(f"{name}_sum{self._labels(key)} {round(value[-2], 6)}")
+                lines.append(f"{name}_count{self._labels(key)} {value[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(host, port):
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.warning(f"No se pudo iniciar el endpoint de métricas en {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"Métricas disponibles en http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,200 @@
+# /opt/rebootwebapp/winrm_status.py
+# Backend de estado WinRM (opcional) de RebootWebApp
+#
+# Mantiene una conexión autenticada (Protocol + shell) por host y la reutiliza
+# entre refrescos. Una sola llamada a Get-Service por host para todos sus
+# servicios. pywinrm se importa recién al conectar: sin él solo falla este
+# backend.
+#
+# Vive fuera de app.py para que el pool (y sus conexiones) sea el mismo en
+# todos los reruns de Streamlit.
+
+import base64
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import yaml
+
+from telemetry import metrics
+
+logger = logging.getLogger('rebootwebapp.winrm')
+
+WINRM_WORKERS = 16
+WINRM_READ_TIMEOUT = 60
+
+
+# Las credenciales se leen de los group_vars de Ansible, que pueden estar
+# cifrados con Ansible Vault (archivo completo o valores !vault). Para
+# descifrarlos hace falta ansible instalado y winrm.vault_password_file (o
+# ANSIBLE_VAULT_PASSWORD_FILE); si no, falla al crear el backend en lugar de
+# dejar todos los servidores en error.
+class VaultValue(str):
+    pass
+
+
+class GroupVarsLoader(yaml.SafeLoader):
+    pass
+
+
+GroupVarsLoader.add_constructor('!vault', lambda loader, node: VaultValue(loader.construct_scalar(node)))
+
+
+def vault_decrypt(ciphertext, path, vault_password_file):
+    password_file = vault_password_file or os.environ.get('ANSIBLE_VAULT_PASSWORD_FILE')
+    if not password_file:
+        raise ValueError(f"{path} está cifrado con Ansible Vault; indicar winrm.vault_password_file")
+    try:
+        from ansible.parsing.vault import VaultLib, VaultSecret
+    except ImportError:
+        raise ValueError(f"{path} está cifrado con Ansible Vault y ansible no está instalado en el entorno de la aplicación")
+    secret = VaultSecret(Path(password_file).read_bytes().strip())
+    return VaultLib([('default', secret)]).decrypt(ciphertext.strip()).decode('utf-8')
+
+
+def load_winrm_credentials(path, vault_password_file=None):
+    with open(path, 'r') as f:
+        text = f.read()
+    if text.startswith('$ANSIBLE_VAULT;'):
+        text = vault_decrypt(text, path, vault_password_file)
+    group_vars = yaml.load(text, Loader=GroupVarsLoader) or {}
+    credentials = []
+    for key in ('ansible_user', 'ansible_password'):
+        value = group_vars.get(key)
+        if not value:
+            raise ValueError(f"{path}: falta '{key}'")
+        if isinstance(value, VaultValue):
+            value = vault_decrypt(value, path, vault_password_file)
+        credentials.append(value)
+    return tuple(credentials)
+
+
+def build_get_service_script(services):
+    names = ','.join("'" + svc.replace("'", "''") + "'" for svc in services)
+    return (
+        "$ErrorActionPreference = 'SilentlyContinue'\n"
+        f"Get-Service -Name {names} | ForEach-Object {{ \"$($_.Name)|$($_.Status)\" }}"
+    )
+
+
+def parse_get_service_output(output, services):
+    # Get-Service devuelve Running/StartPending/...; se normaliza al formato
+    # de win_service_info (running/start_pending/...)
+    by_lower = {svc.lower(): svc for svc in services}
+    status = {}
+    for line in output.splitlines():
+        if '|' not in line:
+            continue
+        name, state = line.strip().split('|', 1)
+        svc = by_lower.get(name.lower())
+        if svc:
+            status[svc] = re.sub(r'(?<!^)(?=[A-Z])', '_', state).lower()
+    for svc in services:
+        status.setdefault(svc, 'unknown')
+    return status
+
+
+class WinRMStatusPool:
+
+    def __init__(self, endpoint, transport, credentials_path, validate_cert=True, vault_password_file=None,
+                 read_timeout=WINRM_READ_TIMEOUT):
+        self.endpoint = endpoint
+        self.transport = transport
+        self.credentials_path = credentials_path
+        self.validate_cert = validate_cert
+        self.vault_password_file = vault_password_file
+        self.read_timeout = read_timeout
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._host_locks = {}
+        # Se leen al crear el backend para que un error de credenciales se vea
+        # de inmediato; se releen si el archivo cambia
+        self._credentials_mtime = os.path.getmtime(credentials_path)
+        self._credentials = load_winrm_credentials(credentials_path, vault_password_file)
+
+    def _get_credentials(self):
+        mtime = os.path.getmtime(self.credentials_path)
+        with self._lock:
+            if mtime != self._credentials_mtime:
+                self._credentials = load_winrm_credentials(self.credentials_path, self.vault_password_file)
+                self._credentials_mtime = mtime
+            return self._credentials
+
+    def _connect(self, hostname):
+        import winrm
+        username, password = self._get_credentials()
+        protocol = winrm.Protocol(
+            endpoint=self.endpoint.format(hostname=hostname),
+            transport=self.transport,
+            username=username,
+            password=password,
+            server_cert_validation='validate' if self.validate_cert else 'ignore',
+            read_timeout_sec=self.read_timeout,
+            operation_timeout_sec=self.read_timeout - 10
+        )
+        return protocol, protocol.open_shell()
+
+    def _drop(self, hostname):
+        connection = self._connections.pop(hostname, None)
+        if connection:
+            protocol, shell_id = connection
+            try:
+                protocol.close_shell(shell_id)
+            except Exception:
+                pass
+
+    def _run_ps(self, hostname, script):
+        if hostname not in self._connections:
+            self._connections[hostname] = self._connect(hostname)
+        protocol, shell_id = self._connections[hostname]
+        encoded = base64.b64encode(script.encode('utf_16_le')).decode('ascii')
+        command_id = protocol.run_command(
+            shell_id, 'powershell', ['-NoProfile', '-NonInteractive', '-EncodedCommand', encoded]
+        )
+        try:
+            stdout, stderr, rc = protocol.get_command_output(shell_id, command_id)
+        finally:
+            protocol.cleanup_command(shell_id, command_id)
+        return stdout.decode('utf-8', errors='replace')
+
+    def get_host_status(self, hostname, services):
+        with self._lock:
+            host_lock = self._host_locks.setdefault(hostname, threading.Lock())
+        script = build_get_service_script(services)
+        start = time.monotonic()
+        state = 'error'
+        with host_lock:
+            # Un reintento con conexión nueva por si el shell expiró en el servidor
+            for attempt in range(2):
+                try:
+                    status = parse_get_service_output(self._run_ps(hostname, script), services)
+                    metrics.observe('rebootwebapp_host_duration_seconds', time.monotonic() - start,
+                                    host=hostname, operation='status')
+                    return status
+                except Exception as e:
+                    import requests
+                    self._drop(hostname)
+                    if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+                        state = 'unreachable'
+                    if attempt:
+                        logger.error(f"Error consultando estado de {hostname} vía WinRM: {e}")
+        metrics.inc('rebootwebapp_host_errors_total', host=hostname, operation='status', kind=state)
+        return {svc: state for svc in services}
+
+    def get_status(self, host_services, on_host=None):
+        status = {}
+        with ThreadPoolExecutor(max_workers=min(len(host_services), WINRM_WORKERS)) as executor:
+            futures = {
+                executor.submit(self.get_host_status, hostname, services): hostname
+                for hostname, services in host_services.items()
+            }
+            for future in as_completed(futures):
+                hostname = futures[future]
+                status[hostname] = future.result()
+                if on_host:
+                    on_host(hostname, status[hostname])
+        return status